@@ -1,6 +1,6 @@
 from pathlib import Path
-import pandas as pd
 import re
+from profiling import timer, count_file
 
 ROOT = Path(__file__).resolve().parents[1] #ppn_nova/
 
@@ -47,6 +47,8 @@ def read_initial_abundances(fname=None):
             isotopes.append(f"{el.capitalize()}-{A}")
             X.append(xi)
 
+    import pandas as pd     # only when a table is actually read
+
     df = pd.DataFrame({"isotope": isotopes, "X": X})
     return df.sort_values("X", ascending=False)
 
@@ -57,5 +59,9 @@ def read_final_abundances(run_arg):
     if not csv.exists():
         raise FileNotFoundError(csv)
 
-    df = pd.read_csv(csv)
+    import pandas as pd
+
+    count_file(csv)
+    with timer("read_final_abundances"):
+        df = pd.read_csv(csv)
     return df.sort_values("X", ascending=False), run_dir
@@ -0,0 +1,160 @@
+import matplotlib
+matplotlib.use("Agg")   # before any pyplot import: batch mode never opens a window
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+import compare_runs
+import plot_abundance_ratios
+import plot_final
+import plot_initial
+import plot_top_ratios
+import time_evo_plot
+from abundance_io import normalize_run_path, ROOT
+from iso_massf_io import load_abundance_store
+from run_io import list_snapshots, source_manifest, map_chunks
+import profiling
+
+# Renders the standard plot set for every run under runs/ without a GUI.
+# A plot is redrawn only when the hash of its inputs (file contents plus
+# plot options) differs from the one recorded at its last render, kept in
+# <run>/plots/.render_state.json.
+
+RENDER_STATE = ".render_state.json"
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _store_digest(run_dir):
+    # the iso_massf listing (names, sizes, mtimes) stands in for the files
+    # themselves, the same test load_abundance_store uses
+    snapshots = list_snapshots(run_dir, "iso_massf")
+    if snapshots:
+        return hashlib.sha1(json.dumps(source_manifest(snapshots)).encode()).hexdigest()
+    manifest = run_dir / "abundance_store" / "manifest.json"
+    return _file_digest(manifest if manifest.exists() else run_dir / "summary.csv")
+
+def plot_jobs(run_dir, opts):
+    # -> [(key, [input digest thunks], render thunk)] for one run
+    final = run_dir / "final_abundances.csv"
+    initial = ROOT / "initial_abundance.dat"
+    top, logtol = opts["top"], opts["logtol"]
+
+    jobs = [
+        (f"final_top{top}", [lambda: _file_digest(final)],
+         lambda: plot_final.render(run_dir, top)),
+        (f"initial_top{top}", [lambda: _file_digest(initial)],
+         lambda: plot_initial.render(run_dir, top)),
+        (f"abundance_ratios_top{top}", [lambda: _file_digest(initial), lambda: _file_digest(final)],
+         lambda: plot_abundance_ratios.render(run_dir, top)),
+        (f"synthesis_ratios_top{top}_{logtol:g}",
+         [lambda: _file_digest(initial), lambda: _file_digest(final)],
+         lambda: plot_top_ratios.render(run_dir, top, logtol=logtol)),
+    ]
+
+    baseline = opts["baseline"]
+    if baseline and run_dir.name != baseline.name:
+        ref = baseline / "final_abundances.csv"
+        jobs.append((f"compare_{baseline.name}_top{opts['compare_top']}_{logtol:g}",
+                     [lambda: _file_digest(ref), lambda: _file_digest(final)],
+                     lambda: compare_runs.render(baseline, run_dir, opts["compare_top"], logtol)))
+
+    if opts["iso"]:
+        store = {}
+        def evo(iso):
+            # one abundance store load serves every isotope of the run
+            if "s" not in store:
+                store["s"] = load_abundance_store(run_dir)
+            return time_evo_plot.render(run_dir, iso, opts["logy"], store=store["s"])
+        for iso in opts["iso"]:
+            jobs.append((f"{iso}_time_evolution_{opts['logy']}",
+                         [lambda: _store_digest(run_dir)],
+                         lambda iso=iso: evo(iso)))
+    return jobs
+
+def render_run(run_dir, opts):
+    # -> [(plot key, status, message)]; status is rendered/skipped/failed
+    state_file = run_dir / "plots" / RENDER_STATE
+    state = {}
+    if state_file.exists() and not opts["force"]:
+        state = json.loads(state_file.read_text())
+
+    results = []
+    for key, inputs, render in plot_jobs(run_dir, opts):
+        try:
+            h = hashlib.sha1(key.encode())
+            for digest in inputs:
+                h.update(digest().encode())
+            h = h.hexdigest()
+
+            old = state.get(key)
+            if old and old[0] == h and (old[1] is None or (run_dir / "plots" / old[1]).exists()):
+                results.append((key, "skipped", ""))
+                continue
+
+            outfile = render()
+            state[key] = [h, None if outfile is None else Path(outfile).name]
+            results.append((key, "rendered", ""))
+        except Exception as e:
+            state.pop(key, None)
+            results.append((key, "failed", f"{type(e).__name__}: {e}"))
+
+    state_file.parent.mkdir(exist_ok=True)
+    tmp = state_file.with_name(RENDER_STATE + ".tmp")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True))
+    os.replace(tmp, state_file)
+    return results
+
+def _render_chunk(tasks):
+    return [(run_dir.name, render_run(run_dir, opts)) for run_dir, opts in tasks]
+
+def find_runs(runs_dir):
+    with os.scandir(runs_dir) as it:
+        return sorted(Path(e.path) for e in it
+                      if e.is_dir() and os.path.exists(os.path.join(e.path, "final_abundances.csv")))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs-dir", default="runs")
+    ap.add_argument("--baseline", default="baseline",
+                    help="run every other run is compared against ('' to skip)")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--compare-top", type=int, default=20)
+    ap.add_argument("--logtol", type=float, default=0.1)
+    ap.add_argument("--iso", nargs="*", default=[],
+                    help="also plot the time evolution of these isotopes, e.g. NA-22 AL-26")
+    ap.add_argument("--logy", action="store_true", help="log y-axis for --iso plots")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count())
+    ap.add_argument("--force", action="store_true", help="re-render even if inputs are unchanged")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    runs_dir = normalize_run_path(args.runs_dir)
+    baseline = runs_dir / args.baseline if args.baseline else None
+    if baseline and not (baseline / "final_abundances.csv").exists():
+        print(f"[WARN] No {baseline}/final_abundances.csv, skipping comparisons")
+        baseline = None
+
+    opts = {"top": args.top, "compare_top": args.compare_top, "logtol": args.logtol,
+            "iso": args.iso, "logy": args.logy, "baseline": baseline, "force": args.force}
+    runs = find_runs(runs_dir)
+
+    t0 = time.time()
+    counts = {"rendered": 0, "skipped": 0, "failed": 0}
+    for part in map_chunks(_render_chunk, [(r, opts) for r in runs], args.jobs):
+        for name, results in part:
+            for key, status, msg in results:
+                counts[status] += 1
+                if status == "failed":
+                    print(f"[FAIL] {name}/{key}: {msg}")
+
+    print(f"[OK] {len(runs)} runs in {time.time() - t0:.1f} s: {counts['rendered']} rendered, "
+          f"{counts['skipped']} unchanged, {counts['failed']} failed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from datetime import datetime, timezone
+from pathlib import Path
+from iso_massf_io import extract_run
+from run_io import list_snapshots
+from run_catalog import CATALOG_NAME
+from synth_ppn import make_sweep
+
+# Benchmarks the analysis entry points on synthetic PPN output (synth_ppn)
+# at several scales. Every stage runs the real script in a fresh process,
+# so the timings include start-up and imports, and the peak RSS is that
+# process's own (from wait4). Results go to a JSON file that --compare
+# reads back to show the change between two versions.
+
+HERE = Path(__file__).resolve().parent
+
+SCALES = {
+    "small":  {"isotopes": 60,  "reactions": 300,  "snapshots": 20,  "swept": 1},
+    "medium": {"isotopes": 200, "reactions": 2000, "snapshots": 100, "swept": 2},
+    "large":  {"isotopes": 500, "reactions": 5000, "snapshots": 200, "swept": 3},
+}
+
+def measure(cmd):
+    # -> (seconds, peak RSS in MB) of one child process
+    env = dict(os.environ, MPLBACKEND="Agg")
+    with tempfile.TemporaryFile() as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=err, env=env)
+        _, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - t0
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            err.seek(0)
+            raise RuntimeError(f"{' '.join(map(str, cmd))} failed:\n{err.read().decode()}")
+    return seconds, usage.ru_maxrss / 1024.0    # ru_maxrss is in KiB on Linux
+
+def _size(paths):
+    return sum(p.stat().st_size for p in paths)
+
+def stages(runs_dir, swept, jobs):
+    # -> [(stage, command, items, item unit, bytes read, setup)]
+    py = sys.executable
+    base = runs_dir / "baseline"
+    iso = [p for _, p, _ in list_snapshots(base, "iso_massf")]
+    flux = [p for _, p, _ in list_snapshots(base, "flux")]
+    run_dirs = [runs_dir / "baseline"] + sorted(runs_dir.glob(f"{swept[0]}_fact_*"))
+
+    # the slope fit reads final_abundances.csv of every run (not timed);
+    # each repeat starts from an empty catalog
+    for run_dir in run_dirs:
+        extract_run(run_dir, final_only=True, verbose=False)
+
+    def clear_catalog():
+        (runs_dir / CATALOG_NAME).unlink(missing_ok=True)
+
+    return [
+        ("ingest", [py, HERE / "iso_massf_io.py", "--run", base, "--jobs", str(jobs)],
+         len(iso), "files", _size(iso), None),
+        ("integrate_cold", [py, HERE / "flux_integrate_run.py", "--run", base,
+                            "--rebuild-cache", "--jobs", str(jobs)],
+         len(flux), "files", _size(flux), None),
+        ("integrate_warm", [py, HERE / "flux_integrate_run.py", "--run", base],
+         len(flux), "files", 0, None),
+        ("compare_snapshot", [py, HERE / "compare_flux_snapshot.py",
+                              "--fileA", flux[len(flux) // 2], "--fileB", flux[-1]],
+         2, "files", _size([flux[len(flux) // 2], flux[-1]]), None),
+        ("slopes", [py, HERE / "plot_multi_iso_sens_slopes.py", "--pattern", swept[0],
+                    "--runs-dir", runs_dir, "--baseline", base],
+         len(run_dirs), "runs", _size([r / "final_abundances.csv" for r in run_dirs]),
+         clear_catalog),
+    ]
+
+def bench_scale(name, params, workdir, repeat, jobs):
+    runs_dir = workdir / name / "runs"
+    if runs_dir.exists():
+        shutil.rmtree(runs_dir)
+    t0 = time.perf_counter()
+    swept = make_sweep(runs_dir, params["isotopes"], params["reactions"], params["snapshots"],
+                       params["swept"], sweep_flux=False)
+    print(f"[OK] {name}: generated {runs_dir} in {time.perf_counter() - t0:.1f} s")
+
+    results = []
+    for stage, cmd, items, unit, nbytes, setup in stages(runs_dir, swept, jobs):
+        times, peaks = [], []
+        for _ in range(repeat):
+            if setup:
+                setup()
+            seconds, peak = measure([str(c) for c in cmd])
+            times.append(seconds)
+            peaks.append(peak)
+        best = min(times)
+        results.append({
+            "scale": name, "params": params, "stage": stage, "jobs": jobs,
+            "seconds": best, "seconds_all": times,
+            "items": items, "item_unit": unit,
+            "items_per_s": items / best,
+            "bytes": nbytes, "mb_per_s": nbytes / best / 1e6,
+            "peak_rss_mb": max(peaks),
+        })
+        print(f"  {stage:>18s} {best:8.3f} s  {items / best:10.1f} {unit}/s  "
+              f"{nbytes / best / 1e6:8.1f} MB/s  {max(peaks):8.1f} MB peak")
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_file, new):
+    old = json.loads(Path(old_file).read_text())
+    before = {(r["scale"], r["stage"]): r for r in old["results"]}
+    print(f"\n=== {new['label']} vs {old['label']} ===")
+    print(f"{'scale':>8s} {'stage':>18s} {'old s':>9s} {'new s':>9s} {'speedup':>8s} "
+          f"{'old MB':>8s} {'new MB':>8s}")
+    for r in new["results"]:
+        o = before.get((r["scale"], r["stage"]))
+        if o is None:
+            continue
+        print(f"{r['scale']:>8s} {r['stage']:>18s} {o['seconds']:9.3f} {r['seconds']:9.3f} "
+              f"{o['seconds'] / r['seconds']:8.2f} {o['peak_rss_mb']:8.1f} {r['peak_rss_mb']:8.1f}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    ap.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest counts")
+    ap.add_argument("--jobs", type=int, default=1, help="passed to the scripts that take --jobs")
+    ap.add_argument("--workdir", default=None, help="where to generate (default: a temp dir)")
+    ap.add_argument("--keep", action="store_true", help="keep the generated runs")
+    ap.add_argument("--label", default=None, help="name for this result set (default: git revision)")
+    ap.add_argument("--out", default=None, help="results JSON (default bench_<label>.json)")
+    ap.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    args = ap.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="ppn_bench_"))
+    label = args.label or git_revision() or datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    results = []
+    try:
+        for name in args.scales:
+            results += bench_scale(name, SCALES[name], workdir, args.repeat, args.jobs)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "label": label,
+        "git": git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    out = Path(args.out or f"bench_{label}.json")
+    out.write_text(json.dumps(report, indent=1))
+    print(f"[OK] Wrote {out}")
+
+    if args.compare:
+        compare(args.compare, report)
+
+if __name__ == "__main__":
+    main()
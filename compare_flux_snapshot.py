@@ -1,86 +1,190 @@
 import argparse
 import numpy as np
-import pandas as pd
 from pathlib import Path
-
-elements = {
-    1:"H", 2:"He", 3:"Li", 4:"Be", 5:"B", 6:"C",
-    7:"N", 8:"O", 9:"F", 10:"Ne", 11:"Na", 12:"Mg",
-    13:"Al", 14:"Si", 15:"P", 16:"S", 17:"Cl", 18:"Ar",
-    19:"K", 20:"Ca"
-}
-
-def ZA_to_label(Z, A):
-    if Z == 0:
-        return None
-    return f"{elements.get(Z, f'Z{Z}')}-{A}"
-
-def parse_flux(path):
-    data = np.loadtxt(path)
-    rows = []
-
-    for row in data:
-        Z1,A1,Z3,A3,Z5,A5,Z7,A7 = map(int, row[1:9])
-        flux = float(row[9])
-
-        reactants = [ZA_to_label(Z1,A1), ZA_to_label(Z3,A3)]
-        products  = [ZA_to_label(Z5,A5), ZA_to_label(Z7,A7)]
-
-        reactants = [x for x in reactants if x]
-        products  = [x for x in products if x]
-
-        rxn = " + ".join(reactants) + " -> " + " + ".join(products)
-
-        rows.append({
-            "reaction": rxn,
-            "flux": flux,
-            "abs_flux": abs(flux),
-            "reactants": reactants,
-            "products": products
-        })
-
-    return pd.DataFrame(rows)
+from flux_io import (read_flux_file, sum_by_key, unpack_keys, involves,
+                     reaction_names, text_table, REACTANT_SLOTS, PRODUCT_SLOTS)
+from flux_cache import load_flux_cube, snapshot_times, trapezoid_weights
+import profiling
+
+def change_table(keys, delta_log10):
+    # names are only built for the rows that get printed
+    return text_table({
+        "delta_log10": [f"{v:.6f}" for v in delta_log10],
+        "reaction": list(reaction_names(*unpack_keys(keys))),
+    })
+
+def run_times(cube, time_table, jobs):
+    times = snapshot_times(cube, time_table, jobs=jobs)
+    ok = ~np.isnan(times)
+    if ok.sum() < 2:
+        raise RuntimeError(f"Fewer than two flux files with a time in {cube.run_dir}; "
+                           f"pass a cycle,time CSV")
+    # time order, one row per distinct time
+    t, first = np.unique(times[ok], return_index=True)
+    return t, np.flatnonzero(ok)[first]
+
+def interp_rows(t, L, grid):
+    # np.interp of every column of L at once; t ascending, grid inside [t0, t_end]
+    i = np.clip(np.searchsorted(t, grid, side="right") - 1, 0, len(t) - 2)
+    w = ((grid - t[i]) / (t[i + 1] - t[i]))[:, None]
+    return L[i] * (1.0 - w) + L[i + 1] * w
+
+def align_runs(cubeA, timesA, cubeB, timesB, min_flux):
+    # -> (keys, grid, LA, LB, log_time): log10 |F| ([n_times x n_reactions], floored at
+    # min_flux) of the reactions in both runs, interpolated onto every
+    # snapshot time of either run inside the time both runs cover. PPN
+    # snapshots are roughly log-spaced in time, so the interpolation is
+    # linear in log t (log_time) unless a time is <= 0
+    (tA, rowsA), (tB, rowsB) = timesA, timesB
+    keys, iA, iB = np.intersect1d(cubeA.keys, cubeB.keys, assume_unique=True,
+                                  return_indices=True)
+    lo, hi = max(tA[0], tB[0]), min(tA[-1], tB[-1])
+    if lo >= hi:
+        raise RuntimeError(f"The runs do not overlap in time "
+                           f"([{tA[0]:g}, {tA[-1]:g}] vs [{tB[0]:g}, {tB[-1]:g}])")
+    grid = np.union1d(tA, tB)
+    grid = grid[(grid >= lo) & (grid <= hi)]
+
+    floor = np.log10(min_flux)
+    def log_flux(cube, rows, cols):
+        with np.errstate(divide="ignore"):
+            return np.maximum(np.log10(np.abs(np.asarray(cube.flux)[np.ix_(rows, cols)])), floor)
+    log_time = min(tA[0], tB[0]) > 0
+    x = np.log10 if log_time else (lambda t: t)
+    LA = interp_rows(x(tA), log_flux(cubeA, rowsA, iA), x(grid))
+    LB = interp_rows(x(tB), log_flux(cubeB, rowsB, iB), x(grid))
+    return keys, grid, LA, LB, log_time
+
+def divergence(grid, LA, LB, threshold, log_time=False):
+    # per reaction: signed delta log10 at its largest |delta|, the time of
+    # that peak, the time-averaged |delta| and the first time |delta| reaches
+    # threshold (NaN if never). Times where both runs are at the floor give 0.
+    # With log_time the average is over log10 t, the axis the runs were
+    # aligned on, so every decade counts the same.
+    delta = LB - LA
+    n = delta.shape[1]
+    peak = np.argmax(np.abs(delta), axis=0)
+    above = np.abs(delta) >= threshold
+    onset = np.where(above.any(axis=0), grid[np.argmax(above, axis=0)], np.nan)
+    x = np.log10(grid) if log_time else grid
+    mean_abs = (trapezoid_weights(x) @ np.abs(delta)) / (x[-1] - x[0])
+    return {
+        "max_dlog10": delta[peak, np.arange(n)],
+        "t_max": grid[peak],
+        "mean_abs_dlog10": mean_abs,
+        "t_onset": onset,
+    }
+
+def compare_runs_flux(args):
+    cubeA = load_flux_cube(Path(args.runA), jobs=args.jobs)
+    cubeB = load_flux_cube(Path(args.runB), jobs=args.jobs)
+    timesA = run_times(cubeA, args.timesA, args.jobs)
+    timesB = run_times(cubeB, args.timesB, args.jobs)
+
+    with profiling.timer("align"):
+        keys, grid, LA, LB, log_time = align_runs(cubeA, timesA, cubeB, timesB, args.min_flux)
+    with profiling.timer("divergence"):
+        result = divergence(grid, LA, LB, args.threshold, log_time)
+
+    score = result["mean_abs_dlog10"] if args.rank == "integrated" else np.abs(result["max_dlog10"])
+    order = np.argsort(-score, kind="stable")
+    if args.iso:
+        Z, A = unpack_keys(keys[order])
+        order = order[involves(Z, A, args.iso)]
+
+    shown = order if args.csv else order[:args.top]
+    names = reaction_names(*unpack_keys(keys[shown]))
+    print(f"\n=== {len(keys)} reactions on {len(grid)} aligned times "
+          f"({grid[0]:.4e} .. {grid[-1]:.4e}), ranked by {args.rank} divergence"
+          + (f", involving {args.iso}" if args.iso else "") + " ===\n")
+    print(text_table({
+        "max_dlog10": [f"{v:+.4f}" for v in result["max_dlog10"][shown[:args.top]]],
+        "t_max": [f"{v:.4e}" for v in result["t_max"][shown[:args.top]]],
+        "mean_abs_dlog10": [f"{v:.4f}" for v in result["mean_abs_dlog10"][shown[:args.top]]],
+        f"t_onset({args.threshold:g})": ["-" if np.isnan(v) else f"{v:.4e}"
+                                         for v in result["t_onset"][shown[:args.top]]],
+        "reaction": list(names[:args.top]),
+    }))
+
+    if args.csv:
+        import pandas as pd
+
+        pd.DataFrame({"reaction": names, **{k: v[shown] for k, v in result.items()},
+                      "key": keys[shown]}).to_csv(args.csv, index=False)
+        print(f"\n[OK] Wrote {args.csv}")
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--fileA", required=True)
-    ap.add_argument("--fileB", required=True)
+    ap.add_argument("--fileA", default=None)
+    ap.add_argument("--fileB", default=None)
+    ap.add_argument("--runA", default=None,
+                    help="compare two whole runs, aligned by agej, instead of two files")
+    ap.add_argument("--runB", default=None)
     ap.add_argument("--top", type=int, default=25)
     ap.add_argument("--iso", default=None,
                     help="Optional isotope to focus on (e.g. O-15)")
+    ap.add_argument("--rank", choices=["max", "integrated"], default="max",
+                    help="runs: rank by largest |delta log10| or by its time average")
+    ap.add_argument("--min-flux", type=float, default=1e-30,
+                    help="runs: |F| below this counts as this (no divergence between two tiny fluxes)")
+    ap.add_argument("--threshold", type=float, default=0.1,
+                    help="runs: |delta log10| that marks the onset of a divergence")
+    ap.add_argument("--timesA", default=None, help="runs: cycle,time CSV for runA")
+    ap.add_argument("--timesB", default=None, help="runs: cycle,time CSV for runB")
+    ap.add_argument("--csv", default=None, help="runs: write every reaction's divergence")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="runs: worker processes for parsing flux files")
+    profiling.add_argument(ap)
     args = ap.parse_args()
+    profiling.start(args.profile)
+
+    if args.runA or args.runB:
+        if not (args.runA and args.runB) or args.fileA or args.fileB:
+            ap.error("give either --fileA and --fileB, or --runA and --runB")
+        compare_runs_flux(args)
+        return
+    if not (args.fileA and args.fileB):
+        ap.error("give either --fileA and --fileB, or --runA and --runB")
+
+    tableA = read_flux_file(Path(args.fileA))
+    tableB = read_flux_file(Path(args.fileB))
 
-    dfA = parse_flux(Path(args.fileA))
-    dfB = parse_flux(Path(args.fileB))
+    keysA, fluxA = sum_by_key(tableA.keys, tableA.flux)
+    keysB, fluxB = sum_by_key(tableB.keys, tableB.flux)
 
-    # merge on reaction string
-    df = dfA.merge(dfB, on="reaction", suffixes=("_A", "_B"))
+    # sorted-array join on packed reaction keys
+    with profiling.timer("join"):
+        keys, iA, iB = np.intersect1d(keysA, keysB, assume_unique=True,
+                                      return_indices=True)
+    absA = np.abs(fluxA[iA])
+    absB = np.abs(fluxB[iB])
 
     # avoid zero division
-    df = df[(df["abs_flux_A"] > 0) & (df["abs_flux_B"] > 0)]
+    ok = (absA > 0) & (absB > 0)
+    keys, absA, absB = keys[ok], absA[ok], absB[ok]
 
-    df["delta_log10"] = np.log10(df["abs_flux_B"]) - np.log10(df["abs_flux_A"])
+    delta_log10 = np.log10(absB) - np.log10(absA)
 
     # sort by largest absolute change
-    df = df.reindex(df["delta_log10"].abs().sort_values(ascending=False).index)
+    order = np.argsort(-np.abs(delta_log10), kind="stable")
+    keys, delta_log10 = keys[order], delta_log10[order]
 
     print("\n=== Reactions with largest flux change ===\n")
-    print(df[["delta_log10", "reaction"]].head(args.top).to_string(index=False))
+    print(change_table(keys[:args.top], delta_log10[:args.top]))
 
     # Optional isotope-specific view
     if args.iso:
         iso = args.iso
+        Z, A = unpack_keys(keys)
 
-        prod = df[df["products_A"].apply(lambda lst: iso in lst)]
-        dest = df[df["reactants_A"].apply(lambda lst: iso in lst)]
+        prod = involves(Z, A, iso, PRODUCT_SLOTS)
+        dest = involves(Z, A, iso, REACTANT_SLOTS)
 
         print(f"\n=== Flux change affecting production of {iso} ===\n")
-        print(prod[["delta_log10", "reaction"]]
-              .head(args.top).to_string(index=False))
+        print(change_table(keys[prod][:args.top], delta_log10[prod][:args.top]))
 
         print(f"\n=== Flux change affecting destruction of {iso} ===\n")
-        print(dest[["delta_log10", "reaction"]]
-              .head(args.top).to_string(index=False))
+        print(change_table(keys[dest][:args.top], delta_log10[dest][:args.top]))
 
 if __name__ == "__main__":
     main()
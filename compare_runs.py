@@ -1,62 +1,251 @@
 import argparse
+import glob
 import matplotlib.pyplot as plt
 import numpy as np
-from abundance_io import read_final_abundances
+from pathlib import Path
+from abundance_io import read_final_abundances, normalize_run_path, ROOT
+from flux_io import text_table
+from run_catalog import load_catalog, read_final_csv, extract_factor, extract_pattern
+import profiling
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--runA", required=True, help="Reference run (e.g. runs/baseline)")
-    ap.add_argument("--runB", required=True, help="Comparison run (e.g. runs/test)")
-    ap.add_argument("--top", type=int, default=20)
-    ap.add_argument("--logtol", type=float, default=0.1,
-                    help="Ignore changes with |log10(Xf_B/Xf_A)| < logtol")
-    args = ap.parse_args()
+def compare_final(runA, runB, top=20, logtol=0.1):
+    # -> (created_B, destroyed_B, both, runA_dir, runB_dir); both holds the
+    # top isotopes present in both runs with |log10(X_B/X_A)| > logtol
 
     # read final abundances of both runs
-    df_A, runA_dir = read_final_abundances(args.runA)
-    df_B, runB_dir = read_final_abundances(args.runB)
+    df_A, runA_dir = read_final_abundances(runA)
+    df_B, runB_dir = read_final_abundances(runB)
 
     df_A = df_A.rename(columns={"X": "X_A"})
     df_B = df_B.rename(columns={"X": "X_B"})
-    
-    #print(df_A)
 
     # merge
-    df = df_A.merge(df_B, on="isotope", how="outer")
+    with profiling.timer("merge"):
+        df = df_A.merge(df_B, on="isotope", how="outer")
     df["X_A"] = df["X_A"].fillna(0.0)
     df["X_B"] = df["X_B"].fillna(0.0)
 
-    #print(df)
-
     # classify changes
     created_B = df[(df["X_A"] == 0) & (df["X_B"] > 0)].copy()
     destroyed_B = df[(df["X_A"] > 0) & (df["X_B"] == 0)].copy()
     both = df[(df["X_A"] > 0) & (df["X_B"] > 0)].copy()
 
-    #print(created_B)
-    print(both)
     # ratio analysis
     both["ratio_BA"] = both["X_B"] / both["X_A"]
     both["log_ratio"] = np.log10(both["ratio_BA"])
-    print(both["ratio_BA"])
-    print(both["log_ratio"])
-    both = both[np.abs(both["log_ratio"]) > args.logtol]
-
-    if both.empty:
-        print("\n------------------------------------------------------")
-        print(f"No significant change with a tolerance of {args.logtol}")
-        return 0
+    both = both[np.abs(both["log_ratio"]) > logtol]
 
     #both["log_ratio"] = both["log_ratio"].fillna(0.0)
     #both["log_ratio"] = both["log_ratio"].replace([-np.inf, np.inf], 1000)
 
-    print(both["ratio_BA"])
-    print(both["log_ratio"])
-
     # rank
     both = both.reindex(
         both["log_ratio"].abs().sort_values(ascending=False).index
-    ).head(args.top)
+    ).head(top)
+
+    return created_B, destroyed_B, both, runA_dir, runB_dir
+
+def render(runA, runB, top=20, logtol=0.1, show=False, changes=None):
+    # None when no isotope changed by more than logtol
+    if changes is None:
+        changes = compare_final(runA, runB, top, logtol)
+    _, _, both, runA_dir, runB_dir = changes
+    if both.empty:
+        return None
+
+    outdir = runB_dir / "plots"
+    outdir.mkdir(exist_ok=True)
+
+    fig = plt.figure()
+    plt.barh(both["isotope"], both["log_ratio"])
+    plt.axvline(0.0, color='k', linestyle="--")
+    
+    xmin = min(both["log_ratio"].min(), -0.05)
+    xmax = max(both["log_ratio"].max(), 0.05)
+    plt.xlim(xmin, xmax)
+    plt.xlabel(r"$\log_{10}(X_f^{(B)} / X_f^{(A)})$")
+    plt.title(
+        f"Final abundance changes\n"
+        f"{runB_dir.name} vs {runA_dir.name}"
+    )
+    plt.grid(True, axis="x", ls=":")
+    with profiling.timer("plot"):
+        plt.tight_layout()
+
+        outfile = outdir / f"compare_{runB_dir.name}_vs_{runA_dir.name}.png"
+        plt.savefig(outfile, dpi=200)
+    if show:
+        plt.show()
+    plt.close(fig)
+    return outfile
+
+def expand_runs(patterns, reference):
+    # run directories and globs (relative ones resolved like normalize_run_path)
+    # -> sorted by reaction pattern, then rate factor; the reference is left out
+    runs = set()
+    for pat in patterns:
+        full = pat if Path(pat).is_absolute() else str(ROOT / pat)
+        hits = [Path(p) for p in glob.glob(full)] if glob.has_magic(pat) else [normalize_run_path(pat)]
+        runs.update(p for p in hits if (p / "final_abundances.csv").exists())
+    runs.discard(reference)
+    def order(p):
+        factor = extract_factor(p.name)
+        return (extract_pattern(p.name) or "", np.inf if factor is None else factor, p.name)
+    return sorted(runs, key=order)
+
+def abundance_matrix(run_dirs):
+    # -> (isotopes, X [n_runs x n_isotopes], NaN where a run has no entry).
+    # Runs under a runs/ directory come straight from its catalog matrix;
+    # any other run is read from its final_abundances.csv.
+    catalogs, parts = {}, []
+    for run_dir in run_dirs:
+        if run_dir.parent not in catalogs:
+            catalogs[run_dir.parent] = load_catalog(run_dir.parent)
+        cat = catalogs[run_dir.parent]
+        i = cat.row(run_dir)
+        if i is None:
+            parts.append(read_final_csv(run_dir / "final_abundances.csv"))
+        else:
+            parts.append((cat.isotopes, cat.X[i]))
+
+    isotopes = list(dict.fromkeys(iso for names, _ in parts for iso in names))
+    col = {iso: j for j, iso in enumerate(isotopes)}
+    X = np.full((len(parts), len(isotopes)), np.nan)
+    cols = {}       # one column map per catalog, not per run
+    for k, (names, x) in enumerate(parts):
+        if id(names) not in cols:
+            cols[id(names)] = np.array([col[iso] for iso in names], dtype=np.int64)
+        X[k, cols[id(names)]] = x
+    return isotopes, X
+
+def compare_matrix(X_ref, X):
+    # one aligned pass over [n_runs x n_isotopes]: log10(X / X_ref) where the
+    # isotope is present in both, +inf where it was created (absent or 0 in
+    # the reference), -inf where it was destroyed, NaN where it is in neither
+    ref = np.nan_to_num(X_ref, nan=0.0)[None, :]
+    X = np.nan_to_num(X, nan=0.0)
+    created = (ref <= 0) & (X > 0)
+    destroyed = (ref > 0) & (X <= 0)
+    both = (ref > 0) & (X > 0)
+    L = np.full(X.shape, np.nan)
+    L[both] = np.log10((X / np.where(ref > 0, ref, 1.0))[both])
+    L[created] = np.inf
+    L[destroyed] = -np.inf
+    return L, created, destroyed
+
+def render_matrix(names, isotopes, L, ref_name, outfile, vmax=2.0, show=False):
+    # runs x isotopes heatmap of log10(X/X_ref), clipped to +-vmax;
+    # created/destroyed isotopes are marked with + and x
+    fig_h = max(3.0, 0.25 * len(names) + 1.5)
+    fig_w = max(6.0, 0.3 * len(isotopes) + 2.5)
+    fig, ax = plt.subplots(figsize=(fig_w, fig_h))
+    finite = np.where(np.isfinite(L), L, np.nan)
+    im = ax.imshow(np.clip(finite, -vmax, vmax), cmap="RdBu_r", vmin=-vmax, vmax=vmax,
+                   aspect="auto", interpolation="nearest")
+    for marker, mask in (("+", np.isposinf(L)), ("x", np.isneginf(L))):
+        r, c = np.nonzero(mask)
+        ax.scatter(c, r, marker=marker, color="k", s=20)
+    ax.set_xticks(range(len(isotopes)), isotopes, rotation=90, fontsize=7)
+    ax.set_yticks(range(len(names)), names, fontsize=7)
+    fig.colorbar(im, ax=ax, label=rf"$\log_{{10}}(X_f / X_f^{{({ref_name})}})$")
+    ax.set_title(f"Final abundances relative to {ref_name} (+ created, x destroyed)")
+    with profiling.timer("plot"):
+        fig.tight_layout()
+        fig.savefig(outfile, dpi=200)
+    if show:
+        plt.show()
+    plt.close(fig)
+    return outfile
+
+def main_matrix(args):
+    ref_dir = normalize_run_path(args.runA)
+    runs = expand_runs(args.runs, ref_dir)
+    if not runs:
+        raise RuntimeError(f"No runs with final_abundances.csv match {' '.join(args.runs)}")
+
+    with profiling.timer("abundance_matrix"):
+        isotopes, X = abundance_matrix([ref_dir] + runs)
+    L, created, destroyed = compare_matrix(X[0], X[1:])
+    names = [r.name for r in runs]
+
+    # per-run summary
+    changed = np.isfinite(L) & (np.abs(np.nan_to_num(L)) > args.logtol)
+    score = np.where(np.isfinite(L), np.abs(L), -1.0)
+    peak = np.argmax(score, axis=1)
+    print(f"\n=== {len(runs)} runs relative to {ref_dir.name} "
+          f"({len(isotopes)} isotopes, |log10 ratio| > {args.logtol:g}) ===\n")
+    print(text_table({
+        "run": names,
+        "changed": [str(n) for n in changed.sum(axis=1)],
+        "created": [str(n) for n in created.sum(axis=1)],
+        "destroyed": [str(n) for n in destroyed.sum(axis=1)],
+        "largest": [f"{isotopes[j]} {L[i, j]:+.3f}" if score[i, j] >= 0 else "-"
+                    for i, j in enumerate(peak)],
+    }))
+
+    # isotopes ranked by their largest finite change over all runs; created
+    # or destroyed anywhere counts as the largest change
+    with np.errstate(invalid="ignore"):
+        rank_score = np.where(np.isinf(L), np.inf, score).max(axis=0)
+    order = np.argsort(-rank_score, kind="stable")
+    order = order[(rank_score[order] > args.logtol)][:args.top]
+
+    # the table covers every run and isotope, so it is written even when
+    # nothing passes --logtol; only the heatmap needs a change to show
+    outdir = Path(args.outdir) if args.outdir else ref_dir / "plots"
+    outdir.mkdir(parents=True, exist_ok=True)
+    csv = Path(args.csv) if args.csv else outdir / f"compare_matrix_vs_{ref_dir.name}.csv"
+    with open(csv, "w") as f:
+        f.write("run,factor," + ",".join(isotopes) + "\n")
+        for name, row in zip(names, L):
+            factor = extract_factor(name)
+            f.write(f"{name},{'' if factor is None else f'{factor:g}'},"
+                    + ",".join("" if np.isnan(v) else f"{v:.6g}" for v in row) + "\n")
+    print(f"\n[OK] Wrote {csv}")
+
+    if len(order) == 0:
+        print(f"No significant change with a tolerance of {args.logtol}, no heatmap")
+        return 0
+
+    outfile = render_matrix(names, [isotopes[j] for j in order], L[:, order], ref_dir.name,
+                            outdir / f"compare_matrix_vs_{ref_dir.name}.png",
+                            vmax=args.vmax, show=not args.no_show)
+    print(f"[OK] Saved {outfile}\n")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runA", required=True, help="Reference run (e.g. runs/baseline)")
+    ap.add_argument("--runB", default=None, help="Comparison run (e.g. runs/test)")
+    ap.add_argument("--runs", nargs="+", default=None,
+                    help="N-way mode: compare all these runs (or globs, e.g. 'runs/*15O_ag*') "
+                         "with runA at once")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--logtol", type=float, default=0.1,
+                    help="Ignore changes with |log10(Xf_B/Xf_A)| < logtol")
+    ap.add_argument("--csv", default=None,
+                    help="N-way: runs x isotopes log10 ratio table "
+                         "(default <runA>/plots/compare_matrix_vs_<runA>.csv)")
+    ap.add_argument("--outdir", default=None, help="N-way: where the table and heatmap go")
+    ap.add_argument("--vmax", type=float, default=2.0, help="N-way: heatmap colour range in dex")
+    ap.add_argument("--no-show", action="store_true", help="N-way: only save the heatmap")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    if args.runs:
+        if args.runB:
+            ap.error("give either --runB or --runs")
+        return main_matrix(args)
+    if not args.runB:
+        ap.error("give --runB, or --runs for the N-way comparison")
+
+    changes = compare_final(args.runA, args.runB, args.top, args.logtol)
+    created_B, destroyed_B, both, runA_dir, runB_dir = changes
+
+    if both.empty:
+        print("\n------------------------------------------------------")
+        print(f"No significant change with a tolerance of {args.logtol}")
+        return 0
 
     enhanced = both[both["log_ratio"] > 0]
     depleted = both[both["log_ratio"] < 0]
@@ -67,46 +256,27 @@ def main():
 
     print(f"\n=== Comparison: {runB_dir.name} relative to {runA_dir.name} ===")
     print("\n--- Created only in run B ---")
-    for _, r in created_B.sort_values("X_B", ascending=False).iterrows():
-        print(f"{r['isotope']:>6s} X_f(B) = {r['X_B']:.3e}")
+    created_B = created_B.sort_values("X_B", ascending=False)
+    for iso, xb in zip(created_B["isotope"], created_B["X_B"]):
+        print(f"{iso:>6s} X_f(B) = {xb:.3e}")
 
     print("\n--- Destroyed only in run B ---")
-    for _, r in destroyed_B.sort_values("X_A", ascending=False).iterrows():
-        print(f"{r['isotope']:>6s}")
+    for iso in destroyed_B.sort_values("X_A", ascending=False)["isotope"]:
+        print(f"{iso:>6s}")
 
     print("\n--- Enhanced in run B ---")
-    for _, r in enhanced.iterrows():
-        print(f"{r['isotope']:>6s} x{r['ratio_BA']:.2e}")
+    for iso, ratio in zip(enhanced["isotope"], enhanced["ratio_BA"]):
+        print(f"{iso:>6s} x{ratio:.2e}")
 
     print("\n--- Depleted in run B ---")
-    for _, r in depleted.iterrows():
-        print(f"{r['isotope']:>6s} /{1/r['ratio_BA']:.2e}")
+    for iso, ratio in zip(depleted["isotope"], depleted["ratio_BA"]):
+        print(f"{iso:>6s} /{1/ratio:.2e}")
 
     # -------------------------------------------------
     # PLOT
     # -------------------------------------------------
 
-    outdir = runB_dir / "plots"
-    outdir.mkdir(exist_ok=True)
-
-    plt.figure()
-    plt.barh(both["isotope"], both["log_ratio"])
-    plt.axvline(0.0, color='k', linestyle="--")
-    
-    xmin = min(both["log_ratio"].min(), -0.05)
-    xmax = max(both["log_ratio"].max(), 0.05)
-    plt.xlim(xmin, xmax)
-    plt.xlabel(r"$\log_{10}(X_f^{(B)} / X_f^{(A)})$")
-    plt.title(
-        f"Final abundance changes\n"
-        f"{runB_dir.name} vs {runA_dir.name}"
-    )
-    plt.grid(True, axis="x", ls=":")
-    plt.tight_layout()
-
-    outfile = outdir / f"compare_{runB_dir.name}_vs_{runA_dir.name}.png"
-    plt.savefig(outfile, dpi=200)
-    plt.show()
+    outfile = render(args.runA, args.runB, args.top, args.logtol, show=True, changes=changes)
 
     print(f"\n[OK] Saved {outfile}\n")
 
@@ -0,0 +1,291 @@
+import argparse
+import os
+import re
+import numpy as np
+from pathlib import Path
+from run_catalog import read_final_csv
+from run_io import iter_chunks
+import profiling
+
+STATE_FILE = "ensemble_state.npz"
+
+# Quantile sketch: a fixed histogram of log10(X) per isotope. Two sketches
+# with the same bins merge by adding counts, so partial states from workers
+# (or from earlier invocations) combine in any order. Quantiles are good to
+# one bin width; values outside [LOG_LO, LOG_HI) land in the edge bins.
+# LOG_LO is the PPN abundance floor (~1e-99); values below it are still
+# counted per isotope (n_below) so a pinned low percentile is visible.
+LOG_LO = -100.0
+LOG_HI = 0.0
+BIN_WIDTH = 0.02
+N_BINS = int(round((LOG_HI - LOG_LO) / BIN_WIDTH))
+COUNT_DTYPE = np.int32  # 5000 bins x 4 bytes = 20 kB per isotope
+
+QUANTILES = (0.16, 0.50, 0.84)
+
+def _combine(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    # Chan et al. pairwise update of count, mean and sum of squared deviations
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w = np.where(n > 0, n_b / n, 0.0)
+    mean = mean_a + delta * w
+    m2 = m2_a + m2_b + delta * delta * n_a * w
+    return n, mean, m2
+
+class EnsembleState:
+    # Running per-isotope statistics over the final abundances of many runs:
+    # Welford mean/variance of X and of log10(X) (X > 0 only; zeros are
+    # counted in n_zero) and a log10(X) histogram for the percentiles.
+    # Memory is O(n_isotopes x N_BINS), independent of the number of runs.
+
+    def __init__(self, pattern=""):
+        self.pattern = pattern  # run-name filter the ensemble was built with
+        self.isotopes = []
+        self.runs = {}      # run name -> final_abundances.csv signature
+        self._col = {}
+        self.n = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.n_log = np.zeros(0, dtype=np.int64)
+        self.mean_log = np.zeros(0)
+        self.m2_log = np.zeros(0)
+        self.n_below = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros((0, N_BINS), dtype=COUNT_DTYPE)
+
+    def _columns(self, isotopes):
+        new = [iso for iso in dict.fromkeys(isotopes) if iso not in self._col]
+        if new:
+            for iso in new:
+                self._col[iso] = len(self.isotopes)
+                self.isotopes.append(iso)
+            k = len(new)
+            for name in ("n", "mean", "m2", "n_log", "mean_log", "m2_log", "n_below"):
+                arr = getattr(self, name)
+                setattr(self, name, np.concatenate([arr, np.zeros(k, dtype=arr.dtype)]))
+            self.counts = np.vstack([self.counts, np.zeros((k, N_BINS), dtype=COUNT_DTYPE)])
+        return np.array([self._col[iso] for iso in isotopes], dtype=np.int64)
+
+    def update(self, name, isotopes, X, signature=(-1, -1)):
+        # add one run; a run name already counted is ignored
+        if name in self.runs:
+            return
+        self.runs[name] = tuple(signature)
+        idx = self._columns(isotopes)
+        X = np.asarray(X, dtype=float)
+
+        self.n[idx] += 1
+        delta = X - self.mean[idx]
+        self.mean[idx] += delta / self.n[idx]
+        self.m2[idx] += delta * (X - self.mean[idx])
+
+        pos = X > 0
+        idx, y = idx[pos], np.log10(X[pos])
+        self.n_log[idx] += 1
+        delta = y - self.mean_log[idx]
+        self.mean_log[idx] += delta / self.n_log[idx]
+        self.m2_log[idx] += delta * (y - self.mean_log[idx])
+
+        np.add.at(self.n_below, idx[y < LOG_LO], 1)
+        b = np.clip(((y - LOG_LO) / BIN_WIDTH).astype(np.int64), 0, N_BINS - 1)
+        np.add.at(self.counts, (idx, b), 1)
+
+    def merge(self, other):
+        # fold another state into this one; the two must cover disjoint runs
+        overlap = self.runs.keys() & other.runs.keys()
+        if overlap:
+            raise ValueError(f"Cannot merge ensemble states sharing {len(overlap)} runs")
+        idx = self._columns(other.isotopes)
+
+        self.n[idx], self.mean[idx], self.m2[idx] = _combine(
+            self.n[idx], self.mean[idx], self.m2[idx], other.n, other.mean, other.m2)
+        self.n_log[idx], self.mean_log[idx], self.m2_log[idx] = _combine(
+            self.n_log[idx], self.mean_log[idx], self.m2_log[idx],
+            other.n_log, other.mean_log, other.m2_log)
+        self.counts[idx] += other.counts
+        self.n_below[idx] += other.n_below
+        self.runs |= other.runs
+        return self
+
+    @property
+    def n_zero(self):
+        return self.n - self.n_log
+
+    def std(self, log=True):
+        n, m2 = (self.n_log, self.m2_log) if log else (self.n, self.m2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+
+    def quantiles(self, q=QUANTILES):
+        # -> [n_isotopes x len(q)] log10(X) percentiles, linear inside a bin
+        q = np.asarray(q, dtype=float)
+        cum = np.cumsum(self.counts, axis=1)
+        total = cum[:, -1]
+        out = np.full((len(self.isotopes), len(q)), np.nan)
+        for i in np.flatnonzero(total):
+            target = q * total[i]
+            b = np.minimum(np.searchsorted(cum[i], target, side="left"), N_BINS - 1)
+            below = np.where(b > 0, cum[i, b - 1], 0)
+            frac = (target - below) / self.counts[i, b]
+            out[i] = LOG_LO + (b + frac) * BIN_WIDTH
+        return out
+
+    def summary(self):
+        import pandas as pd
+
+        p = self.quantiles(QUANTILES)
+        return pd.DataFrame({
+            "isotope": self.isotopes,
+            "n": self.n,
+            "n_zero": self.n_zero,
+            "mean_log10X": np.where(self.n_log > 0, self.mean_log, np.nan),
+            "std_log10X": self.std(log=True),
+            "p16_log10X": p[:, 0],
+            "p50_log10X": p[:, 1],
+            "p84_log10X": p[:, 2],
+            "n_below_range": self.n_below,
+            "mean_X": np.where(self.n > 0, self.mean, np.nan),
+            "std_X": self.std(log=False),
+        })
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            names = sorted(self.runs)
+            # the histograms are mostly empty bins, which compress to nothing
+            np.savez_compressed(f, pattern=self.pattern, isotopes=np.array(self.isotopes, dtype=str),
+                     runs=np.array(names, dtype=str),
+                     signatures=np.array([self.runs[r] for r in names],
+                                         dtype=np.int64).reshape(-1, 2),
+                     bins=np.array([LOG_LO, LOG_HI, BIN_WIDTH]),
+                     n=self.n, mean=self.mean, m2=self.m2,
+                     n_log=self.n_log, mean_log=self.mean_log, m2_log=self.m2_log,
+                     n_below=self.n_below, counts=self.counts)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            if not np.array_equal(d["bins"], [LOG_LO, LOG_HI, BIN_WIDTH]):
+                raise ValueError(f"{path} was written with different histogram bins")
+            state = cls(str(d["pattern"]) if "pattern" in d else "")
+            state.isotopes = d["isotopes"].tolist()
+            state._col = {iso: j for j, iso in enumerate(state.isotopes)}
+            names = d["runs"].tolist()
+            # states saved before signatures were kept count as changed
+            sigs = d["signatures"].tolist() if "signatures" in d else [(-1, -1)] * len(names)
+            state.runs = {r: tuple(sig) for r, sig in zip(names, sigs)}
+            for name in ("n", "mean", "m2", "n_log", "mean_log", "m2_log", "n_below", "counts"):
+                setattr(state, name, d[name])
+        return state
+
+def csv_signature(run_dir):
+    # (size, mtime) of the run's final_abundances.csv; a rewritten file
+    # (rerun job, or one read while it was still being written) changes it
+    st = os.stat(run_dir / "final_abundances.csv")
+    return st.st_size, st.st_mtime_ns
+
+def state_file_name(pattern=None):
+    # one default state per --pattern, so separate ensembles never mix
+    if not pattern:
+        return STATE_FILE
+    return f"ensemble_state_{re.sub(r'[^A-Za-z0-9_.+-]', '_', pattern)}.npz"
+
+def _reduce_chunk(run_dirs):
+    # worker: one partial state per chunk of runs, each CSV read once
+    state = EnsembleState()
+    for run_dir in run_dirs:
+        signature = csv_signature(run_dir)
+        isotopes, X = read_final_csv(run_dir / "final_abundances.csv")
+        state.update(run_dir.name, isotopes, X, signature)
+    return state
+
+def find_runs(runs_dir, pattern=None):
+    # finished runs (those with a final_abundances.csv), sorted by name
+    runs = []
+    with os.scandir(runs_dir) as it:
+        for entry in it:
+            if not entry.is_dir() or (pattern and pattern not in entry.name):
+                continue
+            if os.path.exists(os.path.join(entry.path, "final_abundances.csv")):
+                runs.append(Path(entry.path))
+    return sorted(runs)
+
+def update_ensemble(runs_dir, pattern=None, state=None, jobs=1):
+    # add every finished run not yet in state; safe to call repeatedly while
+    # a sweep is still producing runs. The statistics cannot drop one run's
+    # contribution, so if the CSV of a counted run has changed since it was
+    # read, the whole ensemble is recounted.
+    if state is not None and state.pattern != (pattern or ""):
+        print(f"[WARN] State was built for --pattern {state.pattern!r}, not {pattern or ''!r}; "
+              f"starting a new ensemble")
+        state = None
+    state = state or EnsembleState(pattern or "")
+    runs = find_runs(runs_dir, pattern)
+    changed = [r.name for r in runs
+               if r.name in state.runs and state.runs[r.name] != csv_signature(r)]
+    if changed:
+        print(f"[WARN] final_abundances.csv changed for {len(changed)} counted runs "
+              f"(e.g. {changed[0]}), recounting the ensemble")
+        state = EnsembleState(pattern or "")
+    todo = [r for r in runs if r.name not in state.runs]
+    # one partial per worker, each folded in as soon as it is back, so at
+    # most a few partial histograms are alive at a time
+    for part in iter_chunks(_reduce_chunk, todo, jobs, chunks_per_job=1):
+        state.merge(part)
+    return state, len(todo)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs-dir", default="runs")
+    ap.add_argument("--pattern", default=None,
+                    help="only runs whose name contains this, e.g. mc_")
+    ap.add_argument("--state", default=None,
+                    help="running state to resume from and update (default "
+                         "<runs-dir>/ensemble_state_<pattern>.npz, or "
+                         f"<runs-dir>/{STATE_FILE} without --pattern)")
+    ap.add_argument("--restart", action="store_true", help="ignore any saved state")
+    ap.add_argument("--jobs", type=int, default=1)
+    ap.add_argument("--csv", default=None, help="write the per-isotope summary here")
+    ap.add_argument("--top", type=int, default=20,
+                    help="print the isotopes with the largest log10 spread")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    runs_dir = Path(args.runs_dir)
+    state_file = Path(args.state) if args.state else runs_dir / state_file_name(args.pattern)
+
+    state = None
+    if state_file.exists() and not args.restart:
+        try:
+            state = EnsembleState.load(state_file)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] Ignoring {state_file}: {e}; starting over")
+    state, n_new = update_ensemble(runs_dir, args.pattern, state, args.jobs)
+    if not state.runs:
+        raise FileNotFoundError(f"No runs with final_abundances.csv in {runs_dir}")
+
+    state.save(state_file)
+    print(f"[OK] {len(state.runs)} runs in ensemble ({n_new} new), state in {state_file}")
+
+    below = np.flatnonzero(state.n_below)
+    if len(below):
+        print(f"[WARN] {state.n_below.sum()} abundances of {len(below)} isotopes "
+              f"(e.g. {state.isotopes[below[0]]}) are below 1e{LOG_LO:g}; their low "
+              f"percentiles are pinned at {LOG_LO:g} (see n_below_range)")
+
+    df = state.summary()
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+        print(f"[OK] Wrote {args.csv}")
+
+    top = df.sort_values("std_log10X", ascending=False).head(args.top)
+    print(f"\n{'iso':>8s} {'n':>7s} {'p16':>9s} {'p50':>9s} {'p84':>9s} {'sigma':>7s}")
+    for r in top.itertuples(index=False):
+        print(f"{r.isotope:>8s} {r.n:7d} {r.p16_log10X:9.3f} {r.p50_log10X:9.3f} "
+              f"{r.p84_log10X:9.3f} {r.std_log10X:7.3f}")
+
+if __name__ == "__main__":
+    main()
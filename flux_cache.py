@@ -0,0 +1,345 @@
+import json
+import os
+import numpy as np
+from pathlib import Path
+from profiling import timer, count
+from flux_io import (read_flux_file, reaction_names, involves, unpack_keys, parse_reaction,
+                     sum_by_key)
+from run_io import (list_snapshots, complete_snapshots, source_manifest, agej_from_iso_files,
+                    map_chunks, manifest_matches, save_arrays)
+
+CACHE_DIR = ".flux_cache"
+CACHE_VERSION = 2
+INTEGRAL_FILE = "integral.npz"
+
+class FluxCube:
+    # All flux_*.DAT files of one run as a [n_timesteps x n_reactions] matrix.
+    # keys holds the sorted packed reaction key (flux_io.pack_keys) of every
+    # column, cycles the flux file index of every row.
+
+    def __init__(self, run_dir, cycles, keys, flux):
+        self.run_dir = Path(run_dir)
+        self.cycles = cycles
+        self.keys = keys
+        self.flux = flux
+        self._ZA = None
+
+    @property
+    def shape(self):
+        return self.flux.shape
+
+    @property
+    def Z(self):
+        if self._ZA is None:
+            self._ZA = unpack_keys(self.keys)
+        return self._ZA[0]
+
+    @property
+    def A(self):
+        if self._ZA is None:
+            self._ZA = unpack_keys(self.keys)
+        return self._ZA[1]
+
+    def columns(self, keys):
+        # packed keys -> column indices, -1 where the key is not in the network
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1)
+        pos = np.searchsorted(self.keys, keys)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        return np.where(self.keys[pos] == keys, pos, -1)
+
+    def reactions(self, idx=slice(None)):
+        return reaction_names(self.Z[idx], self.A[idx])
+
+    def find(self, reaction):
+        idx, missing = self.find_many([reaction])
+        if missing:
+            raise KeyError(reaction)
+        return idx[0]
+
+    def find_many(self, reactions):
+        # -> (column indices, names not in the network). Names are turned into
+        # packed keys; only names that do not round-trip (e.g. a neutron in a
+        # channel, which has no label) fall back to comparing built names.
+        cols = []
+        for r in reactions:
+            try:
+                cols.append(self.columns([parse_reaction(r)])[0])
+            except ValueError:
+                cols.append(-1)
+        if any(c < 0 for c in cols):
+            lookup = {r: i for i, r in enumerate(self.reactions())}
+            cols = [c if c >= 0 else lookup.get(r, -1) for r, c in zip(reactions, cols)]
+        idx = [c for c in cols if c >= 0]
+        missing = [r for r, c in zip(reactions, cols) if c < 0]
+        return np.array(idx, dtype=np.int64), missing
+
+    def involving(self, iso, slots=(0, 1, 2, 3)):
+        return np.flatnonzero(involves(self.Z, self.A, iso, slots))
+
+    def series(self, reaction):
+        return np.asarray(self.flux[:, self.find(reaction)])
+
+def _parse_chunk(paths):
+    # worker side: only the flux column of each file goes back through the
+    # pipe, plus its packed keys when they differ from the previous file's
+    out, last = [], None
+    for path in paths:
+        table = read_flux_file(path)
+        keys = table.keys
+        same = last is not None and np.array_equal(keys, last)
+        out.append((None if same else keys, table.flux))
+        last = keys
+    return out
+
+def build_flux_cube(run_dir, snapshots, jobs=1):
+    cycles = np.array([c for c, _, _ in snapshots], dtype=np.int64)
+    paths = [p for _, p, _ in snapshots]
+    layouts, layout_of, fluxes = [], [], []
+
+    for part in map_chunks(_parse_chunk, paths, jobs):
+        for keys, flux in part:
+            # consecutive files almost always share the network layout
+            if keys is not None and not (layouts and np.array_equal(keys, layouts[-1])):
+                layouts.append(keys)
+            layout_of.append(len(layouts) - 1)
+            fluxes.append(flux)
+
+    if layouts:
+        keys, inverse = np.unique(np.concatenate(layouts), return_inverse=True)
+        inverse = inverse.ravel()
+        offsets = np.cumsum([0] + [len(k) for k in layouts])
+    else:
+        keys = np.empty(0, dtype=np.int64)
+
+    flux = np.zeros((len(snapshots), len(keys)))
+    for i, (lay, f) in enumerate(zip(layout_of, fluxes)):
+        cols = inverse[offsets[lay]:offsets[lay + 1]]
+        flux[i] = np.bincount(cols, weights=f, minlength=len(keys))
+
+    return FluxCube(run_dir, cycles, keys, flux)
+
+def _load(run_dir, cache):
+    return FluxCube(
+        run_dir,
+        cycles=np.load(cache / "cycles.npy"),
+        keys=np.load(cache / "keys.npy"),
+        flux=np.load(cache / "flux.npy", mmap_mode="r"),
+    )
+
+def load_flux_cube(run_dir, rebuild=False, jobs=1) -> FluxCube:
+    run_dir = Path(run_dir)
+    snapshots = list_snapshots(run_dir, "flux")
+    if not snapshots:
+        raise RuntimeError(f"No flux_*.DAT files found in {run_dir}")
+
+    cache = run_dir / CACHE_DIR
+    manifest = {"version": CACHE_VERSION, "sources": source_manifest(snapshots)}
+
+    if not rebuild and manifest_matches(cache, manifest):
+        count("flux_cache_hits")
+        return _load(run_dir, cache)
+
+    with timer("build_flux_cube"):
+        cube = build_flux_cube(run_dir, snapshots, jobs)
+    try:
+        with timer("save_flux_cache"):
+            save_arrays(cache, {"cycles": cube.cycles, "keys": cube.keys,
+                                "flux": cube.flux}, manifest)
+    except OSError as e:
+        # read-only run directory: still usable, just not cached
+        print(f"[WARN] Could not write flux cache in {cache}: {e}")
+        return cube
+    return _load(run_dir, cache)
+
+def read_time_table(path):
+    # CSV with a header line and cycle,time as the first two columns
+    # (iso_massf_io writes one as <run>/cycle_times.csv)
+    data = np.loadtxt(path, delimiter=",", skiprows=1, usecols=(0, 1), ndmin=2)
+    return dict(zip(data[:, 0].astype(np.int64), data[:, 1]))
+
+def snapshot_times(cube, time_table=None, jobs=1):
+    # agej of the iso_massf file with the same cycle index as each flux file,
+    # cached next to the cube since it means opening one file per snapshot
+    if time_table is not None:
+        table = read_time_table(time_table)
+        return np.array([table.get(c, np.nan) for c in cube.cycles])
+
+    iso = {c: (c, p, st) for c, p, st in list_snapshots(cube.run_dir, "iso_massf")}
+    matched = [iso[c] for c in cube.cycles if c in iso]
+    manifest = {"version": CACHE_VERSION, "sources": source_manifest(matched)}
+
+    times_file = cube.run_dir / CACHE_DIR / "times.json"
+    if times_file.exists():
+        cached = json.loads(times_file.read_text())
+        if cached["manifest"] == manifest:
+            lookup = dict(zip(cached["cycles"], cached["times"]))
+            return np.array([lookup.get(int(c), np.nan) for c in cube.cycles])
+
+    with timer("read_agej"):
+        ages = [a for part in map_chunks(agej_from_iso_files, [p for _, p, _ in matched], jobs)
+                for a in part]
+    lookup = {c: a for (c, _, _), a in zip(matched, ages)}
+    try:
+        times_file.parent.mkdir(exist_ok=True)
+        times_file.write_text(json.dumps({
+            "manifest": manifest,
+            "cycles": [int(c) for c in lookup],
+            "times": list(lookup.values()),
+        }))
+    except OSError:
+        pass
+    return np.array([lookup.get(c, np.nan) for c in cube.cycles])
+
+def trapezoid_weights(t):
+    # phi = w @ F is the trapezoid rule for every column of F at once
+    t = np.asarray(t, dtype=float)
+    w = np.zeros_like(t)
+    if len(t) > 1:
+        dt = np.diff(t)
+        w[:-1] += 0.5 * dt
+        w[1:] += 0.5 * dt
+    return w
+
+class FluxIntegral:
+    # Checkpoint of phi_j = integral |F_j| dt over the flux files folded in
+    # so far: the trapezoid sums up to the last cycle, plus that cycle's time
+    # and |F| row, which are the left end of the next interval. sources is
+    # the manifest of the files already used, so a rewritten file is noticed.
+
+    def __init__(self, time_source="agej"):
+        self.time_source = time_source
+        self.keys = np.empty(0, dtype=np.int64)
+        self.phi = np.empty(0)
+        self.last_abs = np.empty(0)
+        self.last_cycle = -1
+        self.last_time = np.nan
+        self.sources = []
+
+    def _columns(self, keys):
+        # grow the sorted key set by any new reactions -> column of each key
+        new = np.setdiff1d(keys, self.keys, assume_unique=True)
+        if len(new):
+            merged = np.union1d(self.keys, new)
+            old = np.searchsorted(merged, self.keys)
+            for name in ("phi", "last_abs"):
+                grown = np.zeros(len(merged))
+                grown[old] = getattr(self, name)
+                setattr(self, name, grown)
+            self.keys = merged
+        return np.searchsorted(self.keys, keys)
+
+    def add(self, cycle, time, keys, flux, source):
+        # keys must be unique (flux_io.sum_by_key)
+        cols = self._columns(keys)
+        row = np.zeros(len(self.keys))
+        row[cols] = np.abs(flux)
+        if self.last_cycle >= 0:
+            self.phi += 0.5 * (time - self.last_time) * (self.last_abs + row)
+        self.last_abs = row
+        self.last_cycle, self.last_time = cycle, time
+        if source is not None:
+            self.sources.append(source)
+
+    def matches(self, snapshots, time_source):
+        # the files already folded in are still there, unchanged
+        done = source_manifest([s for s in snapshots if s[0] <= self.last_cycle])
+        return time_source == self.time_source and done == self.sources
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, version=CACHE_VERSION, time_source=self.time_source,
+                     keys=self.keys, phi=self.phi, last_abs=self.last_abs,
+                     last=np.array([self.last_cycle, self.last_time]),
+                     sources=json.dumps(self.sources))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            if int(d["version"]) != CACHE_VERSION:
+                raise ValueError(f"{path} was written by another cache version")
+            state = cls(str(d["time_source"]))
+            state.keys, state.phi, state.last_abs = d["keys"], d["phi"], d["last_abs"]
+            state.last_cycle, state.last_time = int(d["last"][0]), float(d["last"][1])
+            state.sources = json.loads(str(d["sources"]))
+        return state
+
+def _read_summed(paths):
+    # worker side: (unique keys, summed flux) of each file
+    out = []
+    for path in paths:
+        table = read_flux_file(path)
+        out.append(sum_by_key(table.keys, table.flux))
+    return out
+
+def _new_times(run_dir, cycles, table, jobs):
+    # times of the given cycles only, from a read_time_table dict or else
+    # the iso_massf agej; NaN where there is none (yet)
+    if table is not None:
+        return np.array([table.get(c, np.nan) for c in cycles])
+    iso = {c: p for c, p, _ in list_snapshots(run_dir, "iso_massf")}
+    paths = [iso[c] for c in cycles if c in iso]
+    with timer("read_agej"):
+        ages = iter([a for part in map_chunks(agej_from_iso_files, paths, jobs) for a in part])
+    return np.array([next(ages) if c in iso else np.nan for c in cycles])
+
+def iter_flux_snapshots(run_dir, snapshots, time_table=None, jobs=1, batch=256):
+    # -> (snapshot, time, unique keys, flux) in cycle order without a cube:
+    # files are read batch at a time, so memory does not grow with the run.
+    # Stops before the first file without a time.
+    table = read_time_table(time_table) if time_table is not None else None
+    for i in range(0, len(snapshots), batch):
+        part = snapshots[i:i + batch]
+        times = _new_times(run_dir, [c for c, _, _ in part], table, jobs)
+        missing = np.flatnonzero(np.isnan(times))
+        if len(missing):
+            part, times = part[:missing[0]], times[:missing[0]]
+        tables = [r for chunk in map_chunks(_read_summed, [p for _, p, _ in part], jobs)
+                  for r in chunk]
+        for snapshot, t, (keys, flux) in zip(part, times, tables):
+            yield snapshot, t, keys, flux
+        if len(missing):
+            return
+
+def update_flux_integral(run_dir, time_table=None, restart=False, jobs=1, settle=5.0):
+    # -> (FluxIntegral, cycles added). Folds the flux files written since
+    # the last call into <run>/.flux_cache/integral.npz; only those files
+    # (and their iso_massf times) are read. The newest file is left out
+    # until it has gone settle seconds without a write (run_io
+    # complete_snapshots), and a file without a time yet ends the update, so
+    # it and everything after it are left for the next call.
+    run_dir = Path(run_dir)
+    path = run_dir / CACHE_DIR / INTEGRAL_FILE
+    time_source = "agej" if time_table is None else f"table:{Path(time_table).resolve()}"
+    snapshots = list_snapshots(run_dir, "flux")
+
+    state = None
+    if path.exists() and not restart:
+        try:
+            state = FluxIntegral.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] Ignoring unreadable checkpoint {path}: {e}")
+        if state is not None and not state.matches(snapshots, time_source):
+            print(f"[WARN] Flux files or time source changed since {path} was written, "
+                  f"integrating from the start")
+            state = None
+    if state is None:
+        state = FluxIntegral(time_source)
+
+    new = complete_snapshots([s for s in snapshots if s[0] > state.last_cycle], settle)
+    added = []
+    for snapshot, t, keys, flux in iter_flux_snapshots(run_dir, new, time_table, jobs):
+        state.add(snapshot[0], t, keys, flux, source_manifest([snapshot])[0])
+        added.append(snapshot[0])
+
+    if added or not path.exists():
+        try:
+            path.parent.mkdir(exist_ok=True)
+            state.save(path)
+        except OSError as e:
+            print(f"[WARN] Could not write checkpoint {path}: {e}")
+    return state, added
@@ -0,0 +1,423 @@
+import argparse
+import heapq
+import numpy as np
+from pathlib import Path
+from flux_io import (read_flux_file, sum_by_key, unpack_keys, reaction_names, ZA_to_label,
+                     label_to_ZA, text_table, A_BITS, REACTANT_SLOTS, PRODUCT_SLOTS)
+from flux_network import CSRMatrix, nuclide_code
+import profiling
+
+# Isotope -> isotope flow graph. Every reaction moves material from its
+# heaviest reactant to its heaviest product (C-12 + H-1 -> N-13 is the edge
+# C-12 -> N-13), or the other way when its flux is negative. The edge set
+# depends only on the network (the reaction keys), so FlowNetwork is built
+# once per run and turns any flux vector, or a whole [n_times x n_reactions]
+# cube, into edge weights with two sparse products. FlowGraph holds one set
+# of weights in CSR order and answers path, cycle and branching questions.
+
+# known cycles, used only to name the ones that are found
+KNOWN_CYCLES = {
+    "CNO": {"C-12", "N-13", "C-13", "N-14", "O-15", "N-15"},
+    "NeNa": {"Ne-20", "Na-21", "Ne-21", "Na-22", "Ne-22", "Na-23"},
+    "MgAl": {"Mg-24", "Al-25", "Mg-25", "Al-26", "Mg-26", "Al-27"},
+}
+
+def _heaviest(Z, A):
+    # [n, 2] slots of one side -> nuclide code of the heaviest (largest A,
+    # then Z) occupied slot, -1 if the side is empty
+    code = np.where(A > 0, nuclide_code(Z, A), -1)
+    pick = np.where((A[:, 1] > A[:, 0]) | ((A[:, 1] == A[:, 0]) & (Z[:, 1] > Z[:, 0])), 1, 0)
+    return code[np.arange(len(code)), pick]
+
+def node_label(code):
+    Z, A = int(code) >> A_BITS, int(code) & ((1 << A_BITS) - 1)
+    return ZA_to_label(Z, A) or ("n" if A == 1 else f"Z{Z}-{A}")
+
+class FlowNetwork:
+
+    def __init__(self, keys):
+        self.keys = np.asarray(keys, dtype=np.int64)
+        Z, A = unpack_keys(self.keys)
+        R, P = list(REACTANT_SLOTS), list(PRODUCT_SLOTS)
+        src = _heaviest(Z[:, R], A[:, R])
+        dst = _heaviest(Z[:, P], A[:, P])
+        ok = (src >= 0) & (dst >= 0) & (src != dst)
+
+        self.nodes = np.unique(np.concatenate([src[ok], dst[ok]]))
+        n = len(self.nodes)
+        s = np.searchsorted(self.nodes, src[ok])
+        d = np.searchsorted(self.nodes, dst[ok])
+        # forward (reactant -> product) and backward candidate edge of every
+        # reaction; sorting by src * n + dst gives CSR order directly
+        edges, inverse = np.unique(np.concatenate([s * n + d, d * n + s]), return_inverse=True)
+        inverse = inverse.ravel()
+        self.src, self.dst = edges // n, edges % n
+        self.indptr = np.searchsorted(self.src, np.arange(n + 1))
+
+        reactions = np.flatnonzero(ok)
+        m, n_r, n_e = len(reactions), len(self.keys), len(edges)
+        self.edge_fwd = np.full(n_r, -1)
+        self.edge_bwd = np.full(n_r, -1)
+        self.edge_fwd[reactions], self.edge_bwd[reactions] = inverse[:m], inverse[m:]
+        ones = np.ones(m)
+        self._fwd = CSRMatrix.from_coo(inverse[:m], reactions, ones, (n_e, n_r))
+        self._bwd = CSRMatrix.from_coo(inverse[m:], reactions, ones, (n_e, n_r))
+
+    @property
+    def n_nodes(self):
+        return len(self.nodes)
+
+    def labels(self):
+        return [node_label(c) for c in self.nodes]
+
+    def index(self, iso):
+        # KeyError for a nuclide outside the network and for a bad label alike
+        try:
+            code = nuclide_code(*label_to_ZA(iso))
+        except ValueError:
+            raise KeyError(iso) from None
+        i = np.searchsorted(self.nodes, code)
+        if i == len(self.nodes) or self.nodes[i] != code:
+            raise KeyError(iso)
+        return int(i)
+
+    def weights(self, flux):
+        # flux [n_reactions] or [n_times x n_reactions] -> edge flows
+        flux = np.asarray(flux)
+        return self._fwd.dot(np.maximum(flux, 0.0)) + self._bwd.dot(np.maximum(-flux, 0.0))
+
+    def graph(self, flux):
+        return FlowGraph(self, self.weights(flux), flux)
+
+    def edge_mask(self, nodes):
+        # -> (edges leaving the node set, of those the ones leaving it)
+        inside = np.zeros(self.n_nodes, dtype=bool)
+        inside[list(nodes)] = True
+        out = inside[self.src]
+        return out, out & ~inside[self.dst]
+
+class FlowGraph:
+
+    def __init__(self, network, w, flux=None):
+        self.net = network
+        self.w = w
+        self.flux = flux
+        self.out = np.bincount(network.src, weights=w, minlength=network.n_nodes)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.frac = np.where(w > 0, w / self.out[network.src], 0.0)
+            self.cost = np.where(w > 0, -np.log(self.frac), np.inf)
+        # plain lists for the Python-level searches
+        self._indptr = network.indptr.tolist()
+        self._dst = network.dst.tolist()
+        self._cost = self.cost.tolist()
+
+    def edge_reaction(self, e):
+        # name of the reaction carrying most of edge e
+        if self.flux is None:
+            return "-"
+        f = np.asarray(self.flux)
+        c = np.where(self.net.edge_fwd == e, f, 0.0) + np.where(self.net.edge_bwd == e, -f, 0.0)
+        j = int(np.argmax(c))
+        if c[j] <= 0:
+            return "-"
+        return reaction_names(*unpack_keys(self.net.keys[j:j + 1]))[0]
+
+    def branching(self, i):
+        # -> (edges out of node i, their fraction of its outflow), largest first
+        lo, hi = self._indptr[i], self._indptr[i + 1]
+        e = np.arange(lo, hi)[self.w[lo:hi] > 0]
+        e = e[np.argsort(-self.w[e], kind="stable")]
+        return e, self.frac[e]
+
+    def _shortest(self, source, target, banned_edges=(), banned_nodes=(), allowed=None):
+        # Dijkstra on cost = -log(branching fraction): the path that keeps the
+        # largest share of the material leaving source. -> (cost, [edges])
+        indptr, dst, cost = self._indptr, self._dst, self._cost
+        dist, prev = {source: 0.0}, {}
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u == target:
+                break
+            if d > dist[u]:
+                continue
+            for e in range(indptr[u], indptr[u + 1]):
+                c = cost[e]
+                v = dst[e]
+                if (c == np.inf or e in banned_edges or v in banned_nodes
+                        or (allowed is not None and v not in allowed)):
+                    continue
+                nd = d + c
+                if nd < dist.get(v, np.inf):
+                    dist[v], prev[v] = nd, e
+                    heapq.heappush(heap, (nd, v))
+        if target not in dist or (target == source):
+            return np.inf, []
+        path, v = [], target
+        while v != source:
+            e = prev[v]
+            path.append(e)
+            v = self.net.src[e]
+        return dist[target], path[::-1]
+
+    def best_paths(self, source, target, k=3):
+        # k loopless paths with the largest product of branching fractions
+        # (Yen's algorithm) -> [(fraction, [edges])]
+        c, p = self._shortest(source, target)
+        if not p:
+            return []
+        found, candidates = [(c, p)], []
+        src = self.net.src
+        while len(found) < k:
+            last = found[-1][1]
+            for i in range(len(last)):
+                root = last[:i]
+                spur = source if i == 0 else int(self.net.dst[root[-1]])
+                banned_edges = {q[i] for _, q in found if q[:i] == root and len(q) > i}
+                banned_nodes = {int(src[e]) for e in root}
+                c_spur, p_spur = self._shortest(spur, target, banned_edges, banned_nodes)
+                if not p_spur:
+                    continue
+                cand = root + p_spur
+                cost = sum(self._cost[e] for e in cand)
+                if all(cand != q for _, q in found) and all(cand != q for _, q in candidates):
+                    heapq.heappush(candidates, (cost, cand))
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates))
+        return [(float(np.exp(-c)), p) for c, p in found]
+
+    def components(self, min_frac):
+        # strongly connected components (Tarjan, iterative) of the edges that
+        # carry at least min_frac of their source's outflow; only those with
+        # more than one node, i.e. the ones that contain a cycle
+        keep = self.frac >= min_frac
+        indptr, dst = self._indptr, self._dst
+        keep = keep.tolist()
+        n = self.net.n_nodes
+        index, low, on_stack = [-1] * n, [0] * n, [False] * n
+        stack, comps, counter = [], [], 0
+        for root in range(n):
+            if index[root] >= 0:
+                continue
+            work = [(root, indptr[root])]
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            while work:
+                u, e = work[-1]
+                if e < indptr[u + 1]:
+                    work[-1] = (u, e + 1)
+                    if not keep[e]:
+                        continue
+                    v = dst[e]
+                    if index[v] < 0:
+                        index[v] = low[v] = counter
+                        counter += 1
+                        stack.append(v)
+                        on_stack[v] = True
+                        work.append((v, indptr[v]))
+                    elif on_stack[v]:
+                        low[u] = min(low[u], index[v])
+                    continue
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[u])
+                if low[u] == index[u]:
+                    comp = []
+                    while True:
+                        v = stack.pop()
+                        on_stack[v] = False
+                        comp.append(v)
+                        if v == u:
+                            break
+                    if len(comp) > 1:
+                        comps.append(comp)
+        return comps
+
+    def cycles(self, min_frac=0.01):
+        # one entry per cycling region: its dominant loop through the node
+        # with the largest outflow, the loop's return fraction and bottleneck
+        # flow, and how much of the region's outflow breaks out of it
+        found = []
+        for comp in self.components(min_frac):
+            members = set(comp)
+            root = max(comp, key=lambda i: self.out[i])
+            best = (np.inf, [])
+            for e in np.flatnonzero((self.net.dst == root) & (self.frac >= min_frac)):
+                p = int(self.net.src[e])
+                if p not in members:
+                    continue
+                c, path = (0.0, []) if p == root else self._shortest(root, p, allowed=members)
+                if (path or p == root) and c + self._cost[e] < best[0]:
+                    best = (c + self._cost[e], path + [int(e)])
+            leaving, breakout = self.net.edge_mask(comp)
+            total = self.w[leaving].sum()
+            exits = np.flatnonzero(breakout & (self.w > 0))
+            exits = exits[np.argsort(-self.w[exits], kind="stable")]
+            loop = best[1]
+            found.append({
+                "name": self.name_cycle(comp),
+                "nodes": comp,
+                "loop": loop,
+                "return_frac": float(np.exp(-best[0])) if loop else 0.0,
+                "bottleneck": float(self.w[loop].min()) if loop else 0.0,
+                "breakout": float(self.w[exits].sum() / total) if total > 0 else 0.0,
+                "exits": [(int(e), float(self.w[e] / total)) for e in exits],
+            })
+        found.sort(key=lambda c: -c["bottleneck"])
+        return found
+
+    def name_cycle(self, comp):
+        labels = {node_label(self.net.nodes[i]) for i in comp}
+        for name, known in KNOWN_CYCLES.items():
+            if len(labels & known) >= 3:
+                return name
+        return "cycle"
+
+    def path_str(self, path):
+        if not path:
+            return "-"
+        names = [node_label(self.net.nodes[self.net.src[path[0]]])]
+        names += [node_label(self.net.nodes[self.net.dst[e]]) for e in path]
+        return " -> ".join(names)
+
+def load_flux(args):
+    # -> (keys, flux, description) for --file, or the run's integrated flow for --run
+    if args.file:
+        table = read_flux_file(Path(args.file))
+        keys, flux = sum_by_key(table.keys, table.flux)
+        return keys, flux, Path(args.file).name
+    from flux_cache import load_flux_cube, snapshot_times, trapezoid_weights
+    cube = load_flux_cube(Path(args.run), jobs=args.jobs)
+    times = snapshot_times(cube, args.times, jobs=args.jobs)
+    if np.isnan(times).any():
+        raise RuntimeError("Missing agej times for some flux files; pass --times cycle,time CSV")
+    # signed integral: a reaction that runs backwards part of the time nets out
+    return cube.keys, trapezoid_weights(times) @ np.asarray(cube.flux), \
+        f"{Path(args.run).name} (integrated)"
+
+def time_series(args, net, paths, cycles):
+    # every snapshot of the run: breakout fraction of each cycle found in the
+    # integrated graph (one vectorized pass) and the best path per snapshot
+    from flux_cache import load_flux_cube, snapshot_times
+    cube = load_flux_cube(Path(args.run), jobs=args.jobs)
+    times = snapshot_times(cube, args.times, jobs=args.jobs)
+    flux = np.asarray(cube.flux)
+    with profiling.timer("edge_weights"):
+        W = net.weights(flux)                           # [n_times x n_edges]
+
+    columns = {"cycle": [str(c) for c in cube.cycles], "time": [f"{t:.4e}" for t in times]}
+    for k, cyc in enumerate(cycles):
+        leaving, breakout = net.edge_mask(cyc["nodes"])
+        total = W[:, leaving].sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.where(total > 0, W[:, breakout].sum(axis=1) / total, np.nan)
+        columns[f"{cyc['name']}{k}_breakout"] = [f"{v:.4f}" for v in frac]
+    if paths:
+        a, b = paths
+        best, share = [], []
+        with profiling.timer("paths"):
+            for i in range(len(times)):
+                g = FlowGraph(net, W[i])
+                p = g.best_paths(a, b, k=1)
+                share.append(f"{p[0][0]:.3e}" if p else "-")
+                best.append(g.path_str(p[0][1]) if p else "-")
+        columns["path_frac"], columns["best_path"] = share, best
+    return columns
+
+def main():
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--file", help="one flux_XXXXX.DAT snapshot")
+    src.add_argument("--run", help="run directory: graph of the time-integrated flow")
+    ap.add_argument("--path", nargs=2, metavar=("FROM", "TO"), default=None,
+                    help="dominant paths between two nuclides, e.g. C-12 Si-28")
+    ap.add_argument("--k", type=int, default=3, help="number of paths")
+    ap.add_argument("--cycles", action="store_true", help="find cycles (CNO, NeNa, MgAl, ...)")
+    ap.add_argument("--min-frac", type=float, default=0.01,
+                    help="cycles: ignore edges carrying less than this share of their "
+                         "source's outflow")
+    ap.add_argument("--branch", nargs="+", default=[], help="branching ratios out of these nuclides")
+    ap.add_argument("--top", type=int, default=5, help="rows per branching/breakout list")
+    ap.add_argument("--per-snapshot", action="store_true",
+                    help="with --run: breakout fractions and best path at every snapshot")
+    ap.add_argument("--csv", default=None, help="--per-snapshot table as CSV")
+    ap.add_argument("--times", default=None, help="CSV with columns cycle,time")
+    ap.add_argument("--jobs", type=int, default=1)
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+    if args.per_snapshot and not args.run:
+        ap.error("--per-snapshot needs --run")
+    if not (args.path or args.cycles or args.branch):
+        ap.error("give at least one of --path, --cycles, --branch")
+
+    keys, flux, what = load_flux(args)
+    with profiling.timer("flow_network"):
+        net = FlowNetwork(keys)
+        g = net.graph(flux)
+    print(f"\n=== Flow graph of {what}: {net.n_nodes} nuclides, "
+          f"{int((g.w > 0).sum())} edges with flow ===")
+
+    paths = None
+    if args.path:
+        try:
+            paths = (net.index(args.path[0]), net.index(args.path[1]))
+        except KeyError as e:
+            raise SystemExit(f"[FAIL] {e.args[0]} is not in the network")
+        found = g.best_paths(*paths, k=args.k)
+        print(f"\n--- {args.k} dominant paths {args.path[0]} -> {args.path[1]} "
+              f"(share of the material leaving {args.path[0]}) ---")
+        if not found:
+            print("  no path with flow")
+        for share, p in found:
+            print(f"  {share:.3e}  {g.path_str(p)}")
+
+    for iso in args.branch:
+        try:
+            i = net.index(iso)
+        except KeyError:
+            print(f"[WARN] {iso} is not in the network")
+            continue
+        e, frac = g.branching(i)
+        print(f"\n--- Branching out of {iso} (outflow {g.out[i]:.3e}) ---")
+        print(text_table({
+            "fraction": [f"{v:.4f}" for v in frac[:args.top]],
+            "to": [node_label(net.nodes[net.dst[x]]) for x in e[:args.top]],
+            "via": [g.edge_reaction(x) for x in e[:args.top]],
+        }))
+
+    cycles = []
+    if args.cycles:
+        with profiling.timer("cycles"):
+            cycles = g.cycles(args.min_frac)
+        print(f"\n--- Cycles (edges >= {args.min_frac:g} of their source's outflow) ---")
+        if not cycles:
+            print("  none")
+        for cyc in cycles:
+            print(f"\n{cyc['name']}: {len(cyc['nodes'])} nuclides, loop {g.path_str(cyc['loop'])}")
+            print(f"  return fraction {cyc['return_frac']:.4f}, bottleneck flow "
+                  f"{cyc['bottleneck']:.3e}, breakout {cyc['breakout']:.4f}")
+            exits = cyc["exits"][:args.top]
+            if exits:
+                print(text_table({
+                    "  share": [f"{s:.4f}" for _, s in exits],
+                    "breakout": [f"{node_label(net.nodes[net.src[e]])} -> "
+                                 f"{node_label(net.nodes[net.dst[e]])}" for e, _ in exits],
+                    "via": [g.edge_reaction(e) for e, _ in exits],
+                }))
+
+    if args.per_snapshot:
+        columns = time_series(args, net, paths, cycles)
+        print("\n--- Per snapshot ---")
+        print(text_table(columns))
+        if args.csv:
+            with open(args.csv, "w") as f:
+                f.write(",".join(columns) + "\n")
+                f.writelines(",".join(row) + "\n" for row in zip(*columns.values()))
+            print(f"\n[OK] Wrote {args.csv}")
+
+if __name__ == "__main__":
+    main()
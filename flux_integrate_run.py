@@ -1,41 +1,11 @@
 import argparse
 import numpy as np
-import pandas as pd
-import re
-import matplotlib.pyplot as plt
 from pathlib import Path
-from collections import defaultdict
-
-elements = {
-    1:"H", 2:"He", 3:"Li", 4:"Be", 5:"B", 6:"C",
-    7:"N", 8:"O", 9:"F", 10:"Ne", 11:"Na", 12:"Mg",
-    13:"Al", 14:"Si", 15:"P", 16:"S", 17:"Cl", 18:"Ar",
-    19:"K", 20:"Ca"
-}
-
-def ZA_to_label(Z, A):
-    if Z == 0:
-        return None
-    return f"{elements.get(Z, f'Z{Z}')}-{A}"
-
-def parse_flux_file(path):
-    data = np.loadtxt(path)
-    reactions = {}
-
-    for row in data:
-        Z1,A1,Z3,A3,Z5,A5,Z7,A7 = map(int, row[1:9])
-        flux = float(row[9])
-
-        reactants = [ZA_to_label(Z1,A1), ZA_to_label(Z3,A3)]
-        products  = [ZA_to_label(Z5,A5), ZA_to_label(Z7,A7)]
-
-        reactants = [x for x in reactants if x]
-        products  = [x for x in products if x]
-
-        rxn = " + ".join(reactants) + " -> " + " + ".join(products)
-        reactions[rxn] = abs(flux)
-
-    return reactions
+from flux_cache import (load_flux_cube, snapshot_times, trapezoid_weights, update_flux_integral,
+                        iter_flux_snapshots)
+from run_io import list_snapshots, complete_snapshots
+from flux_io import reaction_names, unpack_keys, text_table
+import profiling
 
 def main():
     ap = argparse.ArgumentParser()
@@ -43,53 +13,137 @@ def main():
     ap.add_argument("--top", type=int, default=25)
     ap.add_argument("--csv", default=None)
     ap.add_argument("--plot", action="store_true")
+    ap.add_argument("--times", default=None,
+                    help="CSV with columns cycle,time (default: agej from iso_massf*.DAT)")
+    ap.add_argument("--rebuild-cache", action="store_true",
+                    help="Reparse all flux files even if the cache is current")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="Worker processes for parsing flux files")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only read flux files written since the last --incremental call "
+                         "(checkpoint in <run>/.flux_cache/integral.npz); for runs in progress")
+    ap.add_argument("--restart", action="store_true",
+                    help="with --incremental: drop the checkpoint and start over")
+    ap.add_argument("--stream", action="store_true",
+                    help="one pass over the flux files in fixed memory, without the flux "
+                         "cache; also ranks by peak |flux| and by dominance count")
+    ap.add_argument("--settle", type=float, default=5.0,
+                    help="with --incremental/--stream: seconds without a write before the "
+                         "newest flux file counts as complete")
+    profiling.add_argument(ap)
     args = ap.parse_args()
+    profiling.start(args.profile)
 
     run_path = Path(args.run)
-    flux_files = sorted(run_path.glob("flux_*.DAT"))
-
-    if not flux_files:
-        raise RuntimeError("No flux_*.DAT files found.")
-
-    integrated_flux = defaultdict(float)
-
-    for f in flux_files:
-        reactions = parse_flux_file(f)
-
-        for rxn, flux in reactions.items():
-            integrated_flux[rxn] += flux
-
-    df = pd.DataFrame({
-        "reaction": list(integrated_flux.keys()),
-        "integrated_flux": list(integrated_flux.values())
-    })
-
-    df["log10_integrated_flux"] = np.log10(
-        np.maximum(df["integrated_flux"], 1e-300)
-    )
-
-    df = df.sort_values("integrated_flux", ascending=False)
+    if args.restart and not args.incremental:
+        ap.error("--restart only applies to --incremental")
+    if args.stream and args.incremental:
+        ap.error("--stream and --incremental are separate modes")
+
+    if args.stream:
+        from flux_topk import StreamingRanker
+
+        ranker = StreamingRanker(args.top)
+        with profiling.timer("stream"):
+            listed = list_snapshots(run_path, "flux")
+            snapshots = complete_snapshots(listed, args.settle)
+            if len(snapshots) < len(listed):
+                print(f"[WARN] Leaving out {listed[-1][1].name}, still being written")
+            for (cycle, _, _), t, keys, flux in iter_flux_snapshots(run_path, snapshots,
+                                                                      args.times, args.jobs):
+                ranker.add(cycle, t, keys, flux)
+        if ranker.n_snapshots < len(snapshots):
+            raise RuntimeError(
+                f"No time for flux file {snapshots[ranker.n_snapshots][1].name}; "
+                f"pass --times cycle,time CSV"
+            )
+        all_keys, integrated_flux = ranker.integral.keys, ranker.integral.phi
+    elif args.incremental:
+        state, added = update_flux_integral(run_path, args.times, restart=args.restart,
+                                            jobs=args.jobs, settle=args.settle)
+        if state.last_cycle < 0:
+            raise RuntimeError(f"No flux files with a known time in {run_path} yet")
+        span = f"cycles {added[0]}-{added[-1]}" if added else "no new cycles"
+        print(f"[OK] {len(added)} new flux files ({span}); "
+              f"integrated up to cycle {state.last_cycle}, t = {state.last_time:.6e}")
+        all_keys, integrated_flux = state.keys, state.phi
+    else:
+        cube = load_flux_cube(run_path, rebuild=args.rebuild_cache, jobs=args.jobs)
+
+        times = snapshot_times(cube, args.times, jobs=args.jobs)
+        missing = np.isnan(times)
+        if missing.any():
+            raise RuntimeError(
+                f"No time for {missing.sum()} of {len(times)} flux files "
+                f"(e.g. cycle {cube.cycles[missing][0]}); pass --times cycle,time CSV"
+            )
+
+        # phi_j = integral |F_j| dt, trapezoid rule over all reactions at once
+        with profiling.timer("integrate"):
+            integrated_flux = trapezoid_weights(times) @ np.abs(cube.flux)
+        all_keys = cube.keys
+
+    if args.stream and not args.csv:
+        # the k largest integrals from a heap instead of a sort of the network
+        order = np.searchsorted(all_keys, [k for k, _, _ in ranker.top_integrated()])
+    else:
+        order = np.argsort(-integrated_flux, kind="stable")
+
+    # reaction names only for the rows that are shown or written
+    shown = len(order) if args.csv else args.top
+    order = order[:shown]
+    keys = all_keys[order]
+    integrated_flux = integrated_flux[order]
+    log10_flux = np.log10(np.maximum(integrated_flux, 1e-300))
+    reactions = reaction_names(*unpack_keys(keys))
 
     print(f"\n=== Top {args.top} reactions by integrated flow ===\n")
-    print(df.head(args.top)[
-        ["log10_integrated_flux", "reaction"]
-    ].to_string(index=False))
+    print(text_table({
+        "log10_integrated_flux": [f"{v:.6f}" for v in log10_flux[:args.top]],
+        "reaction": list(reactions[:args.top]),
+    }))
+
+    if args.stream:
+        peak = ranker.top_peak()
+        print(f"\n=== Top {args.top} reactions by peak |flux| ===\n")
+        print(text_table({
+            "log10_peak_flux": [f"{np.log10(max(v, 1e-300)):.6f}" for _, v, _ in peak],
+            "cycle": [str(c) for _, _, (c, _) in peak],
+            "time": [f"{t:.4e}" for _, _, (_, t) in peak],
+            "reaction": list(reaction_names(*unpack_keys([k for k, _, _ in peak]))),
+        }))
+        dominant = ranker.top_dominance()
+        print(f"\n=== Reactions with the largest |flux| most often "
+              f"({ranker.n_snapshots} snapshots) ===\n")
+        print(text_table({
+            "snapshots": [str(c) if not e else f"{c - e}-{c}" for _, c, e in dominant],
+            "share": [f"{c / ranker.n_snapshots:.3f}" for _, c, _ in dominant],
+            "reaction": list(reaction_names(*unpack_keys([k for k, _, _ in dominant]))),
+        }))
 
     if args.csv:
-        df.to_csv(args.csv, index=False)
+        import pandas as pd
+
+        pd.DataFrame({
+            "reaction": reactions,
+            "integrated_flux": integrated_flux,
+            "log10_integrated_flux": log10_flux,
+            "key": keys,
+        }).to_csv(args.csv, index=False)
         print(f"\n[OK] Wrote {args.csv}")
 
     if args.plot:
-        top_df = df.head(args.top)
+        import matplotlib.pyplot as plt
 
         plt.figure(figsize=(8,6))
         plt.barh(
-            top_df["reaction"][::-1],
-            top_df["log10_integrated_flux"][::-1]
+            reactions[:args.top][::-1],
+            log10_flux[:args.top][::-1]
         )
         plt.xlabel("log10 Integrated |Flux|")
         plt.title(f"Integrated reaction flow\n{run_path.name}")
-        plt.tight_layout()
+        with profiling.timer("plot"):
+            plt.tight_layout()
         plt.show()
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+import re
+import warnings
+import numpy as np
+from profiling import timer, count, count_file
+
+elements = {
+    1:"H", 2:"He", 3:"Li", 4:"Be", 5:"B", 6:"C",
+    7:"N", 8:"O", 9:"F", 10:"Ne", 11:"Na", 12:"Mg",
+    13:"Al", 14:"Si", 15:"P", 16:"S", 17:"Cl", 18:"Ar",
+    19:"K", 20:"Ca", 21:"Sc", 22:"Ti", 23:"V", 24:"Cr",
+    25:"Mn", 26:"Fe", 27:"Co", 28:"Ni", 29:"Cu", 30:"Zn",
+    31:"Ga", 32:"Ge", 33:"As", 34:"Se", 35:"Br", 36:"Kr",
+    37:"Rb", 38:"Sr", 39:"Y", 40:"Zr", 41:"Nb", 42:"Mo",
+    43:"Tc", 44:"Ru", 45:"Rh", 46:"Pd", 47:"Ag", 48:"Cd",
+    49:"In", 50:"Sn", 51:"Sb", 52:"Te", 53:"I", 54:"Xe",
+    55:"Cs", 56:"Ba", 57:"La", 58:"Ce", 59:"Pr", 60:"Nd",
+    61:"Pm", 62:"Sm", 63:"Eu", 64:"Gd", 65:"Tb", 66:"Dy",
+    67:"Ho", 68:"Er", 69:"Tm", 70:"Yb", 71:"Lu", 72:"Hf",
+    73:"Ta", 74:"W", 75:"Re", 76:"Os", 77:"Ir", 78:"Pt",
+    79:"Au", 80:"Hg", 81:"Tl", 82:"Pb", 83:"Bi", 84:"Po",
+    85:"At", 86:"Rn", 87:"Fr", 88:"Ra", 89:"Ac", 90:"Th",
+    91:"Pa", 92:"U"
+}
+symbols = {el.upper(): Z for Z, el in elements.items()}
+symbols.update({"PROT": 1, "NEUT": 0})
+
+# flux_XXXXX.DAT columns: idx, Z1,A1,Z3,A3,Z5,A5,Z7,A7, flux, energy, timescale
+ZA_COLS = slice(1, 9)
+FLUX_COL = 9
+ENERGY_COL = 10
+TIMESCALE_COL = 11
+
+# slots 0,1 are the entrance channel, 2,3 the exit channel
+REACTANT_SLOTS = (0, 1)
+PRODUCT_SLOTS = (2, 3)
+
+# packed reaction key: 7 bits of Z and 8 bits of A per slot, slot 0 in the
+# highest bits, 60 bits in total so keys stay positive int64 and sort by
+# entrance channel first
+Z_BITS = 7
+A_BITS = 8
+SLOT_BITS = Z_BITS + A_BITS
+
+def ZA_to_label(Z, A):
+    if Z == 0:
+        return None
+    return f"{elements.get(Z, f'Z{Z}')}-{A}"
+
+def label_to_ZA(label):
+    # "O-15", "o15", "Z23-51" -> (Z, A)
+    m = re.fullmatch(r"\s*([A-Za-z]+|Z\d+)-?(\d+)\s*", label)
+    if not m:
+        raise ValueError(f"Cannot parse isotope label {label!r}")
+    el, A = m.groups()
+    if el.upper() in symbols:
+        Z = symbols[el.upper()]
+    elif re.fullmatch(r"Z\d+", el):
+        Z = int(el[1:])
+    else:
+        raise ValueError(f"Unknown element in isotope label {label!r}")
+    return Z, int(A)
+
+def involves(Z, A, iso, slots=(0, 1, 2, 3)):
+    # rows of an [n, 4] Z/A pair with iso in any of the given slots
+    z, a = label_to_ZA(iso)
+    slots = list(slots)
+    return ((Z[:, slots] == z) & (A[:, slots] == a)).any(axis=1)
+
+def pack_keys(Z, A):
+    # [n, 4] Z and A -> [n] int64
+    Z = np.asarray(Z, dtype=np.int64)
+    A = np.asarray(A, dtype=np.int64)
+    if Z.size and (Z.min() < 0 or Z.max() >= 1 << Z_BITS
+                   or A.min() < 0 or A.max() >= 1 << A_BITS):
+        raise ValueError("Z or A out of range for packed reaction keys")
+    keys = np.zeros(Z.shape[0], dtype=np.int64)
+    for slot in range(4):
+        keys = (keys << SLOT_BITS) | (Z[:, slot] << A_BITS) | A[:, slot]
+    return keys
+
+def unpack_keys(keys):
+    # [n] int64 -> [n, 4] Z and A
+    keys = np.asarray(keys, dtype=np.int64)
+    Z = np.empty((len(keys), 4), dtype=np.int64)
+    A = np.empty((len(keys), 4), dtype=np.int64)
+    for slot in range(4):
+        shift = SLOT_BITS * (3 - slot)
+        A[:, slot] = (keys >> shift) & ((1 << A_BITS) - 1)
+        Z[:, slot] = (keys >> (shift + A_BITS)) & ((1 << Z_BITS) - 1)
+    return Z, A
+
+def parse_reaction(reaction):
+    # "O-15 + He-4 -> Ne-19" -> packed key; channels fill slots in order
+    try:
+        lhs, rhs = reaction.split("->")
+    except ValueError:
+        raise ValueError(f"Cannot parse reaction {reaction!r}") from None
+    Z = np.zeros((1, 4), dtype=np.int64)
+    A = np.zeros((1, 4), dtype=np.int64)
+    for base, side in ((0, lhs), (2, rhs)):
+        labels = [x for x in side.split("+") if x.strip()]
+        if len(labels) > 2:
+            raise ValueError(f"More than two nuclides in a channel: {reaction!r}")
+        for k, label in enumerate(labels):
+            Z[0, base + k], A[0, base + k] = label_to_ZA(label)
+    return pack_keys(Z, A)[0]
+
+def sum_by_key(keys, values):
+    # -> sorted unique keys and the summed values of repeated keys
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    return uniq, np.bincount(inverse.ravel(), weights=values, minlength=len(uniq))
+
+def nuclide_labels(Z, A):
+    # label every unique (Z, A) once, then broadcast back; Z == 0 -> ""
+    Z = np.asarray(Z, dtype=np.int64)
+    A = np.asarray(A, dtype=np.int64)
+    codes, inverse = np.unique(Z * 1000 + A, return_inverse=True)
+    table = np.array(
+        [ZA_to_label(int(c // 1000), int(c % 1000)) or "" for c in codes],
+        dtype=object,
+    )
+    return table[inverse].reshape(Z.shape)
+
+def join_labels(a, b, sep=" + "):
+    # elementwise " + ".join of the non-empty labels in a and b
+    both = a + sep + b
+    return np.where(a == "", b, np.where(b == "", a, both))
+
+def reaction_names(Z, A):
+    lab = nuclide_labels(Z, A)
+    return (join_labels(lab[:, 0], lab[:, 1]) + " -> "
+            + join_labels(lab[:, 2], lab[:, 3]))
+
+def text_table(columns):
+    # {header: [str]} -> right-aligned columns like
+    # DataFrame.to_string(index=False), for text output without pandas
+    widths = [max([len(h)] + [len(v) for v in vals]) for h, vals in columns.items()]
+    lines = [" ".join(h.rjust(w) for h, w in zip(columns, widths))]
+    for row in zip(*columns.values()):
+        lines.append(" ".join(v.rjust(w) for v, w in zip(row, widths)))
+    return "\n".join(lines)
+
+class FluxTable:
+    # Columnar view of one flux file. Z and A are [n, 4] int arrays in slot
+    # order (reactant, reactant, product, product); strings are only built
+    # when asked for, and only for the rows currently selected.
+
+    def __init__(self, Z, A, flux, energy, timescale):
+        self.Z = Z
+        self.A = A
+        self.flux = flux
+        self.energy = energy
+        self.timescale = timescale
+
+    def __len__(self):
+        return len(self.flux)
+
+    @property
+    def abs_flux(self):
+        return np.abs(self.flux)
+
+    @property
+    def log10_abs_flux(self):
+        with np.errstate(divide="ignore"):
+            return np.log10(self.abs_flux)
+
+    def select(self, idx):
+        return FluxTable(self.Z[idx], self.A[idx], self.flux[idx],
+                         self.energy[idx], self.timescale[idx])
+
+    def threshold(self, min_flux):
+        return self.select(self.abs_flux >= min_flux)
+
+    def top(self, n):
+        # partial selection of the n largest, then only those n are sorted
+        a = self.abs_flux
+        idx = np.argpartition(-a, n - 1)[:n] if 0 < n < len(a) else np.arange(len(a))[:max(n, 0)]
+        return self.select(idx[np.argsort(-a[idx], kind="stable")])
+
+    @property
+    def keys(self):
+        return pack_keys(self.Z, self.A)
+
+    def involves(self, iso, slots):
+        return involves(self.Z, self.A, iso, slots)
+
+    def labels(self):
+        return nuclide_labels(self.Z, self.A)
+
+    def reactants_str(self):
+        lab = self.labels()
+        return join_labels(lab[:, 0], lab[:, 1])
+
+    def products_str(self):
+        lab = self.labels()
+        return join_labels(lab[:, 2], lab[:, 3])
+
+    def reactions(self):
+        return reaction_names(self.Z, self.A)
+
+    def to_text(self):
+        return text_table({
+            "log10_abs_flux": [f"{v:.6f}" for v in self.log10_abs_flux],
+            "flux": [f"{v:.6e}" for v in self.flux],
+            "reaction": list(self.reactions()),
+        })
+
+    def to_frame(self):
+        import pandas as pd
+
+        lab = self.labels()
+        reactants = join_labels(lab[:, 0], lab[:, 1])
+        products = join_labels(lab[:, 2], lab[:, 3])
+        return pd.DataFrame({
+            "reaction": reactants + " -> " + products,
+            "flux": self.flux,
+            "abs_flux": self.abs_flux,
+            "log10_abs_flux": self.log10_abs_flux,
+            "reactants": reactants,
+            "products": products,
+        })
+
+def read_flux_file(path, min_flux=None) -> FluxTable:
+    count_file(path)
+    with timer("loadtxt"):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)    # "Empty input file"
+            data = np.loadtxt(path, ndmin=2)
+    if data.size == 0 or data.shape[1] <= FLUX_COL:
+        # no complete rows, e.g. a file a running PPN job has just opened
+        data = np.empty((0, TIMESCALE_COL + 1))
+    count("rows_read", len(data))
+    ZA = data[:, ZA_COLS].astype(np.int64)
+    ncol = data.shape[1]
+    nan = np.full(len(data), np.nan)
+
+    table = FluxTable(
+        Z=ZA[:, 0::2],
+        A=ZA[:, 1::2],
+        flux=data[:, FLUX_COL],
+        energy=data[:, ENERGY_COL] if ncol > ENERGY_COL else nan,
+        timescale=data[:, TIMESCALE_COL] if ncol > TIMESCALE_COL else nan,
+    )
+    if min_flux is not None:
+        table = table.threshold(min_flux)
+        count("rows_kept", len(table))
+    return table
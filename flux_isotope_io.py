@@ -1,78 +1,92 @@
 import argparse
-import numpy as np
-import pandas as pd
 from pathlib import Path
+import numpy as np
+from flux_io import read_flux_file, text_table
+from flux_network import build_stoich_matrix
+import profiling
 
-elements = {
-    1:"H", 2:"He", 3:"Li", 4:"Be", 5:"B", 6:"C",
-    7:"N", 8:"O", 9:"F", 10:"Ne", 11:"Na", 12:"Mg",
-    13:"Al", 14:"Si", 15:"P", 16:"S", 17:"Cl", 18:"Ar",
-    19:"K", 20:"Ca"
-}
-
-def ZA_to_label(Z, A):
-    if Z == 0:
-        return None
-    return f"{elements.get(Z, f'Z{Z}')}-{A}"
-
-def parse_flux_file(path: Path, min_flux=1e-30) -> pd.DataFrame:
-    data = np.loadtxt(path)
-    rows = []
-    for row in data:
-        # columns: idx, Z1,A1,Z3,A3,Z5,A5,Z7,A7, flux, energy, timescale
-        Z1, A1, Z3, A3, Z5, A5, Z7, A7 = map(int, row[1:9])
-        flux = float(row[9])
-
-        if abs(flux) < min_flux:
-            continue
-
-        reactants = [ZA_to_label(Z1, A1), ZA_to_label(Z3, A3)]
-        products  = [ZA_to_label(Z5, A5), ZA_to_label(Z7, A7)]
-        reactants = [x for x in reactants if x]
-        products  = [x for x in products if x]
-
-        rxn = " + ".join(reactants) + " -> " + " + ".join(products)
-
-        rows.append({
-            "reaction": rxn,
-            "flux": flux,
-            "abs_flux": abs(flux),
-            "log10_abs_flux": np.log10(abs(flux)),
-            "reactants": reactants,
-            "products": products,
-            "reactants_str": " + ".join(reactants),
-            "products_str": " + ".join(products),
-        })
-    return pd.DataFrame(rows)
-
-def pretty_print(df: pd.DataFrame, title: str, top: int):
-    if df.empty:
+def pretty_print(table, title: str, top: int):
+    if len(table) == 0:
         print(f"\n{title}\n  (none above threshold)\n")
         return
-    df = df.sort_values("abs_flux", ascending=False).head(top)
     print(f"\n{title}\n")
-    print(df[["log10_abs_flux", "flux", "reaction"]].to_string(index=False))
+    print(table.top(top).to_text())
+
+def write_csv(columns, path):
+    import pandas as pd
+
+    pd.DataFrame(columns).to_csv(path, index=False)
+
+def isotope_balance(net, flux) -> dict:
+    # one sparse mat-vec each for production and destruction of every
+    # isotope; {column: array}, so text output needs no pandas
+    production = net.production(flux)
+    destruction = net.destruction(flux)
+    return {
+        "isotope": net.labels(),
+        "Z": net.Z,
+        "A": net.A,
+        "production": production,
+        "destruction": destruction,
+        "net": production - destruction,
+    }
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--file", required=True, help="path to flux_XXXXX.DAT")
-    ap.add_argument("--iso", required=True, help="e.g. O-15, F-19")
+    ap.add_argument("--iso", default=None, help="e.g. O-15, F-19")
+    ap.add_argument("--all", action="store_true",
+                    help="production/destruction/net dY/dt table for every isotope")
     ap.add_argument("--top", type=int, default=25)
     ap.add_argument("--min-flux", type=float, default=1e-30)
     ap.add_argument("--csvdir", default=None, help="optional directory to write CSV tables")
+    profiling.add_argument(ap)
     args = ap.parse_args()
+    profiling.start(args.profile)
+    if not args.iso and not args.all:
+        ap.error("give --iso and/or --all")
 
     path = Path(args.file)
-    df = parse_flux_file(path, min_flux=args.min_flux)
+    table = read_flux_file(path, min_flux=args.min_flux)
 
-    if df.empty:
+    if len(table) == 0:
         print("No reactions passed the flux threshold.")
         return
 
+    net = build_stoich_matrix(table.keys)
+
+    if args.all:
+        with profiling.timer("isotope_balance"):
+            balance = isotope_balance(net, table.flux)
+        order = np.argsort(-np.abs(balance["net"]), kind="stable")
+        balance = {k: np.asarray(v)[order] for k, v in balance.items()}
+        print(f"\n=== Isotope balance (top {args.top} by |net dY/dt|) ===\n")
+        print(text_table({
+            "isotope": list(balance["isotope"][:args.top]),
+            **{k: [f"{v:.6e}" for v in balance[k][:args.top]]
+               for k in ("production", "destruction", "net")},
+        }))
+
+        if args.csvdir:
+            outdir = Path(args.csvdir)
+            outdir.mkdir(parents=True, exist_ok=True)
+            bal_csv = outdir / f"isotope_balance_{path.name}.csv"
+            write_csv(balance, bal_csv)
+            print(f"\n[OK] Wrote {bal_csv}")
+
+    if not args.iso:
+        return
+
     iso = args.iso
 
-    producers = df[df["products"].apply(lambda lst: iso in lst)].copy()
-    destroyers = df[df["reactants"].apply(lambda lst: iso in lst)].copy()
+    # row slices of the stoichiometric matrix
+    try:
+        prod_idx, dest_idx = net.producers(iso), net.destroyers(iso)
+    except KeyError:
+        prod_idx = dest_idx = np.empty(0, dtype=np.int64)
+
+    producers = table.select(prod_idx)
+    destroyers = table.select(dest_idx)
 
     # Separate by sign can be useful, but keep simple for now:
     # flux sign conventions can be subtle depending on implementation.
@@ -86,8 +100,8 @@ def main():
         prod_csv = outdir / f"{iso}_producers_{path.name}.csv"
         dest_csv = outdir / f"{iso}_destroyers_{path.name}.csv"
 
-        producers.sort_values("abs_flux", ascending=False).to_csv(prod_csv, index=False)
-        destroyers.sort_values("abs_flux", ascending=False).to_csv(dest_csv, index=False)
+        producers.top(len(producers)).to_frame().to_csv(prod_csv, index=False)
+        destroyers.top(len(destroyers)).to_frame().to_csv(dest_csv, index=False)
 
         print(f"\n[OK] Wrote {prod_csv}")
         print(f"[OK] Wrote {dest_csv}")
@@ -0,0 +1,113 @@
+import numpy as np
+from profiling import timer
+from flux_io import ZA_to_label, label_to_ZA, unpack_keys, A_BITS, REACTANT_SLOTS, PRODUCT_SLOTS
+
+def nuclide_code(Z, A):
+    return (np.asarray(Z, dtype=np.int64) << A_BITS) | np.asarray(A, dtype=np.int64)
+
+class CSRMatrix:
+    # Minimal compressed-sparse-row matrix: enough for row slices and
+    # products with one flux vector or a [n_timesteps x n_reactions] matrix.
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = shape
+
+    @classmethod
+    def from_coo(cls, rows, cols, vals, shape):
+        # duplicates (e.g. He-4 + He-4) are summed
+        order = np.lexsort((cols, rows))
+        rows, cols, vals = rows[order], cols[order], vals[order]
+        if len(rows):
+            new = np.ones(len(rows), dtype=bool)
+            new[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            starts = np.flatnonzero(new)
+            vals = np.add.reduceat(vals, starts)
+            rows, cols = rows[starts], cols[starts]
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(indptr, cols, vals, shape)
+
+    def row(self, i):
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.indices[lo:hi], self.data[lo:hi]
+
+    def dot(self, x):
+        # x: [n_cols] or [..., n_cols] -> [n_rows] or [..., n_rows]
+        x = np.asarray(x)
+        terms = x[..., self.indices] * self.data
+        out = np.zeros(x.shape[:-1] + (self.shape[0],))
+        nonempty = np.diff(self.indptr) > 0
+        if terms.shape[-1]:
+            out[..., nonempty] = np.add.reduceat(
+                terms, self.indptr[:-1][nonempty], axis=-1)
+        return out
+
+class StoichMatrix:
+    # N_ij = P_ij - D_ij for isotope i and reaction j, with P counting how
+    # often i is made by j and D how often it is used up. Built once per
+    # network (one set of reaction keys) and reused for every snapshot.
+
+    def __init__(self, isotopes, P, D):
+        self.isotopes = isotopes   # sorted nuclide codes, one per row
+        self.P = P
+        self.D = D
+
+    @property
+    def Z(self):
+        return self.isotopes >> A_BITS
+
+    @property
+    def A(self):
+        return self.isotopes & ((1 << A_BITS) - 1)
+
+    def labels(self):
+        return np.array([ZA_to_label(int(z), int(a)) for z, a in zip(self.Z, self.A)],
+                        dtype=object)
+
+    def index(self, iso):
+        code = nuclide_code(*label_to_ZA(iso))
+        i = np.searchsorted(self.isotopes, code)
+        if i == len(self.isotopes) or self.isotopes[i] != code:
+            raise KeyError(iso)
+        return i
+
+    def producers(self, iso):
+        return self.P.row(self.index(iso))[0]
+
+    def destroyers(self, iso):
+        return self.D.row(self.index(iso))[0]
+
+    def production(self, flux):
+        return self.P.dot(flux)
+
+    def destruction(self, flux):
+        return self.D.dot(flux)
+
+    def net(self, flux):
+        # dY_i/dt = sum_j N_ij F_j
+        return self.production(flux) - self.destruction(flux)
+
+def build_stoich_matrix(keys) -> StoichMatrix:
+    with timer("build_stoich_matrix"):
+        return _build_stoich_matrix(keys)
+
+def _build_stoich_matrix(keys):
+    Z, A = unpack_keys(keys)
+    n_reactions = len(Z)
+    codes = nuclide_code(Z, A)
+
+    present = Z > 0          # empty slots and neutrons carry no label
+    isotopes = np.unique(codes[present])
+
+    def side(slots):
+        slots = list(slots)
+        mask = present[:, slots]
+        rows = np.searchsorted(isotopes, codes[:, slots][mask])
+        cols = np.nonzero(mask)[0]
+        vals = np.ones(len(rows))
+        return CSRMatrix.from_coo(rows, cols, vals, (len(isotopes), n_reactions))
+
+    return StoichMatrix(isotopes, side(PRODUCT_SLOTS), side(REACTANT_SLOTS))
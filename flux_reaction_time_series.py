@@ -1,73 +1,96 @@
 import argparse
 import numpy as np
-import pandas as pd
-import re
-import matplotlib.pyplot as plt
 from pathlib import Path
+from flux_cache import load_flux_cube, snapshot_times
+import profiling
 
-elements = {
-    1:"H", 2:"He", 3:"Li", 4:"Be", 5:"B", 6:"C",
-    7:"N", 8:"O", 9:"F", 10:"Ne", 11:"Na", 12:"Mg",
-    13:"Al", 14:"Si", 15:"P", 16:"S", 17:"Cl", 18:"Ar",
-    19:"K", 20:"Ca"
-}
-
-def ZA_to_label(Z, A):
-    if Z == 0:
-        return None
-    return f"{elements.get(Z, f'Z{Z}')}-{A}"
-
-def parse_flux_file(path):
-    data = np.loadtxt(path)
-    reactions = {}
-
-    for row in data:
-        Z1,A1,Z3,A3,Z5,A5,Z7,A7 = map(int, row[1:9])
-        flux = float(row[9])
-
-        reactants = [ZA_to_label(Z1,A1), ZA_to_label(Z3,A3)]
-        products  = [ZA_to_label(Z5,A5), ZA_to_label(Z7,A7)]
-
-        reactants = [x for x in reactants if x]
-        products  = [x for x in products if x]
-
-        rxn = " + ".join(reactants) + " -> " + " + ".join(products)
-        reactions[rxn] = flux
-
-    return reactions
+def read_reaction_file(path):
+    # one reaction per line, e.g. "O-15 + He-4 -> Ne-19"; # starts a comment
+    with open(path, "r") as f:
+        lines = [line.split("#", 1)[0].strip() for line in f]
+    return [line for line in lines if line]
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--run", required=True)
-    ap.add_argument("--reaction", required=True)
+    ap.add_argument("--reaction", nargs="+", action="extend", default=[],
+                    help='one or more reactions, e.g. "O-15 + He-4 -> Ne-19"')
+    ap.add_argument("--reaction-file", default=None,
+                    help="text file with one reaction per line")
+    ap.add_argument("--involving", nargs="+", action="extend", default=[],
+                    help="add every reaction with this isotope in any channel, e.g. O-15")
+    ap.add_argument("--times", default=None,
+                    help="CSV with columns cycle,time (default: agej from iso_massf*.DAT)")
+    ap.add_argument("--csv", default=None, help="optional wide output CSV (time x reaction)")
+    ap.add_argument("--no-plot", action="store_true")
+    ap.add_argument("--rebuild-cache", action="store_true",
+                    help="Reparse all flux files even if the cache is current")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="Worker processes for parsing flux files")
+    profiling.add_argument(ap)
     args = ap.parse_args()
+    profiling.start(args.profile)
 
-    run_path = Path(args.run)
-
-    flux_files = sorted(run_path.glob("flux_*.DAT"))
-
-    times = []
-    fluxes = []
-
-    for f in flux_files:
-        idx = int(re.search(r"flux_(\d+).DAT", f.name).group(1))
-        reactions = parse_flux_file(f)
+    reactions = list(args.reaction)
+    if args.reaction_file:
+        reactions += read_reaction_file(args.reaction_file)
+    if not reactions and not args.involving:
+        ap.error("give at least one of --reaction, --reaction-file, --involving")
 
-        flux = reactions.get(args.reaction, 0.0)
-
-        times.append(idx)
-        fluxes.append(abs(flux))
-
-    times = np.array(times)
-    fluxes = np.array(fluxes)
+    run_path = Path(args.run)
+    cube = load_flux_cube(run_path, rebuild=args.rebuild_cache, jobs=args.jobs)
+
+    idx, missing = cube.find_many(reactions)
+    for r in missing:
+        print(f"[WARN] Reaction not in network: {r}")
+    for iso in args.involving:
+        idx = np.concatenate([idx, cube.involving(iso)])
+
+    # keep first occurrence order, drop duplicates
+    _, first = np.unique(idx, return_index=True)
+    idx = idx[np.sort(first)]
+    if len(idx) == 0:
+        raise RuntimeError("None of the requested reactions are in this run.")
+
+    times = snapshot_times(cube, args.times, jobs=args.jobs)
+    missing_t = np.isnan(times)
+    if missing_t.any():
+        raise RuntimeError(
+            f"No time for {missing_t.sum()} of {len(times)} flux files "
+            f"(e.g. cycle {cube.cycles[missing_t][0]}); pass --times cycle,time CSV"
+        )
+
+    # one fancy-index read of the cached matrix for every requested series
+    names = cube.reactions(idx)
+    fluxes = np.asarray(cube.flux[:, idx])
+
+    if args.csv:
+        import pandas as pd
+
+        df = pd.DataFrame(fluxes, columns=names)
+        df.insert(0, "time", times)
+        df.insert(0, "cycle", cube.cycles)
+        df.to_csv(args.csv, index=False)
+        print(f"[OK] Wrote {args.csv} ({len(df)} times x {len(names)} reactions)")
+
+    if args.no_plot:
+        return
+
+    import matplotlib.pyplot as plt
 
     plt.figure()
-    plt.plot(times, np.log10(np.maximum(fluxes, 1e-30)))
-    plt.xlabel("Flux file index")
+    log_flux = np.log10(np.maximum(np.abs(fluxes), 1e-30))
+    for j, name in enumerate(names):
+        plt.plot(times, log_flux[:, j], label=name)
+    plt.xlabel("Time - agej")
     plt.ylabel("log10 |flux|")
-    plt.title(f"Time evolution of flux\n{args.reaction}")
+    title = names[0] if len(names) == 1 else f"{len(names)} reactions"
+    plt.title(f"Time evolution of flux\n{title}")
+    if len(names) > 1:
+        plt.legend(fontsize=7, ncol=2)
     plt.grid(True, ls=":")
-    plt.tight_layout()
+    with profiling.timer("plot"):
+        plt.tight_layout()
     plt.show()
 
 if __name__ == "__main__":
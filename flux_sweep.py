@@ -0,0 +1,164 @@
+import argparse
+import os
+import numpy as np
+from pathlib import Path
+from flux_cache import load_flux_cube, snapshot_times, trapezoid_weights
+from flux_io import reaction_names, unpack_keys, text_table
+from run_catalog import extract_factor
+from run_io import map_chunks
+from sensitivity import fit_slopes
+import profiling
+
+# Integrated flow phi_j = integral |F_j| dt of every reaction in every run of
+# a rate-factor sweep, as one [n_runs x n_reactions] matrix, and the flow
+# response d log10 phi_j / d log10 r of every reaction fitted at once. The
+# reactions with the steepest slopes are the pathways that take over (or
+# lose) flow when the swept rate changes.
+
+def find_sweep_runs(runs_dir, pattern, baseline="baseline"):
+    # -> [(run dir, factor)] sorted by factor: the runs whose name contains
+    # pattern and carries a rate factor, plus the baseline at factor 1
+    runs = []
+    with os.scandir(runs_dir) as it:
+        for entry in it:
+            if not entry.is_dir():
+                continue
+            factor = extract_factor(entry.name)
+            if factor is None:
+                continue
+            if pattern in entry.name or (baseline and entry.name == baseline):
+                runs.append((Path(entry.path), factor))
+    runs.sort(key=lambda r: (r[1], r[0].name))
+    return runs
+
+def integrate_run(run_dir, time_table=None):
+    # -> (keys, phi) from the run's flux cache (built on first use)
+    cube = load_flux_cube(run_dir)
+    times = snapshot_times(cube, time_table)
+    missing = np.isnan(times)
+    if missing.any():
+        raise RuntimeError(f"no time for {missing.sum()} of {len(times)} flux files")
+    return cube.keys, trapezoid_weights(times) @ np.abs(cube.flux)
+
+def _integrate_chunk(run_dirs):
+    # worker: (name, keys, phi) or (name, None, error message) per run
+    out = []
+    for run_dir in run_dirs:
+        try:
+            keys, phi = integrate_run(run_dir)
+            out.append((run_dir.name, keys, phi))
+        except (OSError, RuntimeError, ValueError) as e:
+            out.append((run_dir.name, None, f"{type(e).__name__}: {e}"))
+    return out
+
+def flow_matrix(parts):
+    # [(name, keys, phi)] -> (keys, Phi [n_runs x n_reactions]); NaN where a
+    # reaction is not in a run's network
+    keys = np.unique(np.concatenate([k for _, k, _ in parts]))
+    Phi = np.full((len(parts), len(keys)), np.nan)
+    for i, (_, k, phi) in enumerate(parts):
+        Phi[i, np.searchsorted(keys, k)] = phi
+    return keys, Phi
+
+def flow_response(factors, Phi, base_row, min_flow):
+    # per reaction: slope of log10(phi / phi_baseline) against log10 r, its
+    # error and R^2, and S = max |log10(phi / phi_baseline)| over the runs.
+    # Flows at or below min_flow are left out of the fit.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logphi = np.where(Phi > min_flow, np.log10(Phi), np.nan)
+    ref = logphi[base_row] if base_row is not None else np.nanmean(logphi, axis=0)
+    dlog = logphi - ref
+    fit = fit_slopes(np.log10(factors), dlog.T)
+    S = np.max(np.where(np.isnan(dlog), -1.0, np.abs(dlog)), axis=0)
+    S[S < 0] = np.nan
+    return {"slope": fit["slope"], "slope_err": fit["slope_err"], "r2": fit["r2"],
+            "n_runs": fit["n"], "S": S}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pattern", required=True, help="swept reaction in the run names, e.g. 15O_ag")
+    ap.add_argument("--runs-dir", default="runs")
+    ap.add_argument("--baseline", default="baseline",
+                    help="run at factor 1 the flows are compared to ('' to use the mean)")
+    ap.add_argument("--top", type=int, default=25)
+    ap.add_argument("--rank", choices=["slope", "S"], default="slope",
+                    help="rank by |d log phi / d log r| or by max |log10(phi/phi_baseline)|")
+    ap.add_argument("--min-frac", type=float, default=0.0,
+                    help="only rank reactions whose baseline flow is at least this "
+                         "fraction of the largest one (e.g. 1e-10 to drop negligible flows)")
+    ap.add_argument("--min-flow", type=float, default=1e-300,
+                    help="flows at or below this are left out of the fits")
+    ap.add_argument("--csv", default=None, help="slope table for every reaction")
+    ap.add_argument("--matrix", default=None,
+                    help="also save runs, factors, keys and the flow matrix to this .npz")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count())
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    runs = find_sweep_runs(args.runs_dir, args.pattern, args.baseline)
+    if not runs:
+        raise RuntimeError(f"No runs matching {args.pattern!r} in {args.runs_dir}")
+    factor_of = {d.name: f for d, f in runs}
+
+    parts = []
+    for part in map_chunks(_integrate_chunk, [d for d, _ in runs], args.jobs):
+        for name, keys, phi in part:
+            if keys is None:
+                print(f"[WARN] Skipping {name}: {phi}")
+            else:
+                parts.append((name, keys, phi))
+    if len(parts) < 2:
+        raise RuntimeError("Need at least two runs with flux files to fit slopes")
+
+    names = [name for name, _, _ in parts]
+    factors = np.array([factor_of[name] for name in names])
+    with profiling.timer("flow_matrix"):
+        keys, Phi = flow_matrix(parts)
+    base_row = names.index(args.baseline) if args.baseline in names else None
+    if args.baseline and base_row is None:
+        print(f"[WARN] No {args.baseline} run with flux files, comparing to the mean flow")
+
+    result = flow_response(factors, Phi, base_row, args.min_flow)
+
+    ref = Phi[base_row] if base_row is not None else np.nanmean(Phi, axis=0)
+    score = np.abs(result[args.rank])
+    strong = ref >= args.min_frac * np.nanmax(ref)
+    order = np.argsort(-np.where(strong & ~np.isnan(score), score, -np.inf), kind="stable")
+    order = order[strong[order] & ~np.isnan(score[order])]
+
+    shown = order if args.csv else order[:args.top]
+    reactions = reaction_names(*unpack_keys(keys[shown]))
+    with np.errstate(divide="ignore"):
+        log_ref = np.log10(ref[shown])
+
+    print(f"\n=== Flow response to {args.pattern}: {len(names)} runs, factors "
+          f"{', '.join(f'{f:g}' for f in factors)}; {len(order)} of {len(keys)} reactions "
+          f"ranked by {args.rank} ===\n")
+    top = slice(0, args.top)
+    print(text_table({
+        "dlogphi/dlogr": [f"{v:+.3f}" for v in result["slope"][shown][top]],
+        "err": ["-" if np.isnan(v) else f"{v:.3f}" for v in result["slope_err"][shown][top]],
+        "R2": [f"{v:.3f}" for v in result["r2"][shown][top]],
+        "S": [f"{v:.3f}" for v in result["S"][shown][top]],
+        "log10_phi_base": [f"{v:.3f}" for v in log_ref[top]],
+        "reaction": list(reactions[top]),
+    }))
+
+    if args.csv:
+        import pandas as pd
+
+        pd.DataFrame({
+            "reaction": reactions,
+            **{k: v[shown] for k, v in result.items()},
+            "log10_phi_base": log_ref,
+            "key": keys[shown],
+        }).to_csv(args.csv, index=False)
+        print(f"\n[OK] Wrote {args.csv}")
+
+    if args.matrix:
+        np.savez(args.matrix, runs=np.array(names), factors=factors, keys=keys, phi=Phi)
+        print(f"[OK] Wrote {args.matrix}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import heapq
+import numpy as np
+from flux_cache import FluxIntegral
+
+# Streaming reducers for ranking reactions over runs too long to hold as one
+# flux cube. Snapshots are fed one at a time and the state is bounded: k
+# heap entries for the peak ranking, a fixed number of counters for the
+# dominance ranking, and one integral per reaction of the network (which
+# grows with the network, never with the number of snapshots).
+
+class TopK:
+    # the k largest values seen per integer key: a min-heap of (value, key)
+    # plus the current (value, payload) of each key held. A key pushed again
+    # only moves when its value grows; its old heap entry is left behind and
+    # skipped once it reaches the top.
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.best = {}
+
+    def _prune(self):
+        heap, best = self.heap, self.best
+        while heap and (heap[0][1] not in best or best[heap[0][1]][0] != heap[0][0]):
+            heapq.heappop(heap)
+
+    def floor(self):
+        # smallest value still in the top k; anything at or below it is out
+        if len(self.best) < self.k:
+            return -np.inf
+        self._prune()
+        return self.heap[0][0]
+
+    def push(self, value, key, payload=None):
+        if self.k <= 0:
+            return
+        held = self.best.get(key)
+        if held is not None:
+            if value <= held[0]:
+                return
+        elif len(self.best) >= self.k:
+            if value <= self.floor():
+                return
+            del self.best[heapq.heappop(self.heap)[1]]
+        self.best[key] = (value, payload)
+        heapq.heappush(self.heap, (value, key))
+        if len(self.heap) > 4 * self.k + 64:
+            # too many stale entries: rebuild from the live ones
+            self.heap = [(v, key) for key, (v, _) in self.best.items()]
+            heapq.heapify(self.heap)
+
+    def push_many(self, values, keys, payload=None):
+        # one snapshot: only its own k largest can enter, and only those
+        # above the current floor
+        values = np.asarray(values, dtype=float)
+        if len(values) > self.k:
+            idx = np.argpartition(-values, self.k - 1)[:self.k]
+        else:
+            idx = np.arange(len(values))
+        idx = idx[values[idx] > self.floor()]
+        for i in idx:
+            self.push(float(values[i]), int(keys[i]), payload)
+
+    def items(self):
+        # -> [(key, value, payload)], largest value first
+        return sorted(((key, v, p) for key, (v, p) in self.best.items()),
+                      key=lambda r: (-r[1], r[0]))
+
+class SpaceSaving:
+    # counts of the most frequent keys in at most `capacity` counters
+    # (Metwally et al. 2005). Exact while no more than capacity distinct keys
+    # have been seen; after that a new key takes over the smallest counter
+    # and its count, which is then an overestimate by at most err.
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.err = {}
+
+    def add(self, key, n=1):
+        if key in self.counts:
+            self.counts[key] += n
+            return
+        err = 0
+        if len(self.counts) >= self.capacity:
+            old = min(self.counts, key=self.counts.get)
+            err = self.counts.pop(old)
+            del self.err[old]
+        self.counts[key] = err + n
+        self.err[key] = err
+
+    def items(self, k=None):
+        # -> [(key, count, err)], most frequent first
+        ranked = sorted(self.counts.items(), key=lambda r: (-r[1], r[0]))[:k]
+        return [(key, c, self.err[key]) for key, c in ranked]
+
+class StreamingRanker:
+    # running top-k reactions by time-integrated |flux|, by peak |flux| (with
+    # the cycle and time of the peak), and by the number of snapshots in
+    # which the reaction carries the largest |flux|
+
+    def __init__(self, k, capacity=None):
+        self.k = k
+        self.integral = FluxIntegral()
+        self.peak = TopK(k)
+        self.dominance = SpaceSaving(capacity or max(4 * k, 64))
+        self.n_snapshots = 0
+
+    def add(self, cycle, time, keys, flux):
+        # keys must be unique (flux_io.sum_by_key)
+        a = np.abs(flux)
+        self.integral.add(cycle, time, keys, flux, None)
+        self.peak.push_many(a, keys, (cycle, time))
+        if len(a) and a.max() > 0:
+            self.dominance.add(int(keys[np.argmax(a)]))
+        self.n_snapshots += 1
+
+    def top_integrated(self):
+        top = TopK(self.k)
+        top.push_many(self.integral.phi, self.integral.keys)
+        return top.items()
+
+    def top_peak(self):
+        return self.peak.items()
+
+    def top_dominance(self):
+        return self.dominance.items(self.k)
@@ -0,0 +1,266 @@
+import argparse
+import numpy as np
+from pathlib import Path
+import profiling
+from abundance_io import normalize_run_path
+from profiling import timer, count, count_file
+from run_io import (list_snapshots, source_manifest, manifest_matches, save_arrays,
+                    map_chunks, atomic_write, AGEJ_RE, SNAPSHOT_PATTERNS)
+
+STORE_DIR = "abundance_store"
+STORE_VERSION = 1
+
+# Python replacement for tools/extract_final_iso.f90 and tools/batch_iso.f90:
+# the run directory is listed once and every iso_massf file is read once.
+
+def parse_iso_massf(path, with_ZA=False):
+    # -> (agej, [isotope labels], X) ; labels are "<el>-<A>" exactly as the
+    # Fortran tools wrote them (e.g. PROT-1, HE-4, O-16, AL*-26). with_ZA
+    # adds the numeric [n, 3] Z, A, isomer columns of the rows.
+    agej = float("nan")
+    isotopes, X, ZA = [], [], []
+
+    count_file(path)
+    with timer("parse_iso_massf"), open(path, "r") as f:
+        for line in f:
+            if np.isnan(agej):
+                m = AGEJ_RE.search(line)
+                if m:
+                    agej = float(m.group(1))
+                    continue
+            if not line.strip() or line.startswith("#"):
+                continue
+            if "ABUNDANCE_MF" in line:
+                continue
+
+            # idx, Z, A, isomer, X, element, A
+            parts = line.split()
+            try:
+                xi = float(parts[4].replace("D", "E").replace("d", "e"))
+                label = f"{parts[5]}-{int(parts[6])}"
+                za = (int(float(parts[1])), int(float(parts[2])), int(parts[3]))
+            except (IndexError, ValueError):
+                continue
+            isotopes.append(label)
+            X.append(xi)
+            ZA.append(za)
+
+    count("iso_rows", len(X))
+    if with_ZA:
+        return agej, isotopes, np.array(X), np.array(ZA, dtype=np.int64).reshape(-1, 3)
+    return agej, isotopes, np.array(X)
+
+def _parse_chunk(paths):
+    # isotope labels only go back through the pipe when they change
+    out, last = [], None
+    for path in paths:
+        agej, isotopes, X = parse_iso_massf(path)
+        out.append((agej, None if isotopes == last else isotopes, X))
+        last = isotopes
+    return out
+
+def read_iso_massf_run(run_dir, jobs=1, snapshots=None):
+    # -> list of (cycle, file name, agej, isotopes, X) in cycle order
+    if snapshots is None:
+        snapshots = list_snapshots(run_dir, "iso_massf")
+    if not snapshots:
+        raise FileNotFoundError(f"No iso_massf*.DAT files found in {run_dir}")
+
+    parsed = [r for part in map_chunks(_parse_chunk, [p for _, p, _ in snapshots], jobs)
+              for r in part]
+
+    records, isotopes = [], None
+    for (cycle, path, _), (agej, isos, X) in zip(snapshots, parsed):
+        if isos is not None:
+            isotopes = isos
+        records.append((cycle, path.name, agej, isotopes, X))
+    return records
+
+def write_final_abundances(records, out_csv):
+    # same layout as extract_final_iso: last file, isotope,X
+    _, _, _, isotopes, X = records[-1]
+    with atomic_write(out_csv) as f:
+        f.write("isotope,X\n")
+        f.writelines(f"{iso},{x:.8E}\n" for iso, x in zip(isotopes, X))
+
+def write_summary(records, out_csv):
+    # same layout as batch_iso: one row per (file, isotope)
+    with atomic_write(out_csv) as f:
+        f.write("file,isotope,X\n")
+        for _, name, _, isotopes, X in records:
+            f.writelines(f"{name},{iso},{x:.8E}\n" for iso, x in zip(isotopes, X))
+
+def write_cycle_times(records, out_csv):
+    # cycle,time table usable as --times by the flux tools
+    with atomic_write(out_csv) as f:
+        f.write("cycle,time,file\n")
+        f.writelines(f"{cycle},{agej:.10E},{name}\n"
+                     for cycle, name, agej, _, _ in records)
+
+class AbundanceStore:
+    # [n_snapshots x n_isotopes] mass fractions of one run plus the time
+    # (agej) and cycle of every row; X is memory-mapped once saved.
+
+    def __init__(self, run_dir, cycles, time, isotopes, X):
+        self.run_dir = Path(run_dir)
+        self.cycles = cycles
+        self.time = time
+        self.isotopes = list(isotopes)
+        self.X = X
+        self._col = {iso: j for j, iso in enumerate(self.isotopes)}
+
+    def column(self, iso):
+        return np.asarray(self.X[:, self._col[iso]])
+
+def build_abundance_store(run_dir, records):
+    # isotope columns in order of first appearance; isotopes missing from a
+    # snapshot are stored as 0
+    col, last = {}, None
+    for *_, isotopes, _ in records:
+        if isotopes is not last:
+            for iso in isotopes:
+                col.setdefault(iso, len(col))
+            last = isotopes
+
+    X = np.zeros((len(records), len(col)))
+    last, idx = None, None
+    for i, (*_, isotopes, x) in enumerate(records):
+        if isotopes is not last:
+            idx = np.array([col[iso] for iso in isotopes], dtype=np.int64)
+            last = isotopes
+        X[i, idx] = x
+
+    return AbundanceStore(
+        run_dir,
+        cycles=np.array([r[0] for r in records], dtype=np.int64),
+        time=np.array([r[2] for r in records]),
+        isotopes=list(col),
+        X=X,
+    )
+
+def write_abundance_store(store, manifest):
+    save_arrays(store.run_dir / STORE_DIR, {
+        "cycles": store.cycles,
+        "time": store.time,
+        "isotopes": np.array(store.isotopes),
+        "X": store.X,
+    }, manifest)
+
+def _store_manifest(snapshots):
+    return {"version": STORE_VERSION, "sources": source_manifest(snapshots)}
+
+def read_summary_store(run_dir) -> AbundanceStore:
+    # fallback for runs that only kept the batch_iso summary.csv: times come
+    # from cycle_times.csv when there is one, otherwise they are NaN
+    run_dir = Path(run_dir)
+    pat = SNAPSHOT_PATTERNS["iso_massf"]
+    rows, col = {}, {}
+    with open(run_dir / "summary.csv") as f:
+        next(f)
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) < 3:
+                continue
+            name, iso, x = parts[0], parts[1], float(parts[2])
+            rows.setdefault(name, []).append((col.setdefault(iso, len(col)), x))
+
+    cycle = {n: int(m.group(1)) if (m := pat.search(n)) else -1 for n in rows}
+    names = sorted(rows, key=cycle.get)
+    X = np.zeros((len(names), len(col)))
+    for i, name in enumerate(names):
+        idx, x = zip(*rows[name])
+        X[i, list(idx)] = x
+
+    times = {}
+    cycle_times = run_dir / "cycle_times.csv"
+    if cycle_times.exists():
+        with open(cycle_times) as f:
+            next(f)
+            for line in f:
+                parts = line.strip().split(",")
+                if len(parts) >= 3:
+                    times[parts[2]] = float(parts[1])
+
+    return AbundanceStore(
+        run_dir,
+        cycles=np.array([cycle[n] for n in names], dtype=np.int64),
+        time=np.array([times.get(n, np.nan) for n in names]),
+        isotopes=list(col),
+        X=X,
+    )
+
+def load_abundance_store(run_dir, jobs=1, rebuild=False) -> AbundanceStore:
+    # reuse <run>/abundance_store while it matches the iso_massf files,
+    # otherwise parse the run once and rewrite it
+    run_dir = Path(run_dir)
+    snapshots = list_snapshots(run_dir, "iso_massf")
+    manifest = _store_manifest(snapshots)
+    store_dir = run_dir / STORE_DIR
+
+    # a store whose iso_massf files were cleaned up is still the best we have
+    archived = not snapshots and (store_dir / "manifest.json").exists()
+    if archived or (not rebuild and manifest_matches(store_dir, manifest)):
+        return AbundanceStore(
+            run_dir,
+            cycles=np.load(store_dir / "cycles.npy"),
+            time=np.load(store_dir / "time.npy"),
+            isotopes=np.load(store_dir / "isotopes.npy").tolist(),
+            X=np.load(store_dir / "X.npy", mmap_mode="r"),
+        )
+    if not snapshots and (run_dir / "summary.csv").exists():
+        return read_summary_store(run_dir)
+
+    records = read_iso_massf_run(run_dir, jobs=jobs, snapshots=snapshots)
+    with timer("build_abundance_store"):
+        store = build_abundance_store(run_dir, records)
+    try:
+        write_abundance_store(store, manifest)
+    except OSError as e:
+        print(f"[WARN] Could not write abundance store in {store_dir}: {e}")
+    return store
+
+def extract_run(run_dir, jobs=1, final_only=False, verbose=True):
+    # everything the Fortran tools produced, plus cycle_times.csv and the
+    # abundance store, from a single pass over the iso_massf files
+    run_dir = Path(run_dir)
+    snapshots = list_snapshots(run_dir, "iso_massf")
+    records = read_iso_massf_run(run_dir, jobs=jobs, snapshots=snapshots)
+
+    if verbose:
+        print(f"Using final file: {records[-1][1]}")
+        print(f"Read {len(records[-1][3])} isotopes from {len(records)} files.")
+
+    outputs = [(write_final_abundances, run_dir / "final_abundances.csv")]
+    if not final_only:
+        outputs += [(write_summary, run_dir / "summary.csv"),
+                    (write_cycle_times, run_dir / "cycle_times.csv")]
+
+    for write, out_csv in outputs:
+        with timer(write.__name__):
+            write(records, out_csv)
+        if verbose:
+            print(f"[OK] Wrote {out_csv}")
+
+    if not final_only:
+        with timer("write_abundance_store"):
+            write_abundance_store(build_abundance_store(run_dir, records),
+                                  _store_manifest(snapshots))
+        if verbose:
+            print(f"[OK] Wrote {run_dir / STORE_DIR}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--run", required=True, help="Run folder, e.g. runs/baseline")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="Worker processes for parsing iso_massf files")
+    ap.add_argument("--final-only", action="store_true",
+                    help="only write final_abundances.csv")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    extract_run(normalize_run_path(args.run), jobs=args.jobs,
+                final_only=args.final_only)
+
+if __name__ == "__main__":
+    main()
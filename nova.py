@@ -0,0 +1,59 @@
+import argparse
+import importlib
+import sys
+
+# One entry point for the analysis scripts: "nova <command> [options]" runs
+# that script's main() with the remaining arguments. Only the script a
+# command needs is imported, so text-only queries (top, integrate, balance,
+# compare-flux) start without loading pandas or matplotlib.
+
+# command -> (module, one-line description)
+COMMANDS = {
+    "top":          ("flux_snapshot", "top reactions of one flux file"),
+    "balance":      ("flux_isotope_io", "isotope production/destruction in one flux file"),
+    "compare-flux": ("compare_flux_snapshot", "largest flux changes between two flux files or runs"),
+    "integrate":    ("flux_integrate_run", "reactions ranked by time-integrated flow"),
+    "flux-sweep":   ("flux_sweep", "flow response d log phi / d log r over a rate sweep"),
+    "graph":        ("flux_graph", "isotope flow graph: dominant paths, cycles, branchings"),
+    "families":     ("reaction_families", "flux by reaction family and region, per time window"),
+    "series":       ("flux_reaction_time_series", "flux of chosen reactions over a run"),
+    "watch":        ("watch_run", "follow a running PPN job's newest output"),
+    "extract":      ("iso_massf_io", "final/summary abundance CSVs and abundance store"),
+    "catalog":      ("run_catalog", "refresh and list runs/catalog.sqlite"),
+    "ensemble":     ("ensemble_stats", "streaming statistics over an ensemble of runs"),
+    "sweep":        ("sweep_runner", "run a PPN sweep from a JSON spec"),
+    "slopes":       ("plot_multi_iso_sens_slopes", "sensitivity slopes for many isotopes"),
+    "sensitivity":  ("plot_multiple_isotope_sensitivity", "isotope ratios vs rate factor"),
+    "vs-factors":   ("plot_isotope_vs_factors", "one isotope's final abundance vs rate factor"),
+    "compare":      ("compare_runs", "final abundances of two runs, or many against one"),
+    "final":        ("plot_final", "final abundance plot"),
+    "initial":      ("plot_initial", "initial abundance plot"),
+    "ratios":       ("plot_abundance_ratios", "final/initial abundance ratios"),
+    "top-ratios":   ("plot_top_ratios", "most created/destroyed isotopes"),
+    "evolution":    ("time_evo_plot", "abundance time evolution"),
+    "flux-plot":    ("plot_flux_snapshot", "bar plot of one flux file"),
+    "plots":        ("batch_plots", "render the standard plot set for every run"),
+    "synth":        ("synth_ppn", "write synthetic PPN output"),
+    "bench":        ("bench_ppn", "benchmark the scripts on synthetic runs"),
+}
+
+def main():
+    width = max(map(len, COMMANDS))
+    ap = argparse.ArgumentParser(
+        prog="nova",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:<{width}}  {desc}"
+                                         for name, (_, desc) in COMMANDS.items())
+               + "\n\n'nova <command> -h' shows the options of a command.",
+    )
+    ap.add_argument("command", choices=list(COMMANDS), metavar="command", help="see below")
+    ap.add_argument("args", nargs=argparse.REMAINDER, help="options passed to the command")
+    args = ap.parse_args()
+
+    module, _ = COMMANDS[args.command]
+    # the script parses sys.argv itself; its usage line reads "nova <command>"
+    sys.argv = [f"nova {args.command}", *args.args]
+    importlib.import_module(module).main()
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,17 @@
 import argparse
 import matplotlib.pyplot as plt
 from abundance_io import read_final_abundances, read_initial_abundances
+import profiling
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--run", required=True, help="runs/baseline")
-    # assuming initial_abundance is in root (see abundance_io)
-    #ap.add_argument("--init", default="../initial_abundance.dat")
-    ap.add_argument("--top", type=int, default=15)
-    args = ap.parse_args()
-
+def render(run, top=15, show=False):
     df_i = read_initial_abundances()
-    df_f, run_dir = read_final_abundances(args.run)
+    df_f, run_dir = read_final_abundances(run)
 
     # merge and sort_values
-    df = df_i.merge(df_f, on="isotope", suffixes=("_i", "_f"))
+    with profiling.timer("merge"):
+        df = df_i.merge(df_f, on="isotope", suffixes=("_i", "_f"))
     df["ratio"] = df["X_f"]/df["X_i"]
-    df = df.sort_values("X_f", ascending=False).head(args.top)
+    df = df.sort_values("X_f", ascending=False).head(top)
 
     outdir = run_dir / "plots"
     outdir.mkdir(exist_ok=True)
@@ -42,13 +37,28 @@ def main():
     for ax in axs:
         ax.grid(True, which="both", ls=":")
 
-    fig.suptitle(f"Abandance comparison - {args.run}")
-    plt.tight_layout()
+    fig.suptitle(f"Abandance comparison - {run_dir.name}")
+    with profiling.timer("plot"):
+        plt.tight_layout()
     
-    outfile = outdir / f"abundance_ratios_top{args.top}.png"
-    plt.savefig(outfile, dpi=200)
-    plt.show()
+        outfile = outdir / f"abundance_ratios_top{top}.png"
+        plt.savefig(outfile, dpi=200)
+    if show:
+        plt.show()
+    plt.close(fig)
+    return outfile
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--run", required=True, help="runs/baseline")
+    # assuming initial_abundance is in root (see abundance_io)
+    #ap.add_argument("--init", default="../initial_abundance.dat")
+    ap.add_argument("--top", type=int, default=15)
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
 
+    outfile = render(args.run, args.top, show=True)
     print(f"[OK] Saved {outfile}")
 
 if __name__ == "__main__":
@@ -3,31 +3,39 @@ import argparse
 import pandas as pd
 import matplotlib.pyplot as plt
 from abundance_io import read_final_abundances
+import profiling
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--run", required=True, help="Run folder, e.g. runs/baseline")
-    ap.add_argument("--top", type=int, default=15)
-    args = ap.parse_args()
-
+def render(run, top=15, show=False):
     #run = Path(args.run)
     #df = pd.read_csv(run / "final_abundances.csv").sort_values("X", ascending=False)
-    df, run_dir = read_final_abundances(args.run)
-    top = df.head(args.top)
+    df, run_dir = read_final_abundances(run)
+    df = df.head(top)
 
     outdir = run_dir / "plots"
     outdir.mkdir(exist_ok=True)
 
-    plt.figure()
-    plt.barh(top["isotope"], top["X"])
+    fig = plt.figure()
+    plt.barh(df["isotope"], df["X"])
     plt.xlabel("Mass Fraction")
-    plt.title(f"Final abundances (top {args.top}) - {run_dir.name}")
-    plt.tight_layout()
-    plt.savefig(outdir / f"final_top{args.top}.png", dpi=200)
-    outfile = outdir / f"final_abundances_top{args.top}.png"
-    plt.savefig(outfile, dpi=200)
-    plt.show()
+    plt.title(f"Final abundances (top {top}) - {run_dir.name}")
+    with profiling.timer("plot"):
+        plt.tight_layout()
+        outfile = outdir / f"final_abundances_top{top}.png"
+        plt.savefig(outfile, dpi=200)
+    if show:
+        plt.show()
+    plt.close(fig)
+    return outfile
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--run", required=True, help="Run folder, e.g. runs/baseline")
+    ap.add_argument("--top", type=int, default=15)
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
 
+    outfile = render(args.run, args.top, show=True)
     print(f"[OK] Saved {outfile}")
 
 if __name__ == "__main__":
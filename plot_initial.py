@@ -2,6 +2,35 @@ import argparse
 #from pathlib import Path
 import matplotlib.pyplot as plt
 from abundance_io import read_initial_abundances, normalize_run_path
+import profiling
+
+def render(run, top=15, threshold=0.0, show=False):
+    # may need to pass a file name if you eventually have a diff file path for initial X
+    df = read_initial_abundances()
+
+    if threshold > 0:
+        df = df[df["X"] > threshold]
+
+    top_df = df.head(top)
+
+    run_dir = normalize_run_path(run)
+    outdir = run_dir / "plots"
+    outdir.mkdir(exist_ok=True)
+
+    fig = plt.figure()
+    plt.xscale("log")
+    plt.barh(top_df["isotope"], top_df["X"])
+    plt.xlabel("Mass fraction")
+    plt.title(f"Initial abundance (top {top})")
+    with profiling.timer("plot"):
+        plt.tight_layout()
+
+        outfile = outdir / f"initial_abundances_top{top}.png"
+        plt.savefig(outfile, dpi=200)
+    if show:
+        plt.show()
+    plt.close(fig)
+    return outfile
 
 def main():
     ap = argparse.ArgumentParser()
@@ -12,30 +41,11 @@ def main():
     ap.add_argument("--run", required=True, help="runs/baseline")
     ap.add_argument("--top", type=int, default=15)
     ap.add_argument("--threshold", type=float, default=0.0)
+    profiling.add_argument(ap)
     args = ap.parse_args()
+    profiling.start(args.profile)
 
-    # may need to pass args.file if you eventually have a diff file path for initial X
-    df = read_initial_abundances()
-
-    if args.threshold > 0:
-        df = df[df["X"] > args.threshold]
-
-    top = df.head(args.top)
-
-    run_dir = normalize_run_path(args.run)
-    outdir = run_dir / "plots"
-    outdir.mkdir(exist_ok=True)
-
-    plt.figure()
-    plt.xscale("log")
-    plt.barh(top["isotope"], top["X"])
-    plt.xlabel("Mass fraction")
-    plt.title(f"Initial abundance (top {args.top})")
-    plt.tight_layout()
-
-    outfile = outdir / f"initial_abundances_top{args.top}.png"
-    plt.savefig(outfile, dpi=200)
-    plt.show()
+    render(args.run, args.top, args.threshold, show=True)
 
 if __name__ == "__main__":
     main()
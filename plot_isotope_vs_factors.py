@@ -1,131 +1,106 @@
-
-import os
-import re
-import sys
+import argparse
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-
-# ======================================
-# CONFIG
-# ======================================
-RUNS_DIR = "runs"
-
-if len(sys.argv) < 2:
-    print("Usage: python analysis/plot_final_vs_factor.py F-19")
-    sys.exit(1)
-
-ISOTOPE = sys.argv[1]
-PLOT_RATIO = True
-
-# ======================================
-# Extract factor
-# ======================================
-def extract_factor(folder_name):
-    if folder_name == "baseline":
-        return 1.0
-
-    match = re.search(r'fact_([0-9eE\.\-]+)', folder_name)
-    if match:
-        return float(match.group(1))
-
-    return None
-
-# ======================================
-# Scan runs
-# ======================================
-factors = []
-abundances = []
-
-for folder in os.listdir(RUNS_DIR):
-    full_path = os.path.join(RUNS_DIR, folder)
-
-    if not os.path.isdir(full_path):
-        continue
-
-    factor = extract_factor(folder)
-    if factor is None:
-        continue
-
-    final_file = os.path.join(full_path, "final_abundances.csv")
-    if not os.path.exists(final_file):
-        continue
-
-    df = pd.read_csv(final_file)
-
-    isotope_column = df.columns[0]
-    value_column = df.columns[1]
-
-    row = df[df[isotope_column] == ISOTOPE]
-
-    if row.empty:
-        continue
-
-    abundance = float(row.iloc[0][value_column])
-
-    factors.append(factor)
-    abundances.append(abundance)
-
-# Convert to arrays
-factors = np.array(factors)
-abundances = np.array(abundances)
-
-# Sort
-order = np.argsort(factors)
-factors = factors[order]
-abundances = abundances[order]
-
-# ======================================
-# Compute ratio
-# ======================================
-if PLOT_RATIO:
-    if 1.0 not in factors:
-        raise RuntimeError("Baseline (factor=1) not found.")
-
-    baseline_value = abundances[factors == 1.0][0]
-    ratios = abundances / baseline_value
-else:
-    ratios = abundances
-
-# ======================================
-# Print Results
-# ======================================
-print("\nSensitivity Results for", ISOTOPE)
-print("======================================")
-
-for f, a, r in zip(factors, abundances, ratios):
-    print(f"Factor = {f:>10g} | Final = {a:.6e} | Ratio = {r:.6e}")
-
-# ======================================
-# Save CSV summary
-# ======================================
-summary_df = pd.DataFrame({
-    "Factor": factors,
-    "Final_Abundance": abundances,
-    "Ratio_to_Baseline": ratios
-})
-
-output_csv = f"analysis/{ISOTOPE}_sensitivity.csv"
-summary_df.to_csv(output_csv, index=False)
-
-print("\nSaved numerical results to:", output_csv)
-
-# ======================================
-# Save Plot
-# ======================================
-plt.figure(figsize=(8,6))
-plt.plot(factors, ratios, marker='o')
-plt.xscale('log')
-
-plt.xlabel("Rate Multiplication Factor")
-plt.ylabel(f"{ISOTOPE} Final / Baseline")
-plt.title(f"Sensitivity Study for {ISOTOPE}")
-
-plt.grid(True)
-plt.tight_layout()
-
-output_png = f"analysis/{ISOTOPE}_sensitivity.png"
-plt.savefig(output_png, dpi=300)
-
-print("Saved plot to:", output_png)
-plt.show()
+from run_catalog import load_catalog
+import profiling
+
+def main():
+    ap = argparse.ArgumentParser(description="Final abundance of one isotope vs rate factor")
+    ap.add_argument("isotope", help="e.g. F-19")
+    ap.add_argument("--runs-dir", default="runs")
+    ap.add_argument("--no-ratio", action="store_true",
+                    help="plot the abundance itself instead of the ratio to factor 1")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    ISOTOPE = args.isotope
+    PLOT_RATIO = not args.no_ratio
+
+    # ======================================
+    # Scan runs (from the run catalog)
+    # ======================================
+    factors = []
+    abundances = []
+
+    catalog = load_catalog(args.runs_dir)
+
+    if ISOTOPE in catalog.isotopes:
+        column = catalog.X[:, catalog.col(ISOTOPE)]
+        for factor, abundance in zip(catalog.factors, column):
+            # runs without a factor, or without this isotope
+            if np.isnan(factor) or np.isnan(abundance):
+                continue
+
+            factors.append(factor)
+            abundances.append(abundance)
+
+    # Convert to arrays
+    factors = np.array(factors)
+    abundances = np.array(abundances)
+
+    # Sort
+    order = np.argsort(factors)
+    factors = factors[order]
+    abundances = abundances[order]
+
+    # ======================================
+    # Compute ratio
+    # ======================================
+    if PLOT_RATIO:
+        if 1.0 not in factors:
+            raise RuntimeError("Baseline (factor=1) not found.")
+
+        baseline_value = abundances[factors == 1.0][0]
+        ratios = abundances / baseline_value
+    else:
+        ratios = abundances
+
+    # ======================================
+    # Print Results
+    # ======================================
+    print("\nSensitivity Results for", ISOTOPE)
+    print("======================================")
+
+    for f, a, r in zip(factors, abundances, ratios):
+        print(f"Factor = {f:>10g} | Final = {a:.6e} | Ratio = {r:.6e}")
+
+    # ======================================
+    # Save CSV summary
+    # ======================================
+    import pandas as pd
+
+    summary_df = pd.DataFrame({
+        "Factor": factors,
+        "Final_Abundance": abundances,
+        "Ratio_to_Baseline": ratios
+    })
+
+    output_csv = f"analysis/{ISOTOPE}_sensitivity.csv"
+    summary_df.to_csv(output_csv, index=False)
+
+    print("\nSaved numerical results to:", output_csv)
+
+    # ======================================
+    # Save Plot
+    # ======================================
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(8,6))
+    plt.plot(factors, ratios, marker='o')
+    plt.xscale('log')
+
+    plt.xlabel("Rate Multiplication Factor")
+    plt.ylabel(f"{ISOTOPE} Final / Baseline" if PLOT_RATIO else f"{ISOTOPE} Final")
+    plt.title(f"Sensitivity Study for {ISOTOPE}")
+
+    plt.grid(True)
+    output_png = f"analysis/{ISOTOPE}_sensitivity.png"
+    with profiling.timer("plot"):
+        plt.tight_layout()
+        plt.savefig(output_png, dpi=300)
+
+    print("Saved plot to:", output_png)
+    plt.show()
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,16 @@
 
 import argparse
-import re
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
-
-def extract_factor(run_name):
-    m = re.search(r"fact_([0-9eE\.\-]+)", run_name)
-    return float(m.group(1)) if m else None
-
-def get_final_abundances(run_dir: Path):
-    csv = run_dir / "final_abundances.csv"
-    if not csv.exists():
-        return None
-    return pd.read_csv(csv)
+import pandas as pd
+from run_catalog import load_catalog
+from sensitivity import fit_slopes, safe_log10
+import profiling
 
 def get_A(isotope: str) -> int:
     return int(isotope.split("-")[1])
 
-def safe_log10(x):
-    # avoid log10(0)
-    return np.log10(np.maximum(x, 1e-300))
-
-def fit_slope(logr, logy):
-    # linear fit: logy = a*logr + b
-    if len(logr) < 2:
-        return np.nan
-    a, b = np.polyfit(logr, logy, 1)
-    return a
-
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--pattern", required=True, help="e.g. 15O_ag")
@@ -44,103 +25,100 @@ def main():
 
     ap.add_argument("--minXb", type=float, default=1e-30,
                     help="Ignore isotopes with tiny baseline abundance")
+    ap.add_argument("--csv", default=None,
+                    help="optional CSV of the full slope table (with alpha_err, R2)")
 
+    profiling.add_argument(ap)
     args = ap.parse_args()
+    profiling.start(args.profile)
 
     runs_path = Path(args.runs_dir)
     baseline_dir = Path(args.baseline)
 
+    cat = load_catalog(runs_path)
+
     # ----------------------------
     # Baseline
     # ----------------------------
-    df_base = get_final_abundances(baseline_dir)
-    if df_base is None:
+    base_all = cat.final_abundances(baseline_dir)
+    if base_all is None:
         raise RuntimeError(f"Baseline final_abundances.csv not found in {baseline_dir}")
 
-    df_base["A"] = df_base["isotope"].apply(get_A)
-    df_base = df_base[df_base["A"] < args.Amax]
-
-    base = dict(zip(df_base["isotope"], df_base["X"]))
+    base = {iso: Xb for iso, Xb in base_all.items()
+            if get_A(iso) < args.Amax and Xb > args.minXb}
 
     # ----------------------------
-    # Collect run curves
-    # results[iso] = list of (factor, ratio)
+    # Stack run curves: [n_isotopes x n_runs] log-ratio matrix,
+    # NaN where a run has no value for the isotope
     # ----------------------------
-    results = {}
-
-    for run in runs_path.iterdir():
-        if not run.is_dir():
-            continue
-        if args.pattern not in run.name:
-            continue
-
-        factor = extract_factor(run.name)
-        if factor is None:
-            continue
-
-        df = get_final_abundances(run)
-        if df is None:
-            continue
-
-        df["A"] = df["isotope"].apply(get_A)
-        df = df[df["A"] < args.Amax]
-        runX = dict(zip(df["isotope"], df["X"]))
+    sel = cat.select(args.pattern)
+    isos = [iso for iso in base if iso in cat.isotopes]
+    if len(sel) == 0 or not isos:
+        raise RuntimeError("No matching runs or no data collected.")
 
-        for iso, Xb in base.items():
-            if Xb <= args.minXb:
-                continue
-            if iso not in runX:
-                continue
+    order = np.argsort(cat.factors[sel], kind="stable")
+    sel = sel[order]
+    f = cat.factors[sel]
 
-            ratio = runX[iso] / Xb
+    Xb = np.array([base[iso] for iso in isos])
+    R = cat.X[np.ix_(sel, [cat.col(iso) for iso in isos])].T / Xb[:, None]
 
-            results.setdefault(iso, []).append((factor, ratio))
+    logr = safe_log10(f)
+    logy = np.where(np.isnan(R), np.nan, safe_log10(R))
 
-    if not results:
-        raise RuntimeError("No matching runs or no data collected.")
+    has_data = ~np.isnan(logy).all(axis=1)
+    isos = [iso for iso, ok in zip(isos, has_data) if ok]
+    R, logy = R[has_data], logy[has_data]
 
     # ----------------------------
-    # Compute sensitivity metrics
+    # Compute sensitivity metrics for every isotope at once
     # ----------------------------
-    rows = []
-    for iso, pts in results.items():
-        pts = sorted(pts, key=lambda t: t[0])
-        f = np.array([p[0] for p in pts])
-        r = np.array([p[1] for p in pts])
-
-        logr = safe_log10(f)
-        logy = safe_log10(r)
+    S = np.nanmax(np.abs(logy), axis=1)         # max|log10 ratio|
+    fit = fit_slopes(logr, logy)                # alpha = dlogX/dlogr
+
+    table = pd.DataFrame({
+        "isotope": isos,
+        "A": [get_A(iso) for iso in isos],
+        "S": S,
+        "alpha": fit["slope"],
+        "alpha_err": fit["slope_err"],
+        "intercept": fit["intercept"],
+        "R2": fit["r2"],
+        "n_points": fit["n"],
+    })
+
+    # rank by sensitivity S, then apply minS
+    rank = np.argsort(-S, kind="stable")
+    rank = rank[S[rank] >= args.minS]
+    table = table.iloc[rank]
 
-        S = np.max(np.abs(logy))               # max|log10 ratio|
-        alpha = fit_slope(logr, logy)          # dlogX/dlogr
-
-        rows.append((iso, get_A(iso), S, alpha, f, r))
-
-    # rank by sensitivity S
-    rows.sort(key=lambda t: t[2], reverse=True)
-
-    # apply minS, then topN
-    rows = [t for t in rows if t[2] >= args.minS]
+    rows = []
+    for k in rank:
+        ok = ~np.isnan(R[k])
+        rows.append((isos[k], get_A(isos[k]), S[k], fit["slope"][k],
+                     fit["slope_err"][k], fit["r2"][k], f[ok], R[k][ok]))
     rows_plot = rows[:args.topN]
 
+    if args.csv:
+        table.to_csv(args.csv, index=False)
+        print(f"[OK] Wrote {args.csv}")
+
     # ----------------------------
     # Print ranked table
     # ----------------------------
     print(f"\n=== Sensitivity ranking for pattern '{args.pattern}' (A < {args.Amax}) ===")
-    print(" iso     A     S=max|log10(X/Xb)|     alpha=dlog10(X/Xb)/dlog10(r)")
-    print("---------------------------------------------------------------")
-    for iso, A, S, alpha, *_ in rows[:max(args.topN, 20)]:
-        print(f"{iso:>6s}  {A:>2d}        {S:8.3f}                    {alpha:8.3f}")
+    print(" iso     A     S=max|log10(X/Xb)|     alpha=dlog10(X/Xb)/dlog10(r)     R^2")
+    print("-------------------------------------------------------------------------------")
+    for iso, A, S, alpha, alpha_err, r2, *_ in rows[:max(args.topN, 20)]:
+        print(f"{iso:>6s}  {A:>2d}        {S:8.3f}                    {alpha:8.3f} +/- {alpha_err:6.3f}"
+              f"   {r2:6.3f}")
 
     # ----------------------------
     # Plot only the top sensitive isotopes
     # ----------------------------
     plt.figure(figsize=(8,6))
 
-    for iso, A, S, alpha, f, r in rows_plot:
-        idx = np.argsort(f)
-        f = f[idx]
-        r = r[idx]
+    for iso, A, S, alpha, alpha_err, r2, f, r in rows_plot:
         plt.plot(f, r, marker="o", label=f"{iso} (S={S:.2f}, α={alpha:.2f})")
 
     plt.xscale("log")
@@ -150,7 +128,8 @@ def main():
     plt.ylabel("X(run) / X(baseline)")
     plt.title(f"Top {len(rows_plot)} sensitive isotopes (A < {args.Amax})\npattern: {args.pattern}")
     plt.grid(True, which="both", ls=":")
-    plt.tight_layout()
+    with profiling.timer("plot"):
+        plt.tight_layout()
     plt.legend(fontsize=8, ncol=2)
     plt.show()
 
@@ -163,7 +142,7 @@ def main():
     iso_labels = []
     alpha_vals = []
 
-    for iso, A, S, alpha, f, r in rows_plot:
+    for iso, A, S, alpha, *_ in rows_plot:
         if not np.isnan(alpha):
             iso_labels.append(iso)
             alpha_vals.append(alpha)
@@ -184,7 +163,8 @@ def main():
         f"pattern: {args.pattern}"
     )
     plt.grid(True, axis="x", ls=":")
-    plt.tight_layout()
+    with profiling.timer("plot"):
+        plt.tight_layout()
     plt.show()
 
 if __name__ == "__main__":
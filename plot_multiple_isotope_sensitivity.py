@@ -1,22 +1,10 @@
 
 import argparse
-import re
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
-
-def extract_factor(run_name):
-    match = re.search(r"fact_([0-9eE\.\-]+)", run_name)
-    if match:
-        return float(match.group(1))
-    return None
-
-def get_final_abundances(run_dir):
-    csv = run_dir / "final_abundances.csv"
-    if not csv.exists():
-        return None
-    return pd.read_csv(csv)
+from run_catalog import load_catalog
+import profiling
 
 def get_A_from_isotope(isotope):
     # assumes format like F-19
@@ -29,47 +17,34 @@ def main():
     ap.add_argument("--baseline", default="runs/baseline")
     ap.add_argument("--runs-dir", default="runs")
     ap.add_argument("--Amax", type=int, default=40)
+    profiling.add_argument(ap)
     args = ap.parse_args()
+    profiling.start(args.profile)
 
     runs_path = Path(args.runs_dir)
     baseline_dir = Path(args.baseline)
 
+    cat = load_catalog(runs_path)
+
     # ----------------------------
     # Load baseline abundances
     # ----------------------------
-    df_base = get_final_abundances(baseline_dir)
-    if df_base is None:
+    base_all = cat.final_abundances(baseline_dir)
+    if base_all is None:
         raise RuntimeError("Baseline final_abundances.csv not found")
 
     # keep only A < Amax
-    df_base["A"] = df_base["isotope"].apply(get_A_from_isotope)
-    df_base = df_base[df_base["A"] < args.Amax]
-
-    base_dict = dict(zip(df_base["isotope"], df_base["X"]))
+    base_dict = {iso: X for iso, X in base_all.items()
+                 if get_A_from_isotope(iso) < args.Amax}
 
     # ----------------------------
     # Loop over runs
     # ----------------------------
     results = {}
 
-    for run in runs_path.iterdir():
-        if not run.is_dir():
-            continue
-        if args.pattern not in run.name:
-            continue
-
-        factor = extract_factor(run.name)
-        if factor is None:
-            continue
-
-        df = get_final_abundances(run)
-        if df is None:
-            continue
-
-        df["A"] = df["isotope"].apply(get_A_from_isotope)
-        df = df[df["A"] < args.Amax]
-
-        run_dict = dict(zip(df["isotope"], df["X"]))
+    for i in cat.select(args.pattern):
+        factor = cat.factors[i]
+        run_dict = cat.abundances(i)
 
         for iso in base_dict:
             if iso not in run_dict:
@@ -105,7 +80,8 @@ def main():
     plt.ylabel("X(run) / X(baseline)")
     plt.title(f"Sensitivity (A < {args.Amax}) to {args.pattern}")
     plt.grid(True, which="both", ls=":")
-    plt.tight_layout()
+    with profiling.timer("plot"):
+        plt.tight_layout()
 
     plt.legend(fontsize=8, ncol=2)
     plt.show()
@@ -2,31 +2,26 @@ import matplotlib.pyplot as plt
 from abundance_io import *
 import argparse
 import numpy as np
+import profiling
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--run", required=True, help="e.g. runs/baseline")
-    ap.add_argument("--top", type=int, default=15)
-    ap.add_argument("--min-init", type=float, default=1e-10, 
-                    help="Ignore isotopes with tiny initial X")
-    ap.add_argument("--logtol", type=float, default=0.1, 
-                    help="Ignore istopes with |log10(Xf/Xi)| < logtol")
-    args = ap.parse_args()
+def synthesis_changes(run, top=15, min_init=1e-10, logtol=0.1):
+    # -> (created, destroyed, enhanced, depleted, ratio_df, run_dir)
 
     # reading abundances into df
     df_i = read_initial_abundances()
-    df_f, run_dir = read_final_abundances(args.run)
-    df = df_i.merge(df_f, on="isotope", how="outer", suffixes=("_i", "_f"))
+    df_f, run_dir = read_final_abundances(run)
+    with profiling.timer("merge"):
+        df = df_i.merge(df_f, on="isotope", how="outer", suffixes=("_i", "_f"))
     if df.empty:
         raise RuntimeError(
             "No isotopes left after removing unchanged ones "
-            f"(logtol={args.logtol})"
+            f"(logtol={logtol})"
         )
 
     #print(df)
     df["X_i"] = df["X_i"].fillna(0.0)
     df["X_f"] = df["X_f"].fillna(0.0)
-    #df = df[df["X_i"] > args.min_init]
+    #df = df[df["X_i"] > min_init]
     #print(df)
     # take the ratio then sort_values
     
@@ -35,12 +30,12 @@ def main():
     destroyed = df[(df["X_i"] > 0) & (df["X_f"] == 0)].copy()
 
     # computing ratio while ignore ratios being 0 or inf (using min_init)
-    ratio_df = df[(df["X_i"] > args.min_init) & df["X_f"] > args.min_init].copy()
+    ratio_df = df[(df["X_i"] > min_init) & df["X_f"] > min_init].copy()
     ratio_df["ratio"] = ratio_df["X_f"] / ratio_df["X_i"]
     ratio_df["log_ratio"] = np.log10(ratio_df["ratio"])
     
     # ignore unchanged isotopes only
-    ratio_df = ratio_df[np.abs(ratio_df["log_ratio"]) > args.logtol].head(args.top)
+    ratio_df = ratio_df[np.abs(ratio_df["log_ratio"]) > logtol].head(top)
 
     # gathering isotopes that were enhanced and depleted during nova (these are used in the ratio plot
     #not the ones created or destroyed i.e. no X_i or X_f)
@@ -50,7 +45,53 @@ def main():
     # rank by magnitude of change and keep the top based on --top argument
     ratio_df = ratio_df.reindex(
         ratio_df["log_ratio"].abs().sort_values(ascending=False).index
-    ).head(args.top)
+    ).head(top)
+
+    return created, destroyed, enhanced, depleted, ratio_df, run_dir
+
+def render(run, top=15, min_init=1e-10, logtol=0.1, show=False, changes=None):
+    if changes is None:
+        changes = synthesis_changes(run, top, min_init, logtol)
+    *_, ratio_df, run_dir = changes
+
+    # create output directory for plots or basically add the plot to the created folder
+    outdir = run_dir / "plots"
+    outdir.mkdir(exist_ok=True)
+
+    #ratio_df = ratio_df["log_ratio"] > top
+
+    # plotting
+    fig = plt.figure()
+    plt.barh(ratio_df["isotope"], ratio_df["log_ratio"])
+    plt.axvline(0.0, color='k', linestyle="--")
+    plt.xlabel(r"$\log_{10}(X_f / X_i)$")
+    #plt.xscale("log")
+    plt.title(f"Top {top} abundance changes during nova \n({run_dir.name})")
+    plt.grid(True, which="both", ls=":")
+    with profiling.timer("plot"):
+        plt.tight_layout()
+
+        outfile = outdir / f"top{top}_synthesis_ratios.png"
+        plt.savefig(outfile, dpi=200)
+    if show:
+        plt.show()
+    plt.close(fig)
+    return outfile
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--run", required=True, help="e.g. runs/baseline")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--min-init", type=float, default=1e-10, 
+                    help="Ignore isotopes with tiny initial X")
+    ap.add_argument("--logtol", type=float, default=0.1, 
+                    help="Ignore istopes with |log10(Xf/Xi)| < logtol")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    changes = synthesis_changes(args.run, args.top, args.min_init, args.logtol)
+    created, destroyed, enhanced, depleted, _, _ = changes
 
     # ---------------------------------------------------------------------
     # PRINTING SUMMMARIES
@@ -77,26 +118,7 @@ def main():
     # ---------------------------------------------------------------------
     # PLOTTING
     # ---------------------------------------------------------------------
-    
-    # create output directory for plots or basically add the plot to the created folder
-    outdir = run_dir / "plots"
-    outdir.mkdir(exist_ok=True)
-
-    #ratio_df = ratio_df["log_ratio"] > args.top
-
-    # plotting
-    plt.figure()
-    plt.barh(ratio_df["isotope"], ratio_df["log_ratio"])
-    plt.axvline(0.0, color='k', linestyle="--")
-    plt.xlabel(r"$\log_{10}(X_f / X_i)$")
-    #plt.xscale("log")
-    plt.title(f"Top {args.top} abundance changes during nova \n({run_dir.name})")
-    plt.grid(True, which="both", ls=":")
-    plt.tight_layout()
-
-    outfile = outdir / f"top{args.top}_synthesis_ratios.png"
-    plt.savefig(outfile, dpi=200)
-    plt.show()
+    outfile = render(args.run, args.top, show=True, changes=changes)
 
     print(f"[OK] Saved {outfile}")
     
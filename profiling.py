@@ -0,0 +1,183 @@
+import atexit
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+# Named timers and counters shared by the analysis scripts. Nothing is
+# recorded unless start() was called (the scripts' --profile flag): timer()
+# then hands back one shared no-op context and count() returns at once, so
+# leaving the calls in costs a global lookup and a branch.
+#
+#   with timer("read_flux_file"):
+#       ...
+#   count("rows_kept", n)
+#
+# Timers nest; totals are kept per stack path ("main;load_flux_cube;...")
+# and printed as an indented tree at exit. With a path, --profile also
+# writes a JSON trace (Chrome trace-event format, opens in Perfetto or
+# chrome://tracing) with the same totals, the counters and peak RSS.
+
+enabled = False
+
+MAX_EVENTS = 100_000
+
+_NULL = nullcontext()
+_stack = []
+_totals = {}        # "a;b;c" -> [seconds, calls]
+_counters = {}
+_events = []        # (name, start, duration, depth)
+_dropped = 0
+_root = None
+_t0 = 0.0
+_trace = None
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _dropped
+        seconds = time.perf_counter() - self.start
+        path = ";".join(_stack)
+        _stack.pop()
+        total = _totals.setdefault(path, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+        if len(_events) < MAX_EVENTS:
+            _events.append((self.name, self.start, seconds, len(_stack)))
+        else:
+            _dropped += 1
+        return False
+
+def timer(name):
+    return _Timer(name) if enabled else _NULL
+
+def count(name, n=1):
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+def count_file(path):
+    # files_read / bytes_parsed; the stat only happens when profiling
+    if enabled:
+        count("files_read")
+        count("bytes_parsed", os.path.getsize(path))
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss / 1024.0    # KiB on Linux
+
+def add_argument(ap):
+    ap.add_argument("--profile", nargs="?", const="", default=None, metavar="TRACE_JSON",
+                    help="print timers, counters and peak RSS at exit; "
+                         "with a path also write a JSON trace there")
+
+def start(trace=None, name=None):
+    # trace: None = stay off (flag not given), "" = summary only, or a path
+    global enabled, _root, _t0, _trace
+    if trace is None or enabled:
+        return
+    enabled = True
+    _trace = trace or None
+    _t0 = time.perf_counter()
+    _root = _Timer(name or Path(sys.argv[0]).stem or "main")
+    _root.__enter__()
+    atexit.register(report)
+
+def _reset():
+    global _dropped
+    _dropped = 0
+    _stack.clear()
+    _totals.clear()
+    _counters.clear()
+    _events.clear()
+
+def collect(func, items):
+    # worker-process side of run_io.map_chunks: run func with fresh
+    # profiling state and send the totals back with the result
+    global enabled
+    enabled = True
+    _reset()
+    with _Timer(f"{getattr(func, '__name__', 'worker')} [workers]"):
+        result = func(items)
+    return result, dict(_totals), dict(_counters)
+
+def merge(totals, counters):
+    # fold a worker's totals in under the current stack; worker seconds are
+    # summed over processes, so they can exceed wall time
+    prefix = ";".join(_stack)
+    for path, (seconds, calls) in totals.items():
+        total = _totals.setdefault(f"{prefix};{path}", [0.0, 0])
+        total[0] += seconds
+        total[1] += calls
+    for name, n in counters.items():
+        count(name, n)
+
+def _tree_lines(wall):
+    # depth-first over the stack paths, heaviest child first
+    children = {}
+    for path in _totals:
+        parent, _, _ = path.rpartition(";")
+        children.setdefault(parent, []).append(path)
+
+    lines = []
+    def walk(parent, depth):
+        for path in sorted(children.get(parent, []), key=lambda p: -_totals[p][0]):
+            seconds, calls = _totals[path]
+            name = path.rpartition(";")[2]
+            lines.append(f"{seconds:10.3f} {calls:8d} {100 * seconds / wall:6.1f}  "
+                         f"{'  ' * depth}{name}")
+            walk(path, depth + 1)
+    walk("", 0)
+    return lines
+
+def report():
+    global enabled
+    if not enabled:
+        return
+    if _root is not None and _stack and _stack[0] == _root.name:
+        while len(_stack) > 1:
+            _stack.pop()
+        _root.__exit__(None, None, None)
+    enabled = False
+
+    wall = time.perf_counter() - _t0
+    rss, rss_children = peak_rss_mb(), peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+    out = sys.stderr
+    print(f"\n=== Profile: {wall:.3f} s wall, peak RSS {rss:.1f} MB"
+          f" (workers {rss_children:.1f} MB) ===", file=out)
+    print(f"{'seconds':>10s} {'calls':>8s} {'%':>6s}  timer", file=out)
+    for line in _tree_lines(max(wall, 1e-12)):
+        print(line, file=out)
+    if _counters:
+        print("counters: " + ", ".join(f"{k}={v}" for k, v in sorted(_counters.items())),
+              file=out)
+
+    if _trace:
+        pid = os.getpid()
+        trace = {
+            "traceEvents": [
+                {"name": name, "ph": "X", "pid": pid, "tid": 0,
+                 "ts": (start - _t0) * 1e6, "dur": seconds * 1e6, "args": {"depth": depth}}
+                for name, start, seconds, depth in _events
+            ],
+            "argv": sys.argv,
+            "wall_seconds": wall,
+            "peak_rss_mb": rss,
+            "peak_rss_workers_mb": rss_children,
+            "timers": {path: {"seconds": s, "calls": c} for path, (s, c) in _totals.items()},
+            "counters": _counters,
+            "events_dropped": _dropped,
+        }
+        Path(_trace).write_text(json.dumps(trace, indent=1))
+        print(f"[OK] Wrote profile trace {_trace}", file=out)
@@ -0,0 +1,186 @@
+import argparse
+import numpy as np
+from pathlib import Path
+from flux_io import read_flux_file, sum_by_key, unpack_keys, text_table, REACTANT_SLOTS, PRODUCT_SLOTS
+from flux_network import CSRMatrix
+import profiling
+
+# Reaction families and regions from the packed keys alone. In each channel
+# the lighter slot is the light particle (an empty slot is a photon) and the
+# heavier one the nucleus, so a family is (entrance particle, exit particle):
+# C-12 + H-1 -> N-13 is (p,g), N-15 + H-1 -> C-12 + He-4 is (p,a). With no
+# particle on either side the reaction is a decay, named from the change in
+# Z of the nucleus (b+ for O-15 -> N-15). The region is that of the target
+# nucleus. Fluxes are grouped with one sparse [groups x reactions] product,
+# for a single snapshot or the whole [n_times x n_reactions] cube.
+
+PARTICLES = {(0, 0): "g", (0, 1): "n", (1, 1): "p", (1, 2): "d", (1, 3): "t",
+             (2, 3): "h", (2, 4): "a"}
+
+# (name, lowest Z, highest Z) of the target nucleus
+REGIONS = [
+    ("H-B", 0, 5),
+    ("CNO", 6, 9),
+    ("NeNa", 10, 11),
+    ("MgAl", 12, 13),
+    ("Si-Ar", 14, 18),
+    ("K+", 19, 127),
+]
+
+_P = list(PARTICLES)
+_N = len(_P) + 1        # particle codes 0..len-1, len = anything else
+_GAMMA = _P.index((0, 0))
+
+def _split(Z, A):
+    # [n, 2] slots of one channel -> (particle code, nucleus Z) with the
+    # lighter slot as the particle and the heavier as the nucleus
+    heavy = (A[:, 1] > A[:, 0]) | ((A[:, 1] == A[:, 0]) & (Z[:, 1] > Z[:, 0]))
+    rows, h = np.arange(len(Z)), heavy.astype(np.int64)
+    zl, al = Z[rows, 1 - h], A[rows, 1 - h]
+    code = np.full(len(Z), _N - 1)
+    for k, (z, a) in enumerate(_P):
+        code[(zl == z) & (al == a)] = k
+    return code, Z[rows, h]
+
+def family_names():
+    # one name per family code: (x,y) for every particle pair, then decays
+    names = []
+    for i in range(_N):
+        for j in range(_N):
+            a = PARTICLES[_P[i]] if i < _N - 1 else "x"
+            b = PARTICLES[_P[j]] if j < _N - 1 else "x"
+            names.append(f"({a},{b})")
+    return names + ["b+", "b-", "decay"]
+
+FAMILIES = family_names()
+_DECAY = _N * _N
+
+def classify(keys):
+    # -> (family code, region code) of every packed reaction key
+    Z, A = unpack_keys(np.asarray(keys, dtype=np.int64))
+    R, P = list(REACTANT_SLOTS), list(PRODUCT_SLOTS)
+    p_in, z_target = _split(Z[:, R], A[:, R])
+    p_out, z_product = _split(Z[:, P], A[:, P])
+
+    family = p_in * _N + p_out
+    decay = (p_in == _GAMMA) & (p_out == _GAMMA)
+    dz = z_product - z_target
+    family[decay] = np.where(dz[decay] < 0, _DECAY, np.where(dz[decay] > 0, _DECAY + 1, _DECAY + 2))
+
+    region = np.zeros(len(Z), dtype=np.int64)
+    for k, (_, lo, hi) in enumerate(REGIONS):
+        region[(z_target >= lo) & (z_target <= hi)] = k
+    return family, region
+
+def group_matrix(codes, n_groups):
+    # one-hot [n_groups x n_reactions] CSR matrix; G.dot(F) sums F by group
+    codes = np.asarray(codes, dtype=np.int64)
+    cols = np.arange(len(codes))
+    return CSRMatrix.from_coo(codes, cols, np.ones(len(codes)), (n_groups, len(codes)))
+
+def group_codes(keys, by):
+    # -> (group code of every reaction, group names) for by in family,
+    # region, family+region
+    family, region = classify(keys)
+    if by == "family":
+        return family, FAMILIES
+    if by == "region":
+        return region, [r[0] for r in REGIONS]
+    names = [f"{r[0]} {f}" for r in REGIONS for f in FAMILIES]
+    return region * len(FAMILIES) + family, names
+
+def window_weights(t, edges):
+    # [n_windows x n_times]: row w integrates the piecewise-linear F(t)
+    # between edges[w] and edges[w + 1]; with edges spanning t the rows add
+    # up to flux_cache.trapezoid_weights(t)
+    t = np.asarray(t, dtype=float)
+    W = np.zeros((len(edges) - 1, len(t)))
+    t0, t1 = t[:-1], t[1:]
+    dt = t1 - t0
+    for w in range(len(edges) - 1):
+        lo = np.clip(edges[w], t0, t1)
+        hi = np.clip(edges[w + 1], t0, t1)
+        ok = (hi > lo) & (dt > 0)
+        # integral over [lo, hi] of (1 - s) F_k + s F_k+1, s = (t - t_k) / dt
+        s_lo = np.where(ok, (lo - t0) / np.where(dt > 0, dt, 1), 0)
+        s_hi = np.where(ok, (hi - t0) / np.where(dt > 0, dt, 1), 0)
+        span = np.where(ok, hi - lo, 0.0)
+        mean_s = 0.5 * (s_lo + s_hi)
+        W[w, :-1] += span * (1.0 - mean_s)
+        W[w, 1:] += span * mean_s
+    return W
+
+def main():
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--file", help="one flux_XXXXX.DAT snapshot")
+    src.add_argument("--run", help="run directory: integrated flow by group and time window")
+    ap.add_argument("--by", choices=["family", "region", "family+region"], default="family")
+    ap.add_argument("--windows", type=float, nargs="+", default=None,
+                    help="time window edges (agej), e.g. 0 100 1000 1e5")
+    ap.add_argument("--n-windows", type=int, default=1,
+                    help="without --windows: this many log-spaced windows over the run")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--csv", default=None)
+    ap.add_argument("--times", default=None, help="CSV with columns cycle,time")
+    ap.add_argument("--jobs", type=int, default=1)
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    if args.file:
+        table = read_flux_file(Path(args.file))
+        keys, flux = sum_by_key(table.keys, table.flux)
+        codes, names = group_codes(keys, args.by)
+        with profiling.timer("group"):
+            totals = {"abs_flux": group_matrix(codes, len(names)).dot(np.abs(flux))}
+        what = Path(args.file).name
+    else:
+        from flux_cache import load_flux_cube, snapshot_times
+        cube = load_flux_cube(Path(args.run), jobs=args.jobs)
+        t = snapshot_times(cube, args.times, jobs=args.jobs)
+        if np.isnan(t).any():
+            raise RuntimeError("Missing agej times for some flux files; pass --times cycle,time CSV")
+        order = np.argsort(t, kind="stable")
+        t = t[order]
+        codes, names = group_codes(cube.keys, args.by)
+        with profiling.timer("group"):
+            # [n_times x n_groups], every snapshot in one product
+            grouped = group_matrix(codes, len(names)).dot(np.abs(np.asarray(cube.flux)[order]))
+        if args.windows:
+            edges = np.array(sorted(args.windows), dtype=float)
+        elif args.n_windows > 1 and t[0] > 0:
+            edges = np.geomspace(t[0], t[-1], args.n_windows + 1)
+        else:
+            edges = np.linspace(t[0], t[-1], args.n_windows + 1)
+        phi = window_weights(t, edges) @ grouped
+        totals = {f"phi[{a:.3g},{b:.3g}]": row for a, b, row in zip(edges[:-1], edges[1:], phi)}
+        if len(phi) > 1:
+            totals["phi_total"] = phi.sum(axis=0)
+        what = f"{Path(args.run).name}, {len(t)} snapshots"
+
+    last = list(totals.values())[-1]
+    n_reactions = np.bincount(codes, minlength=len(names))
+    order = np.argsort(-last, kind="stable")
+    order = order[n_reactions[order] > 0]
+    grand = last.sum()
+
+    print(f"\n=== Flux by {args.by} ({what}) ===\n")
+    shown = order[:args.top]
+    print(text_table({
+        "group": [names[g] for g in shown],
+        "reactions": [str(n_reactions[g]) for g in shown],
+        **{k: [f"{v[g]:.4e}" for g in shown] for k, v in totals.items()},
+        "share": [f"{last[g] / grand:.4f}" if grand > 0 else "-" for g in shown],
+    }))
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write("group,reactions," + ",".join(totals) + "\n")
+            for g in order:
+                f.write(f"{names[g]},{n_reactions[g]},"
+                        + ",".join(f"{v[g]:.8e}" for v in totals.values()) + "\n")
+        print(f"\n[OK] Wrote {args.csv}")
+
+if __name__ == "__main__":
+    main()
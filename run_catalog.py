@@ -0,0 +1,192 @@
+import argparse
+import os
+import re
+import sqlite3
+import numpy as np
+from pathlib import Path
+from profiling import timer, count
+import profiling
+
+CATALOG_NAME = "catalog.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS isotopes (
+    col INTEGER PRIMARY KEY,
+    isotope TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    name TEXT PRIMARY KEY,
+    pattern TEXT,
+    factor REAL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    cols BLOB NOT NULL,
+    X BLOB NOT NULL
+);
+"""
+
+def extract_factor(run_name):
+    if run_name == "baseline":
+        return 1.0
+    # "15O_ag_fact_0.01", "15O_ag_fact_1e6", "15O_ag_fact_1e+06" -> float;
+    # None for a name without a readable factor
+    m = re.search(r"fact_(\d*\.?\d+(?:[eE][+-]?\d+)?)", run_name)
+    return float(m.group(1)) if m else None
+
+def extract_pattern(run_name):
+    # "15O_ag_fact_10" -> "15O_ag"
+    m = re.match(r"(.*?)_?fact_", run_name)
+    return m.group(1) if m else None
+
+class RunCatalog:
+    # One row per run under runs/: name, reaction pattern, rate factor, and a
+    # dense [n_runs x n_isotopes] final-abundance matrix (NaN = isotope not
+    # in that run's final_abundances.csv).
+
+    def __init__(self, runs_dir, names, patterns, factors, isotopes, X):
+        self.runs_dir = Path(runs_dir)
+        self.names = names
+        self.patterns = patterns
+        self.factors = factors
+        self.isotopes = isotopes
+        self.X = X
+        self._row = {n: i for i, n in enumerate(names)}
+        self._col = {iso: j for j, iso in enumerate(isotopes)}
+
+    def row(self, run_dir):
+        # index of a run directory, or None if it is not under runs_dir
+        run_dir = Path(run_dir)
+        if run_dir.resolve().parent != self.runs_dir.resolve():
+            return None
+        return self._row.get(run_dir.name)
+
+    def col(self, iso):
+        return self._col[iso]
+
+    def select(self, pattern):
+        # runs whose name contains pattern and carries a rate factor
+        return np.array([i for i, n in enumerate(self.names)
+                         if pattern in n and not np.isnan(self.factors[i])],
+                        dtype=np.int64)
+
+    def final_abundances(self, run_dir):
+        # {isotope: X} for any run directory: from the catalog when the run is
+        # catalogued, otherwise read from its final_abundances.csv
+        i = self.row(run_dir)
+        if i is not None:
+            return self.abundances(i)
+        csv = Path(run_dir) / "final_abundances.csv"
+        if not csv.exists():
+            return None
+        return dict(zip(*read_final_csv(csv)))
+
+    def abundances(self, i):
+        # one run as {isotope: X}, like reading its final_abundances.csv
+        x = self.X[i]
+        ok = ~np.isnan(x)
+        return dict(zip(np.asarray(self.isotopes, dtype=object)[ok], x[ok]))
+
+def read_final_csv(csv):
+    # final_abundances.csv -> ([isotope], X); plain text parsing, no pandas,
+    # since this runs once per catalogued run
+    isotopes, X = [], []
+    with open(csv, "r") as f:
+        next(f, None)                       # isotope,X header
+        for line in f:
+            iso, _, x = line.strip().partition(",")
+            if not x:
+                continue
+            isotopes.append(iso.strip())
+            X.append(float(x))
+    return isotopes, np.array(X)
+
+def refresh_catalog(runs_dir, verbose=False):
+    # re-read only the runs whose final_abundances.csv changed (mtime or
+    # size), drop runs that disappeared
+    runs_dir = Path(runs_dir)
+    con = sqlite3.connect(runs_dir / CATALOG_NAME)
+    with con:
+        con.executescript(SCHEMA)
+        known = {name: (mtime, size) for name, mtime, size
+                 in con.execute("SELECT name, mtime_ns, size FROM runs")}
+        col = {iso: c for c, iso in con.execute("SELECT col, isotope FROM isotopes")}
+
+        seen, updated = set(), 0
+        with os.scandir(runs_dir) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                csv = Path(entry.path) / "final_abundances.csv"
+                try:
+                    st = csv.stat()
+                except FileNotFoundError:
+                    continue
+                seen.add(entry.name)
+                if known.get(entry.name) == (st.st_mtime_ns, st.st_size):
+                    continue
+
+                isotopes, X = read_final_csv(csv)
+                count("catalog_runs_read")
+                for iso in isotopes:
+                    if iso not in col:
+                        col[iso] = len(col)
+                        con.execute("INSERT INTO isotopes VALUES (?, ?)", (col[iso], iso))
+                cols = np.array([col[iso] for iso in isotopes], dtype=np.int32)
+                factor = extract_factor(entry.name)
+                con.execute(
+                    "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entry.name, extract_pattern(entry.name), factor,
+                     st.st_mtime_ns, st.st_size, cols.tobytes(), X.tobytes()))
+                updated += 1
+
+        gone = set(known) - seen
+        con.executemany("DELETE FROM runs WHERE name = ?", [(n,) for n in gone])
+    con.close()
+
+    if verbose:
+        print(f"[OK] Catalog {runs_dir / CATALOG_NAME}: {len(seen)} runs, "
+              f"{updated} re-read, {len(gone)} removed")
+
+def load_catalog(runs_dir="runs", refresh=True, verbose=False) -> RunCatalog:
+    runs_dir = Path(runs_dir)
+    if refresh:
+        with timer("refresh_catalog"):
+            refresh_catalog(runs_dir, verbose=verbose)
+
+    con = sqlite3.connect(runs_dir / CATALOG_NAME)
+    try:
+        isotopes = [iso for _, iso in
+                    con.execute("SELECT col, isotope FROM isotopes ORDER BY col")]
+        rows = con.execute(
+            "SELECT name, pattern, factor, cols, X FROM runs ORDER BY name").fetchall()
+    finally:
+        con.close()
+
+    X = np.full((len(rows), len(isotopes)), np.nan)
+    for i, (_, _, _, cols, x) in enumerate(rows):
+        X[i, np.frombuffer(cols, dtype=np.int32)] = np.frombuffer(x, dtype=np.float64)
+
+    return RunCatalog(
+        runs_dir,
+        names=[r[0] for r in rows],
+        patterns=[r[1] for r in rows],
+        factors=np.array([np.nan if r[2] is None else r[2] for r in rows]),
+        isotopes=isotopes,
+        X=X,
+    )
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs-dir", default="runs")
+    ap.add_argument("--list", action="store_true", help="print the catalogued runs")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    cat = load_catalog(args.runs_dir, verbose=True)
+    if args.list:
+        for name, pattern, factor in zip(cat.names, cat.patterns, cat.factors):
+            print(f"{name:>30s}  {pattern or '-':>15s}  {factor:>10g}")
+
+if __name__ == "__main__":
+    main()
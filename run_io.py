@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import time
+import numpy as np
+import profiling
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+
+SNAPSHOT_PATTERNS = {
+    "flux": re.compile(r"flux_(\d+)\.DAT$"),
+    "iso_massf": re.compile(r"iso_massf(\d+)\.DAT$"),
+}
+
+AGEJ_RE = re.compile(r"\bagej\b\s*([0-9.+-Ee]+)")
+
+def agej_from_iso_file(path: Path) -> float:
+    with Path(path).open("r") as f:
+        for _ in range(120):
+            line = f.readline()
+            if not line:
+                break
+            m = AGEJ_RE.search(line)
+            if m:
+                return float(m.group(1))
+    return float("nan")
+
+def agej_from_iso_files(paths):
+    return [agej_from_iso_file(p) for p in paths]
+
+def list_snapshots(run_dir, kind="flux"):
+    # one directory listing instead of probing every possible file name;
+    # returns [(cycle, path, stat)] sorted by cycle
+    pat = SNAPSHOT_PATTERNS[kind]
+    found = []
+    with os.scandir(run_dir) as it:
+        for entry in it:
+            m = pat.match(entry.name)
+            if m and entry.is_file():
+                found.append((int(m.group(1)), Path(entry.path), entry.stat()))
+    found.sort(key=lambda t: t[0])
+    return found
+
+def complete_snapshots(snapshots, settle, now=None):
+    # the files of a possibly running job that are safe to read: every one
+    # with a later cycle after it, and the newest once it has gone settle
+    # seconds without a write
+    now = time.time() if now is None else now
+    if snapshots and now - snapshots[-1][2].st_mtime < settle:
+        return snapshots[:-1]
+    return snapshots
+
+def source_manifest(snapshots):
+    # what a cache built from these files depends on
+    return [[p.name, st.st_size, st.st_mtime_ns] for _, p, st in snapshots]
+
+def manifest_matches(store_dir, manifest):
+    manifest_file = Path(store_dir) / "manifest.json"
+    if not manifest_file.exists():
+        return False
+    return json.loads(manifest_file.read_text()) == manifest
+
+@contextmanager
+def atomic_write(path):
+    # text file written as <path>.tmp and renamed over path when complete, so
+    # a reader (e.g. ensemble_stats during a sweep) never sees half of it
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, "w") as f:
+            yield f
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, path)
+
+def save_arrays(store_dir, arrays, manifest):
+    # write each array as <name>.npy, then the manifest last so that a
+    # half-written store never looks valid
+    store_dir = Path(store_dir)
+    store_dir.mkdir(exist_ok=True)
+    for name, arr in arrays.items():
+        tmp = store_dir / f"{name}.tmp.npy"
+        np.save(tmp, arr)
+        os.replace(tmp, store_dir / f"{name}.npy")
+    tmp = store_dir / "manifest.tmp.json"
+    tmp.write_text(json.dumps(manifest))
+    os.replace(tmp, store_dir / "manifest.json")
+
+def iter_chunks(func, items, jobs=1, chunks_per_job=4):
+    # func takes a list of items and returns one partial result; results are
+    # yielded in input order as they come back, so reducing them on the fly
+    # gives the same answer as jobs=1 without holding every partial at once
+    items = list(items)
+    if not items:
+        return
+    if jobs <= 1:
+        yield func(items)
+        return
+
+    n_chunks = min(len(items), jobs * chunks_per_job)
+    size = -(-len(items) // n_chunks)
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        if not profiling.enabled:
+            yield from ex.map(func, chunks)
+            return
+        # workers profile themselves and hand their totals back
+        for result, totals, counters in ex.map(partial(profiling.collect, func), chunks):
+            profiling.merge(totals, counters)
+            yield result
+
+def map_chunks(func, items, jobs=1, chunks_per_job=4):
+    # iter_chunks collected into a list
+    return list(iter_chunks(func, items, jobs, chunks_per_job))
@@ -0,0 +1,50 @@
+import numpy as np
+from profiling import timer
+
+def safe_log10(x):
+    # avoid log10(0)
+    return np.log10(np.maximum(x, 1e-300))
+
+def fit_slopes(x, Y):
+    # Least-squares line Y[i] = intercept[i] + slope[i] * x for every row of
+    # Y at once, in closed form. x is [n_points] (shared) or the shape of Y;
+    # NaN in Y (or x) marks a missing point and is left out of that row's fit.
+    #
+    # Returns a dict of [n_rows] arrays: slope, intercept, slope_err (standard
+    # error of the slope), r2, n (points used). Rows with fewer than two
+    # points, or no spread in x, get NaN; slope_err needs three points. r2 is
+    # NaN for a constant row too (nothing to explain).
+    with timer("fit_slopes"):
+        return _fit_slopes(x, Y)
+
+def _fit_slopes(x, Y):
+    Y = np.asarray(Y, dtype=float)
+    x = np.broadcast_to(np.asarray(x, dtype=float), Y.shape)
+    m = ~(np.isnan(Y) | np.isnan(x))
+
+    n = m.sum(axis=1)
+    xz = np.where(m, x, 0.0)
+    yz = np.where(m, Y, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xm = xz.sum(axis=1) / n
+        ym = yz.sum(axis=1) / n
+        dx = np.where(m, x - xm[:, None], 0.0)
+        dy = np.where(m, Y - ym[:, None], 0.0)
+
+        sxx = (dx * dx).sum(axis=1)
+        sxy = (dx * dy).sum(axis=1)
+        syy = (dy * dy).sum(axis=1)
+
+        slope = sxy / sxx
+        intercept = ym - slope * xm
+        ssr = np.maximum(syy - slope * sxy, 0.0)
+        slope_err = np.sqrt(ssr / (n - 2) / sxx)
+        r2 = np.where(syy > 0, 1.0 - ssr / syy, np.nan)
+
+    bad = (n < 2) | (sxx <= 0)
+    slope[bad] = intercept[bad] = r2[bad] = np.nan
+    slope_err[bad | (n < 3)] = np.nan
+
+    return {"slope": slope, "intercept": intercept, "slope_err": slope_err,
+            "r2": r2, "n": n}
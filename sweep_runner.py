@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from flux_cache import load_flux_cube
+from iso_massf_io import extract_run
+from run_io import list_snapshots
+import profiling
+
+# Runs a PPN rate-factor sweep on a bounded pool of workers, one isolated
+# scratch directory per job (replaces tools/new_run.sh).
+#
+# Sweep spec (JSON):
+#   {
+#     "executable": "ppn.exe",
+#     "template_dir": ".",
+#     "files": ["initial_abundance.dat", "trajectory.input"],  copied
+#     "links": [],                                              symlinked
+#     "templates": {"ppn_physics.input": "ppn_physics.input.tmpl"},
+#     "reactions": ["15O_ag"], "factors": [0.01, 0.1, 2, 10, 100],
+#     "samples": [{"name": "mc_0001", "params": {"f_15O_ag": 1.3}}],
+#     "runs_dir": "runs", "scratch_dir": "scratch",
+#     "timeout": 3600, "retries": 1, "jobs": 8
+#   }
+#
+# Every reaction x factor pair becomes run "<reaction>_fact_<factor>";
+# every sample becomes run "<name>". Templates are filled with
+# str.format(name=..., reaction=..., factor=..., **params).
+
+STATE_FILE = "sweep_state.json"
+
+def expand_jobs(spec):
+    jobs = []
+    for reaction in spec.get("reactions", []):
+        for factor in spec.get("factors", []):
+            # 1e+06 -> 1e6: no "+" in directory names
+            jobs.append({"name": f"{reaction}_fact_{factor:g}".replace("e+", "e"),
+                         "reaction": reaction, "factor": factor})
+    for sample in spec.get("samples", []):
+        jobs.append({"name": sample["name"], **sample.get("params", {})})
+
+    names = [j["name"] for j in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("Sweep spec produces duplicate run names")
+    return jobs
+
+def prepare_scratch(spec, job, scratch):
+    template_dir = Path(spec.get("template_dir", "."))
+    if scratch.exists():
+        shutil.rmtree(scratch)
+    scratch.mkdir(parents=True)
+
+    for name in spec.get("files", []):
+        shutil.copy2(template_dir / name, scratch / Path(name).name)
+    for name in spec.get("links", []):
+        os.symlink((template_dir / name).resolve(), scratch / Path(name).name)
+    for target, template in spec.get("templates", {}).items():
+        text = (template_dir / template).read_text()
+        (scratch / target).write_text(text.format(**job))
+
+def run_job(spec, job, executable, scratch_root, timeout, retries):
+    # worker thread: run one PPN job to completion in its scratch directory;
+    # returns (job, scratch dir, attempts, error or None)
+    scratch = scratch_root / job["name"]
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            prepare_scratch(spec, job, scratch)
+            with open(scratch / "ppn.log", "w") as log:
+                proc = subprocess.run([str(executable)], cwd=scratch, stdout=log,
+                                      stderr=subprocess.STDOUT, timeout=timeout)
+            if proc.returncode != 0:
+                error = f"exit code {proc.returncode}"
+            elif not list_snapshots(scratch, "iso_massf"):
+                error = "no iso_massf*.DAT written"
+            else:
+                return job, scratch, attempt, None
+        except subprocess.TimeoutExpired:
+            error = f"timed out after {timeout} s"
+        except (OSError, KeyError, IndexError, ValueError) as e:
+            # e.g. an executable that cannot be started, a missing template
+            # file, or a template placeholder the job does not define
+            error = f"{type(e).__name__}: {e}"
+    return job, scratch, retries + 1, error
+
+def ingest_run(run_dir, jobs=1):
+    # same outputs as iso_massf_io plus the flux cube, so the run is ready
+    # for every analysis script as soon as it lands in runs/
+    extract_run(run_dir, jobs=jobs, verbose=False)
+    if list_snapshots(run_dir, "flux"):
+        load_flux_cube(run_dir, jobs=jobs)
+
+def load_state(runs_dir):
+    state_file = runs_dir / STATE_FILE
+    if state_file.exists():
+        return json.loads(state_file.read_text())
+    return {}
+
+def save_state(runs_dir, state):
+    tmp = runs_dir / (STATE_FILE + ".tmp")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True))
+    os.replace(tmp, runs_dir / STATE_FILE)
+
+def run_sweep(spec, workers=None, timeout=None, retries=None, resume=True):
+    runs_dir = Path(spec.get("runs_dir", "runs"))
+    scratch_root = Path(spec.get("scratch_dir", "scratch"))
+    executable = Path(spec.get("executable", "ppn.exe")).resolve()
+    workers = workers or spec.get("jobs", os.cpu_count())
+    timeout = timeout or spec.get("timeout")
+    retries = spec.get("retries", 0) if retries is None else retries
+
+    if not executable.exists():
+        raise FileNotFoundError(executable)
+    runs_dir.mkdir(parents=True, exist_ok=True)
+    scratch_root.mkdir(parents=True, exist_ok=True)
+
+    state = load_state(runs_dir) if resume else {}
+    all_jobs = expand_jobs(spec)
+    todo = [j for j in all_jobs
+            if not (state.get(j["name"], {}).get("status") == "done"
+                    and (runs_dir / j["name"] / "final_abundances.csv").exists())]
+    print(f"{len(todo)} jobs to run on {workers} workers "
+          f"({len(all_jobs) - len(todo)} already done)")
+
+    t0 = time.time()
+    # threads are enough: each one just waits on its own ppn.exe process
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(run_job, spec, job, executable, scratch_root, timeout, retries): job
+                   for job in todo}
+        for fut in as_completed(futures):
+            job = futures[fut]
+            name = job["name"]
+            scratch = scratch_root / name
+            try:
+                _, scratch, attempts, error = fut.result()
+            except Exception as e:
+                # a bug in the worker must not take the rest of the sweep down
+                attempts, error = None, f"{type(e).__name__}: {e}"
+            entry = {"attempts": attempts, "params": job}
+            if error is None:
+                run_dir = runs_dir / name
+                try:
+                    if run_dir.exists():
+                        shutil.rmtree(run_dir)
+                    shutil.move(str(scratch), str(run_dir))
+                    ingest_run(run_dir)
+                except Exception as e:
+                    error = f"ingest of {run_dir} failed: {type(e).__name__}: {e}"
+            if error is None:
+                entry["status"] = "done"
+                print(f"[OK] {name} ({attempts} attempt(s))")
+            else:
+                entry["status"] = "failed"
+                entry["error"] = error
+                kept = scratch if scratch.exists() else runs_dir / name
+                print(f"[FAIL] {name}: {error} (files kept in {kept})")
+            state[name] = entry
+            save_state(runs_dir, state)
+
+    failed = sorted(j["name"] for j in all_jobs
+                    if state.get(j["name"], {}).get("status") != "done")
+    print(f"\nSweep finished in {time.time() - t0:.1f} s, {len(failed)} failed")
+    return failed
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--spec", required=True, help="sweep spec JSON")
+    ap.add_argument("--jobs", type=int, default=None, help="concurrent PPN jobs")
+    ap.add_argument("--timeout", type=float, default=None, help="seconds per attempt")
+    ap.add_argument("--retries", type=int, default=None)
+    ap.add_argument("--restart", action="store_true",
+                    help="ignore sweep_state.json and rerun every job")
+    ap.add_argument("--dry-run", action="store_true", help="only list the jobs")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    spec = json.loads(Path(args.spec).read_text())
+
+    if args.dry_run:
+        for job in expand_jobs(spec):
+            print(job["name"], job)
+        return
+
+    failed = run_sweep(spec, workers=args.jobs, timeout=args.timeout,
+                       retries=args.retries, resume=not args.restart)
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
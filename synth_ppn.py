@@ -0,0 +1,217 @@
+import argparse
+import numpy as np
+from pathlib import Path
+from flux_io import elements, ZA_to_label, Z_BITS, A_BITS
+
+# Synthetic PPN output for testing and benchmarking the analysis scripts
+# without running ppn.exe. A run directory gets
+#   flux_XXXXX.DAT       idx, Z1,A1,Z3,A3,Z5,A5,Z7,A7, flux, energy, timescale
+#   iso_massfXXXXX.DAT   "# agej <t>" header, idx, Z, A, isomer, X, element, A
+# and a sweep is a runs/ tree with baseline plus <reaction>_fact_<f> runs
+# whose fluxes and abundances respond smoothly to the rate factor.
+
+# (name, projectile, ejectile) with (Z, A); (0, 0) is an empty slot
+FAMILIES = [
+    ("pg", (1, 1), (0, 0)),
+    ("pa", (1, 1), (2, 4)),
+    ("ag", (2, 4), (0, 0)),
+    ("ap", (2, 4), (1, 1)),
+    ("ng", (0, 1), (0, 0)),
+    ("pn", (1, 1), (0, 1)),
+    ("np", (0, 1), (1, 1)),
+    ("an", (2, 4), (0, 1)),
+    ("na", (0, 1), (2, 4)),
+    ("gp", (0, 0), (1, 1)),
+    ("ga", (0, 0), (2, 4)),
+    ("gn", (0, 0), (0, 1)),
+    ("bp", (0, 0), (0, 0)),     # beta+ decay: (Z, A) -> (Z-1, A)
+]
+
+FLUX_LINE = "%6d" + " %4d %4d" * 4 + " %.6E %.3E %.3E\n"
+ISO_LINE = "%6d %6.1f %6.1f %2d %.6E %5s %4d\n"
+
+def make_nuclides(n_isotopes):
+    # nuclides in a band around the valley of stability, lightest first:
+    # max(Z + 2, 2Z - 3) <= A <= 2Z + 2 + Z // 3 stays roughly inside the
+    # drip lines (Li-5..9, C-9..16, O-13..23, Ca-37..48), so there is no
+    # Li-3 or Be-13
+    nuclides = [(0, 1), (1, 1), (1, 2), (2, 3), (2, 4)]
+    Z = 3
+    while len(nuclides) < n_isotopes and Z < 1 << Z_BITS:
+        lo, hi = max(Z + 2, 2 * Z - 3), 2 * Z + 2 + Z // 3
+        for A in range(lo, min(hi + 1, 1 << A_BITS)):
+            nuclides.append((Z, A))
+        Z += 1
+    return nuclides[:n_isotopes]
+
+def make_network(n_isotopes, n_reactions, rng):
+    # -> (nuclides, [n_reactions x 8] Z,A table, reaction names). Every
+    # reaction connects two nuclides of the network; names follow the
+    # sweep convention, e.g. 15O_ag
+    nuclides = make_nuclides(n_isotopes)
+    index = {za: i for i, za in enumerate(nuclides)}
+
+    candidates = []
+    for Z, A in nuclides:
+        if Z < 3:
+            continue
+        for name, (zp, ap), (ze, ae) in FAMILIES:
+            if name == "bp":
+                product = (Z - 1, A)
+            else:
+                product = (Z + zp - ze, A + ap - ae)
+            if product in index:
+                candidates.append(((Z, A), (zp, ap), product, (ze, ae), name))
+
+    if not candidates:
+        raise ValueError("Network too small: use more isotopes")
+    pick = rng.permutation(len(candidates))[:n_reactions]
+    pick.sort()
+
+    rows, names = [], []
+    for i in pick:
+        target, proj, product, ej, family = candidates[i]
+        rows.append(target + proj + product + ej)
+        names.append(f"{target[1]}{ZA_to_label(*target).split('-')[0]}_{family}")
+    return nuclides, np.array(rows, dtype=np.int64), names
+
+def time_grid(n_snapshots, t_start=1.0, t_end=3e5):
+    return np.geomspace(t_start, t_end, n_snapshots)
+
+def flux_history(n_reactions, t, rng):
+    # [n_snapshots x n_reactions]: each reaction peaks (log-normal in t)
+    # around the TNR peak, with amplitudes spread over many decades
+    logt = np.log10(t)
+    peak = logt[len(t) // 2] + rng.normal(0.0, 0.3, n_reactions)
+    width = rng.uniform(0.3, 1.2, n_reactions)
+    amp = 10.0 ** rng.uniform(-30.0, -2.0, n_reactions)
+    F = amp * np.exp(-0.5 * ((logt[:, None] - peak) / width) ** 2)
+    F *= 10.0 ** rng.normal(0.0, 0.05, F.shape)
+    F[F < 1e-99] = 0.0
+    return F
+
+def abundance_history(nuclides, t, rng):
+    # [n_snapshots x n_isotopes]: starts mostly H/He, relaxes to a final
+    # mix spread over ~12 decades; rows sum to 1
+    n = len(nuclides)
+    X0 = np.full(n, 1e-12)
+    Xf = 10.0 ** rng.uniform(-12.0, -2.0, n)
+    for za, x0, xf in [((1, 1), 0.70, 0.45), ((2, 4), 0.28, 0.35)]:
+        if za in nuclides:
+            j = nuclides.index(za)
+            X0[j], Xf[j] = x0, xf
+    s = 1.0 / (1.0 + np.exp(-4.0 * (np.log10(t) - np.log10(t[len(t) // 2]))))
+    logX = np.log10(X0) + (np.log10(Xf) - np.log10(X0)) * s[:, None]
+    X = 10.0 ** logX
+    return X / X.sum(axis=1, keepdims=True)
+
+def response(nuclides, rows, j, rng):
+    # d log10 X / d log10 r for a rate factor on reaction j: the target
+    # goes down, the product up, and a few other isotopes follow weakly
+    alpha = np.where(rng.random(len(nuclides)) < 0.1,
+                     rng.normal(0.0, 0.2, len(nuclides)), 0.0)
+    index = {za: i for i, za in enumerate(nuclides)}
+    alpha[index[tuple(rows[j, 0:2])]] = -rng.uniform(0.3, 1.0)
+    alpha[index[tuple(rows[j, 4:6])]] = rng.uniform(0.3, 1.0)
+    return alpha
+
+def iso_label(Z, A):
+    if Z == 0:
+        return "NEUT"
+    if (Z, A) == (1, 1):
+        return "PROT"
+    return elements.get(Z, f"Z{Z}").upper()
+
+def write_run(run_dir, nuclides, rows, t, F, X, flux=True):
+    run_dir = Path(run_dir)
+    run_dir.mkdir(parents=True, exist_ok=True)
+    n_r, n_i = len(rows), len(nuclides)
+
+    rng = np.random.default_rng(n_r)
+    energy = rng.uniform(0.1, 10.0, n_r)
+    flux_table = np.zeros((n_r, 12))
+    flux_table[:, 0] = np.arange(1, n_r + 1)
+    flux_table[:, 1:9] = rows
+    flux_table[:, 10] = energy
+
+    Z = np.array([z for z, _ in nuclides])
+    A = np.array([a for _, a in nuclides])
+    labels = [iso_label(z, a) for z, a in nuclides]
+
+    # one % per file: the line format repeated n times over a flat tuple
+    for k in range(len(t)):
+        if flux:
+            flux_table[:, 9] = F[k]
+            flux_table[:, 11] = np.where(F[k] > 0, 1.0 / np.maximum(F[k], 1e-300), 1e99)
+            with open(run_dir / f"flux_{k + 1:05d}.DAT", "w") as f:
+                f.write(f"# cycle {k + 1}\n")
+                f.write("# nr  Z1 A1 Z3 A3 Z5 A5 Z7 A7  flux  energy  timescale\n")
+                f.write((FLUX_LINE * n_r) % tuple(flux_table.ravel().tolist()))
+
+        items = []
+        for j in range(n_i):
+            items += [j + 1, Z[j], A[j], 1, X[k, j], labels[j], A[j]]
+        with open(run_dir / f"iso_massf{k + 1:05d}.DAT", "w") as f:
+            f.write(f"H NUM = {k + 1}\n")
+            f.write(f"# mod {k + 1}\n")
+            f.write(f"# agej  {t[k]:.6E}\n")
+            f.write("# t9 0.1 rho 1.0E+03\n")
+            f.write("# ABUNDANCE_MF\n")
+            f.write((ISO_LINE * n_i) % tuple(items))
+
+def make_sweep(out_dir, n_isotopes=100, n_reactions=500, n_snapshots=50,
+               n_swept=1, factors=(0.01, 0.1, 2, 10, 100), seed=0, sweep_flux=True):
+    # baseline plus every (swept reaction, factor) run under out_dir;
+    # returns the swept reaction names. sweep_flux=False leaves the flux
+    # files out of the factor runs (the sensitivity scripts only need
+    # iso_massf output), which keeps large sweeps small on disk
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    nuclides, rows, names = make_network(n_isotopes, n_reactions, rng)
+    t = time_grid(n_snapshots)
+    F = flux_history(len(rows), t, rng)
+    X = abundance_history(nuclides, t, rng)
+
+    write_run(out_dir / "baseline", nuclides, rows, t, F, X)
+
+    # the effect of a rate factor grows as burning proceeds
+    s = np.linspace(0.0, 1.0, n_snapshots)[:, None]
+    swept = []
+    for j in rng.permutation(len(rows)):
+        if len(swept) == n_swept:
+            break
+        if names[j] in swept:
+            continue
+        swept.append(names[j])
+        alpha = response(nuclides, rows, j, rng)
+        for factor in factors:
+            logr = np.log10(factor)
+            Xr = X * 10.0 ** (alpha * logr * s)
+            Xr /= Xr.sum(axis=1, keepdims=True)
+            Fr = F.copy()
+            Fr[:, j] *= factor
+            write_run(out_dir / f"{names[j]}_fact_{factor:g}", nuclides, rows, t, Fr, Xr,
+                      flux=sweep_flux)
+    return swept
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default="runs_synth", help="runs/ tree to write")
+    ap.add_argument("--isotopes", type=int, default=100)
+    ap.add_argument("--reactions", type=int, default=500)
+    ap.add_argument("--snapshots", type=int, default=50)
+    ap.add_argument("--swept", type=int, default=1, help="reactions to vary")
+    ap.add_argument("--factors", type=float, nargs="+", default=[0.01, 0.1, 2, 10, 100])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-sweep-flux", action="store_true",
+                    help="write flux files for the baseline only")
+    args = ap.parse_args()
+
+    swept = make_sweep(args.out, args.isotopes, args.reactions, args.snapshots,
+                       args.swept, args.factors, args.seed,
+                       sweep_flux=not args.no_sweep_flux)
+    n_runs = 1 + len(swept) * len(args.factors)
+    print(f"[OK] Wrote {n_runs} runs to {args.out} (swept: {', '.join(swept)})")
+
+if __name__ == "__main__":
+    main()
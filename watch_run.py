@@ -0,0 +1,190 @@
+import argparse
+import time
+import numpy as np
+from pathlib import Path
+from flux_io import read_flux_file, label_to_ZA, text_table
+from flux_network import build_stoich_matrix
+from iso_massf_io import parse_iso_massf
+from run_io import list_snapshots, complete_snapshots
+import profiling
+
+# Watches a PPN run directory while the job is running. Every --interval
+# seconds the directory is listed once; of the flux_*.DAT and iso_massf*.DAT
+# files that are complete and not shown yet, only the newest of each kind is
+# parsed, so an update costs at most two files however far the job got
+# ahead. A file counts as complete once a later cycle of the same kind
+# exists, or once it has not been modified for --settle seconds.
+
+KINDS = ("flux", "iso_massf")
+
+class RunWatcher:
+
+    def __init__(self, run_dir, settle=5.0):
+        self.run_dir = Path(run_dir)
+        self.settle = settle
+        self.shown = {kind: -1 for kind in KINDS}    # last cycle handed out
+
+    def poll(self):
+        # -> {kind: (cycle, path, n skipped)} for each kind with a new complete file
+        now = time.time()
+        ready = {}
+        for kind in KINDS:
+            snapshots = list_snapshots(self.run_dir, kind)
+            # the newest file may still be open for writing
+            new = complete_snapshots([s for s in snapshots if s[0] > self.shown[kind]],
+                                     self.settle, now)
+            if new:
+                cycle, path, _ = new[-1]
+                ready[kind] = (cycle, path, len(new) - 1)
+        return ready
+
+    def done(self, kind, cycle):
+        self.shown[kind] = cycle
+
+class FluxView:
+    # top reactions and the balance of the chosen isotopes in one flux file;
+    # the stoichiometric matrix is only rebuilt when the network changes
+
+    def __init__(self, isotopes, top, min_flux):
+        self.isotopes = isotopes
+        self.top = top
+        self.min_flux = min_flux
+        self._keys = None
+        self._net = None
+
+    def lines(self, path):
+        table = read_flux_file(path, min_flux=self.min_flux)
+        if len(table) == 0:
+            return ["  no reactions above --min-flux"]
+        out = [f"top {self.top} reactions by |flux|:", table.top(self.top).to_text()]
+        if not self.isotopes:
+            return out
+
+        keys = table.keys
+        if self._keys is None or not np.array_equal(keys, self._keys):
+            self._keys, self._net = keys, build_stoich_matrix(keys)
+        net = self._net
+        production, destruction = net.production(table.flux), net.destruction(table.flux)
+
+        rows = {"isotope": [], "production": [], "destruction": [], "net": [],
+                "top producer": [], "top destroyer": []}
+        for iso in self.isotopes:
+            try:
+                i = net.index(iso)
+            except KeyError:
+                continue
+            rows["isotope"].append(iso)
+            for name, values in (("production", production), ("destruction", destruction),
+                                 ("net", production - destruction)):
+                rows[name].append(f"{values[i]:.3e}")
+            for name, idx in (("top producer", net.producers(iso)),
+                              ("top destroyer", net.destroyers(iso))):
+                best = table.select(idx).top(1)
+                rows[name].append(best.reactions()[0] if len(best) else "-")
+        out += ["", "isotope balance (dY/dt):", text_table(rows)]
+        return out
+
+class AbundanceView:
+    # most abundant isotopes and the chosen ones in one iso_massf file, with
+    # the change in log10 X since the previous file shown. Rows are matched
+    # by their numeric Z, A and isomer columns, not by label; --iso picks
+    # the ground state (isomer 1).
+
+    def __init__(self, isotopes, top):
+        self.isotopes = isotopes
+        self.top = top
+        self._prev = {}
+
+    def lines(self, path):
+        agej, labels, X, ZAI = parse_iso_massf(path, with_ZA=True)
+        if not labels:
+            raise ValueError(f"no abundances in {path}")
+        keys = [tuple(row) for row in ZAI.tolist()]
+        now = dict(zip(keys, X))
+
+        pick = list(np.argsort(-X, kind="stable")[:self.top])
+        wanted = {label_to_ZA(iso) + (1,): iso for iso in self.isotopes}
+        pick += [j for j, key in enumerate(keys) if key in wanted and j not in pick]
+
+        def dlog(key, x):
+            old = self._prev.get(key)
+            if old is None or old <= 0 or x <= 0:
+                return "-"
+            return f"{np.log10(x / old):+.3f}"
+
+        out = [f"abundances at agej {agej:.6e}:", text_table({
+            "isotope": [labels[j] for j in pick],
+            "X": [f"{X[j]:.4e}" for j in pick],
+            "dlog10 X": [dlog(keys[j], X[j]) for j in pick],
+        })]
+        missing = [iso for key, iso in wanted.items() if key not in now]
+        if missing:
+            out.append(f"  not in this file: {', '.join(missing)}")
+        self._prev = now
+        return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--run", required=True)
+    ap.add_argument("--iso", nargs="*", default=[],
+                    help="isotopes to follow, e.g. NA-22 AL-26 F-18")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--min-flux", type=float, default=1e-30)
+    ap.add_argument("--interval", type=float, default=10.0, help="seconds between polls")
+    ap.add_argument("--settle", type=float, default=5.0,
+                    help="seconds without a write before the newest file counts as complete")
+    ap.add_argument("--stall", type=float, default=600.0,
+                    help="warn when no new file has appeared for this many seconds")
+    ap.add_argument("--once", action="store_true", help="show the current state and exit")
+    profiling.add_argument(ap)
+    args = ap.parse_args()
+    profiling.start(args.profile)
+
+    run_dir = Path(args.run)
+    if not run_dir.is_dir():
+        raise FileNotFoundError(run_dir)
+    for iso in args.iso:
+        label_to_ZA(iso)    # fail on a typo now, not at the first update
+
+    watcher = RunWatcher(run_dir, settle=0.0 if args.once else args.settle)
+    views = {"flux": FluxView(args.iso, args.top, args.min_flux),
+             "iso_massf": AbundanceView(args.iso, args.top)}
+    last_new = time.time()
+    warned = False
+
+    try:
+        while True:
+            ready = watcher.poll()
+            for kind in KINDS:
+                if kind not in ready:
+                    continue
+                cycle, path, skipped = ready[kind]
+                try:
+                    with profiling.timer(f"update_{kind}"):
+                        lines = views[kind].lines(path)
+                except (ValueError, IndexError, OSError) as e:
+                    # most likely still being written; retried at the next poll
+                    print(f"[WARN] Could not parse {path.name} yet: {e}")
+                    continue
+                watcher.done(kind, cycle)
+                last_new, warned = time.time(), False
+                note = f", {skipped} older skipped" if skipped else ""
+                print(f"\n=== {run_dir.name}: {path.name} (cycle {cycle}{note}) "
+                      f"{time.strftime('%H:%M:%S')} ===")
+                print("\n".join(lines), flush=True)
+
+            if args.once:
+                break
+            if not warned and time.time() - last_new > args.stall:
+                print(f"[WARN] No new output in {run_dir} for {args.stall:g} s", flush=True)
+                warned = True
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+    if not args.once:
+        print(f"\n[OK] Stopped watching {run_dir} at flux cycle {watcher.shown['flux']}, "
+              f"iso_massf cycle {watcher.shown['iso_massf']}")
+
+if __name__ == "__main__":
+    main()